@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import matplotlib
+# worker processes never show figures, and must not need a display
+matplotlib.use("Agg")
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import io
+import math
+import os
+import os.path
+import sys
+import time
+import traceback
+
+import analyze_vpp
+
+## Analyze and plot every run of the QUIC dataset, one run per worker process.
+## Call as: analyze_dataset.py [path/to/data/] [-j JOBS] [--force]
+##
+## Each run is analyzed (through the run cache) and plotted independently; a
+## run that fails does not stop the others, failures are summarized at the
+## end. The output of each run is collected and only shown when it fails.
+
+script_location = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_DATA_DIR = os.path.join(script_location, "..", "data")
+DEFAULT_PLOT_DIR = os.path.join(script_location, "..", "plots")
+
+RunResult = collections.namedtuple("RunResult", ("path", "status", "seconds", "output"))
+
+# values of RunResult.status
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+def find_runs(data_dir):
+	run_paths = list()
+	for name in sorted(os.listdir(data_dir)):
+		path = os.path.join(data_dir, name)
+		if os.path.isdir(path):
+			run_paths.append(path)
+	return run_paths
+
+def process_run(path, plot_root = None, use_cache = True, force = False,
+		formats = analyze_vpp.FIGURE_FORMATS, fig_pickle = True):
+	# plot_root == None: plots go to <run directory>/plots/
+	start = time.time()
+	output = io.StringIO()
+	status = DONE
+	try:
+		with contextlib.redirect_stdout(output):
+			run = analyze_vpp.analyze_run(path, use_cache)
+			if not run:
+				status = SKIPPED
+			else:
+				plot_dir = None
+				if plot_root != None:
+					plot_dir = os.path.join(plot_root, run['dir_name'])
+				analyze_vpp.make_plots(run, plot_dir, force, formats, fig_pickle)
+	except Exception:
+		output.write(traceback.format_exc())
+		status = FAILED
+	return RunResult(path, status, time.time() - start, output.getvalue())
+
+def analyze_dataset(run_paths, plot_root = None, jobs = None, use_cache = True,
+		force = False, progress = True, formats = analyze_vpp.FIGURE_FORMATS,
+		fig_pickle = True):
+	results = list()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = {executor.submit(process_run, path, plot_root, use_cache, force,
+				formats, fig_pickle): path for path in run_paths}
+		for future in concurrent.futures.as_completed(futures):
+			path = futures[future]
+			try:
+				result = future.result()
+			except Exception:
+				# the worker itself died, e.g. killed by the OOM killer
+				result = RunResult(path, FAILED, math.nan, traceback.format_exc())
+			results.append(result)
+
+			if progress:
+				print("[{}/{}] {:7} {} ({:.1f} s)".format(len(results), len(run_paths),
+						result.status, os.path.basename(os.path.normpath(path)), result.seconds))
+				sys.stdout.flush()
+
+	results.sort(key=lambda result: run_paths.index(result.path))
+	return results
+
+def print_summary(results):
+	counts = collections.Counter(result.status for result in results)
+	print("{} runs: {} done, {} skipped, {} failed".format(len(results),
+			counts[DONE], counts[SKIPPED], counts[FAILED]))
+
+	for result in results:
+		if result.status == FAILED:
+			print()
+			print("### Failed: {}".format(result.path))
+			print(result.output.rstrip())
+
+def main():
+	parser = argparse.ArgumentParser(description="Analyze and plot all runs of the QUIC dataset.")
+	parser.add_argument("data_dir", nargs='?', default=DEFAULT_DATA_DIR,
+			help="directory containing one directory per run (default: quic/data)")
+	parser.add_argument("--plot-dir", default=DEFAULT_PLOT_DIR,
+			help="plots of a run go to PLOT_DIR/<run name>/ (default: quic/plots)")
+	parser.add_argument("--plots-in-run-dir", action='store_true',
+			help="put the plots in <run directory>/plots/ instead")
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+			help="number of worker processes (default: number of CPUs)")
+	parser.add_argument("--no-cache", action='store_true',
+			help="do not use or update the analysis cache")
+	parser.add_argument("--force", action='store_true',
+			help="redraw all figures, also the ones that are up to date")
+	parser.add_argument("--formats", default=",".join(analyze_vpp.FIGURE_FORMATS),
+			help="comma separated figure formats (default: %(default)s)")
+	parser.add_argument("--no-fig-pickle", action='store_true',
+			help="do not write .fig.pickle files")
+	args = parser.parse_args()
+
+	plot_root = None if args.plots_in_run_dir else args.plot_dir
+	results = analyze_dataset(find_runs(args.data_dir), plot_root, args.jobs,
+			not args.no_cache, args.force, formats = args.formats.split(","),
+			fig_pickle = not args.no_fig_pickle)
+	print_summary(results)
+
+	if any(result.status == FAILED for result in results):
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -2,6 +2,8 @@
 #import dill
 import matplotlib.pyplot as plt
 from matplotlib.markers import *
+import argparse
+import concurrent.futures
 import sys
 import csv
 import math
@@ -9,159 +11,164 @@ import collections
 import pickle
 import copy
 import functools
+import hashlib
+import inspect
+import json
 import numpy as np
 import os
 import os.path
 import shutil
-import scapy.all
+import tempfile
+import time
+
+import interpolate
+import decimate
+import ecdf_index
+import log_parser
+import pcap_reader
+import run_cache
+import run_data
+import vpp_columns
 
 ## Script to draw plots for a single measurement run.
-## Call as: analyze_vpp.py path/to/run/directory/
+## Call as: analyze_vpp.py path/to/run/directory/ [--formats png] [--no-fig-pickle] [-j JOBS]
 ## Can also be used as a toolkit for other analysis scripts.
 ## See make_figure_3_and_4.py as an example
 
 
 INVALID_SPIN_COLOR = "#ff69b450"
-PICKLE_VALID_STRING = "pickle_valid_2"
-PLOTS_DONE_STRING = "plots_done_3"
+PLOT_MANIFEST = "plots_manifest.json"
+
+# Formats written by save_figure, and whether the figure is pickled as well
+FIGURE_FORMATS = ("pdf", "png")
 
 CUTOUT_INTERVAL = (90, 150)
 
+# How the endpoint RTT estimates are aligned to the VPP samples, see interpolate.py
+TRUTH_INTERPOLATION = "linear"
+
 ###
 ### Helper functions
 ###
 
-def save_figure(figure, filename):
+def save_figure(figure, filename, formats = FIGURE_FORMATS, fig_pickle = True):
 	print("\tGenerating figure: {} ...".format(filename), end="")
-	figure.savefig("{}.pdf".format(filename), bbox_inches='tight')
-	figure.savefig("{}.png".format(filename), bbox_inches='tight')
-	pickle.dump(figure, open("{}.fig.pickle".format(filename), 'wb'))
+	for figure_format in formats:
+		figure.savefig("{}.{}".format(filename, figure_format), bbox_inches='tight')
+	if fig_pickle:
+		with open("{}.fig.pickle".format(filename), 'wb') as pickle_file:
+			pickle.dump(figure, pickle_file)
 	print(" Done")
 
-def forward_cursor_to_time(cursor, time, time_series):
-	if time_series[0] >= time:
-		return -1
-
-	while (cursor < (len(time_series) - 1) and time_series[cursor + 1] < time):
-		cursor = cursor + 1
-
-	return cursor
-
-
 def interpollate_rtts(target_times, source_times, source_rtts):
-	target_rtts = list()
-	source_cursor = 0
-
-	target_times.sort()
-	for time in target_times:
-		assert(time != None)
-
-		# First seek to the right point in the array
-		source_cursor = forward_cursor_to_time(source_cursor, time, source_times)
-
-		# If we are at the first element in the array
-		if source_cursor == -1:
-			target_rtts.append(source_rtts[0])
-			continue
-
-		# If we are at the last element of the array
-		if source_cursor == len(source_times) - 1:
-			target_rtts.append(source_rtts[-1])
-			continue
-
-		# Otherwise, we have to do some interpollation
-		time_delta = source_times[source_cursor + 1] - source_times[source_cursor]
-		rtt_delta = source_rtts[source_cursor + 1] - source_rtts[source_cursor]
-		slope = rtt_delta / time_delta
-
-		offset = time - source_times[source_cursor]
-		interpollated_rtt = source_rtts[source_cursor] + offset * slope
-		target_rtts.append(interpollated_rtt)
-
-	return target_rtts
+	return interpolate.interpolate(target_times, source_times, source_rtts, "linear")
 
 # stupid hack function used because picke can't handle lambda functions
 def return_none():
 	return None
 
-def analyze_run(path, do_pickle=False):
+ANALYZER_NAMES = ["basic", "pn", "pn_valid", "valid", "pn_valid_edge", "valid_edge", 'status', "two_bit", "stat_heur", "rel_heur", "handshake"]
+PLOTABLE_ANALYZERS = ["basic", "pn", "pn_valid", "valid", "pn_valid_edge", "valid_edge", 'status', "two_bit", "stat_heur", "rel_heur"]
+
+def select_analyzers(run, analyzers):
+	run.select(analyzers)
+	run['analyzer_names'] = [x for x in run['analyzer_names'] if x in analyzers]
+	run['plotable_analyzers'] = [x for x in run['plotable_analyzers'] if x in analyzers]
+	return run
 
-	analyzer_names = ["basic", "pn", "pn_valid", "valid", "pn_valid_edge", "valid_edge", 'status', "two_bit", "stat_heur", "rel_heur", "handshake"]
-	plotable_analyzers = ["basic", "pn", "pn_valid", "valid", "pn_valid_edge", "valid_edge", 'status', "two_bit", "stat_heur", "rel_heur"]
+# Identifies the input data of a run and the analysis parameters. Used as the
+# run cache key, to see which plots are up to date, and by summarize_dataset.py
+def data_fingerprint(path):
+	return run_cache.cache_key(path, {'truth_interpolation': TRUTH_INTERPOLATION})
+
+# analyzers: only read the columns of these analyzers, default: all of
+# ANALYZER_NAMES. Without "handshake" and without the cache, the handshake
+# RTT is not known.
+def analyze_run(path, use_cache=False, analyzers=None):
+
+	if analyzers == None:
+		analyzers = ANALYZER_NAMES
+	unknown = [x for x in analyzers if x not in ANALYZER_NAMES]
+	if unknown:
+		raise ValueError("Unknown analyzers: {}".format(unknown))
+	requested_analyzers = analyzers
+
+	# a cached run always holds all analyzers, a subset is picked at load time
+	if use_cache:
+		analyzers = ANALYZER_NAMES
+	analyzer_names = [x for x in ANALYZER_NAMES if x in analyzers]
+	plotable_analyzers = [x for x in PLOTABLE_ANALYZERS if x in analyzers]
 	num_of_analyzers = len(analyzer_names)
 
 	###
 	### Do some bookkeeping, ensure that all is okey before we start
 	###
 
-	## point this script at a directory
-	return_dir = os.getcwd()
+	## point this script at a directory, all files are read relative to it
 	base_path = path
-	os.chdir(base_path)
+	def run_file(name):
+		return os.path.join(base_path, name)
 
 	# Check that VPP analysis has been performed
-	if not os.path.exists("vpp_done"):
+	if not os.path.exists(run_file("vpp_done")):
 		print("\tNot analyzed by VPP yet. Goodbye.")
 		return False
 
 	## read randID
 	randID = None
-	with open('randID') as randID_file:
+	with open(run_file('randID')) as randID_file:
 		randID = randID_file.read().strip()
 
 	## get directory name
-	dir_name = os.path.basename(os.getcwd())
+	dir_name = os.path.basename(os.path.abspath(base_path))
 
 	print("Analyzing {}".format(dir_name))
-	if do_pickle and os.path.exists(PICKLE_VALID_STRING) and os.path.exists("run.pickle"):
-		print("\tFound pickled data, will load this data.")
-		run = pickle.load(open("run.pickle", 'rb'))
-		os.chdir(return_dir)
-		return run
+	cache_key = data_fingerprint(base_path)
+	if use_cache:
+		run = run_cache.load(base_path, cache_key, requested_analyzers)
+		if run != None:
+			print("\tFound cached data, will load this data.")
+			run['data_fingerprint'] = cache_key
+			return select_analyzers(run, requested_analyzers)
 
 	###
 	### read out the vpp data
 	###
 
-	ignore_count = 0
-
-	vpp_data = list()
-
-	try:
-		csvfile = open("switch-2_vpp_resync.csv", newline='')
+	if os.path.exists(run_file("switch-2_vpp_resync.csv")):
+		vpp_file = run_file("switch-2_vpp_resync.csv")
 		print("\tUsing resynced vpp file")
-	except FileNotFoundError:
-		csvfile = open("switch-2_vpp.csv", newline='')
+	else:
+		vpp_file = run_file("switch-2_vpp.csv")
 		print("\tNOT using resynced vpp file")
 
-	reader = csv.DictReader(csvfile, skipinitialspace=True)
-	base_time = None
-	for row in reader:
-		if base_time == None:
-			base_time = float(row["time"])
-
-		# ignore the first two entries.
-		if ignore_count < 2:
-			ignore_count += 1
-			continue
-
-		vpp_entry = collections.defaultdict(return_none)
-		vpp_entry["time"] = float(row["time"]) - base_time
-		vpp_entry["packet_number"] = int(row["pn"])
-		vpp_entry["host"] = row["host"].strip()
-
-		for analyzer in analyzer_names:
-			if row[analyzer + "_new"] == '1':
-				vpp_entry[analyzer] = float(row[analyzer + "_data"]) * 1000
-
-		vpp_data.append(vpp_entry)
+	# only the columns of the requested analyzers are read, see vpp_columns.py
+	columns = ["time", "pn", "host"]
+	for analyzer in analyzer_names:
+		columns.extend((analyzer + "_data", analyzer + "_new"))
+	# flow: the VPP flow number, only in newer plugin output, see flow_index.py
+	vpp_columns_data = vpp_columns.load(vpp_file, columns, optional_columns=("flow",))
+
+	# times are relative to the first entry, but ignore the first two entries.
+	vpp_time_column = vpp_columns_data["time"]
+	base_time = vpp_time_column[0] if len(vpp_time_column) else 0
+	vpp_times = vpp_time_column[2:] - base_time
+	vpp_packet_numbers = vpp_columns_data["pn"][2:]
+	vpp_hosts = vpp_columns_data["host"][2:]
+	vpp_flows = vpp_columns_data["flow"][2:] if "flow" in vpp_columns_data else None
+
+	vpp_analyzers = dict()
+	for analyzer in analyzer_names:
+		is_new = vpp_columns_data[analyzer + "_new"][2:] == 1
+		vpp_analyzers[analyzer] = np.where(is_new,
+				vpp_columns_data[analyzer + "_data"][2:] * 1000, math.nan)
+	del(vpp_columns_data)
 
 	###
 	### figure out what the zero epoch time is
 	###
 
-	pcap_packets = scapy.all.rdpcap("switch-2_tcpdump.pcap", count=10)
-	zero_epoch = pcap_packets[0].time
+	zero_epoch = pcap_reader.first_timestamp(run_file("switch-2_tcpdump.pcap"))
 
 	#print("zero_epoch: {}".format(zero_epoch))
 
@@ -170,159 +177,83 @@ def analyze_run(path, do_pickle=False):
 	###
 
 	# The client
-	client_rtts = list()
-	client_times = list()
-	client_rtts_TCP = list()
-	client_times_TCP = list()
-	client_mbytes = list()
-	client_mtimes = list()
-
-	with open("client-0_minq_stderr.txt") as client_log:
-		for raw_line in client_log:
-			if raw_line.find("RTT:") != -1:
-				line = raw_line.split()
-				rtt = float(line[-1])
-				epoch = float(line[-5])
-				time = epoch - zero_epoch
-				client_rtts.append(rtt)
-				client_times.append(time)
-
-			if raw_line.find("RTT_TCP:") != -1:
-				line = raw_line.split()
-				rtt = float(line[-1])
-				epoch = float(line[-5])
-				time = epoch - zero_epoch
-				client_rtts_TCP.append(rtt)
-				client_times_TCP.append(time)
-
-			if raw_line.find("MEASUREMENT_BYTE_OUT") != -1:
-				line = raw_line.split()
-				measurement_byte = int(line[-1], 16)
-				epoch = float(line[-3])
-				time = epoch - zero_epoch
-				client_mbytes.append(measurement_byte)
-				client_mtimes.append(time)
+	client_log = log_parser.read_minq_log(run_file("client-0_minq_stderr.txt"))
+	client_rtts = client_log['rtts']
+	client_times = client_log['rtt_times'] - zero_epoch
+	client_rtts_TCP = client_log['rtts_tcp']
+	client_times_TCP = client_log['rtt_tcp_times'] - zero_epoch
+	client_mbytes = client_log['mbytes']
+	client_mtimes = client_log['mbyte_times'] - zero_epoch
 
 	# The server
-	server_rtts = list()
-	server_times = list()
-	server_rtts_TCP = list()
-	server_times_TCP = list()
-	server_mbytes = list()
-	server_mtimes = list()
-
-	with open("server-0_minq_stderr.txt") as server_log:
-		for raw_line in server_log:
-			if raw_line.find("RTT:") != -1:
-				line = raw_line.split()
-				rtt = float(line[-1])
-				epoch = float(line[-5])
-				time = epoch - zero_epoch
-				server_rtts.append(rtt)
-				server_times.append(time)
-
-			if raw_line.find("RTT_TCP:") != -1:
-				line = raw_line.split()
-				rtt = float(line[-1])
-				epoch = float(line[-5])
-				time = epoch - zero_epoch
-				server_rtts_TCP.append(rtt)
-				server_times_TCP.append(time)
-
-			if raw_line.find("MEASUREMENT_BYTE_OUT") != -1:
-				line = raw_line.split()
-				measurement_byte = int(line[-1], 16)
-				epoch = float(line[-3])
-				time = epoch - zero_epoch
-				server_mbytes.append(measurement_byte)
-				server_mtimes.append(time)
-
+	server_log = log_parser.read_minq_log(run_file("server-0_minq_stderr.txt"))
+	server_rtts = server_log['rtts']
+	server_times = server_log['rtt_times'] - zero_epoch
+	server_rtts_TCP = server_log['rtts_tcp']
+	server_times_TCP = server_log['rtt_tcp_times'] - zero_epoch
+	server_mbytes = server_log['mbytes']
+	server_mtimes = server_log['mbyte_times'] - zero_epoch
 
 	# Ping
-	ping_rtts = list()
-	ping_times = list()
-	with open("client-0_ping_stdout.txt") as ping_log:
-		for raw_line in ping_log:
-			if raw_line.startswith("["):
-				line = raw_line.split()
-				if line[-1] != 'ms':
-					continue
-				rtt = float(line[-2][5:])
-				epoch = float(line[0][1:-1]) # cut of the brackets
-				time = epoch - zero_epoch
-				ping_rtts.append(rtt)
-				ping_times.append(time)
+	ping_epochs, ping_rtts = log_parser.read_ping_log(run_file("client-0_ping_stdout.txt"))
+	ping_times = ping_epochs - zero_epoch
 
 	###
 	### Find handshake RTT
 	###
 
 	handshake_rtt = None
-	for sample in vpp_data:
-		if sample['handshake']:
-			handshake_rtt = sample['handshake']
-			break
-
-	###
-	### Interpollate the client estimates to the sample points of the analyzer
-	###
-
-	client_interpol_times = [x['time'] for x in vpp_data]
-
-	client_interpol_rtts = interpollate_rtts(client_interpol_times, client_times, client_rtts)
-
-	###
-	### Add this data to the vpp_data data structure
-	###
-
-	for i in range(len(vpp_data)):
-		vpp_data[i]['client'] = client_interpol_rtts[i]
-
-	# for myself not to use these anymore
-	del(client_interpol_rtts)
-	del(client_interpol_times)
+	if 'handshake' in vpp_analyzers:
+		handshake_samples = vpp_analyzers['handshake']
+		handshake_samples = handshake_samples[~np.isnan(handshake_samples)]
+		if len(handshake_samples):
+			handshake_rtt = float(handshake_samples[0])
 
 	###
-	### Calculate error readings
+	### Interpollate the endpoint and ping estimates to the sample points of the analyzer
 	###
 
-	for entry in vpp_data:
-		for analyzer_name in analyzer_names:
-			if entry[analyzer_name] != None:
-				entry[analyzer_name + '_error'] = entry[analyzer_name] - entry['client']
+	truth_series = collections.OrderedDict((
+		('client', (client_times, client_rtts)),
+		('server', (server_times, server_rtts)),
+		('client_TCP', (client_times_TCP, client_rtts_TCP)),
+		('server_TCP', (server_times_TCP, server_rtts_TCP)),
+		('ping', (ping_times, ping_rtts)),
+	))
+	truth = interpolate.interpolate_series(vpp_times, truth_series, TRUTH_INTERPOLATION)
 
 	###
 	### Read out measurement_bytes
 	###
 
-	observer_mbytes = list()
-
-	mbyte_file  = open("switch-2_mbytes.csv", newline='')
-	mbyte_reader = csv.DictReader(mbyte_file, skipinitialspace=True)
-	for entry in mbyte_reader:
-		conv_entry = dict()
-		conv_entry['time'] = float(entry['time'])
-		#conv_entry['pn'] = int(entry['pn'])
-		#conv_entry['host'] = entry['host']
-		conv_entry['measurement'] = int(entry['measurement'])
-		observer_mbytes.append(conv_entry)
+	# like the endpoint measurement bytes: a uint8 array and a time array.
+	# the pn and host columns are not used
+	with open(run_file("switch-2_mbytes.csv"), newline='') as mbyte_file:
+		header = [name.strip() for name in next(csv.reader(mbyte_file))]
+		observer_mtimes, observer_mbytes = np.loadtxt(mbyte_file, delimiter=',',
+				usecols=(header.index('time'), header.index('measurement')),
+				ndmin=2, unpack=True, comments=None)
+	observer_mbytes = observer_mbytes.astype(np.uint8)
 
 	###
 	### Create and return return structure
 	###
 
-	run = dict()
+	# The error columns are derived from the analyzer and client truth columns
+	run = run_data.Run(vpp_times, vpp_packet_numbers, vpp_hosts,
+			vpp_analyzers, truth, vpp_flows)
+	del(truth)
 
 	run['base_path'] = base_path
+	run['data_fingerprint'] = cache_key
 	run['randID'] = randID
 	run['dir_name'] = dir_name
-	run['vpp_data'] = vpp_data
 	run['zero_epoch'] = zero_epoch
 
 	run['client_rtts'] = client_rtts
 	run['client_times'] = client_times
-	run['client_rtts_TCP'] = client_times
-	run['client_times_TCP'] = client_times
+	run['client_rtts_TCP'] = client_rtts_TCP
+	run['client_times_TCP'] = client_times_TCP
 
 	# not needed in the VPP datastructure.
 	#run['client_interpol_times'] = client_interpol_times
@@ -346,75 +277,56 @@ def analyze_run(path, do_pickle=False):
 	run['client_mtimes'] = client_mtimes
 	run['client_mbytes'] = client_mbytes
 
+	run['observer_mtimes'] = observer_mtimes
 	run['observer_mbytes'] = observer_mbytes
 	run['zero_epoch'] = zero_epoch
 
-	if do_pickle:
-		print("\tPickling ...", end='')
-		pickle.dump(run, open("run.pickle", 'wb'))
-		open(PICKLE_VALID_STRING, 'w').close()
+	if use_cache:
+		print("\tCaching ...", end='')
+		# the ECDFs used by make_plots and the figure scripts are cached too
+		for analyzer in plotable_analyzers:
+			run.ecdf_index(analyzer).sorted_errors()
+			run.ecdf_index(analyzer).sorted_errors(CUTOUT_INTERVAL)
+		run_cache.store(base_path, cache_key, run)
 		print(" Done")
+		select_analyzers(run, requested_analyzers)
 
-	os.chdir(return_dir)
 	return run
 
-def make_ecdf_data(run, analyzer_name, time_window = None):
-
-	if time_window == None:
-		error_data = [ x[analyzer_name + '_error'] for x in run['vpp_data']
-			if x[analyzer_name + '_error'] != None]
-
-	else:
-		error_data = [ x[analyzer_name + '_error'] for x in run['vpp_data']
-			if x[analyzer_name + '_error'] != None and x['time'] >= time_window[0] and x['time'] < time_window[1]]
-
-	error_data.sort()
-	frequency = [i/len(error_data) for i in range(len(error_data))]
+# The ECDF functions use the per analyzer index of the run, which sorts the
+# errors of a time window only once, see ecdf_index.py
 
-	return (error_data, frequency)
+def make_ecdf_data(run, analyzer_name, time_window = None):
+	return run.ecdf_index(analyzer_name).ecdf(time_window)
 
 def find_ecdf_y_value(run, analyzer_name, x_val, time_window = None):
-	error_data, frequency = make_ecdf_data(run, analyzer_name, time_window)
-
-	for i in range(len(error_data)):
-		if error_data[i] >= x_val:
-			#print("between ({},{}) and ({},{})".format(error_data[i-1], frequency[i-1], error_data[i], frequency[i]))
-			if i > 1:
-				rel_delta = (x_val - error_data[i-1]) / (error_data[i] - error_data[i-1])
-				y_val = frequency[i-1] + rel_delta * (frequency[i] - frequency[i-1])
-				return y_val
-			else:
-				return 0
-	return 1
+	return float(run.ecdf_index(analyzer_name).cdf(x_val, time_window))
 
 
 def make_analyzer_data(run, analyzer_name):
-	y_values_analyzer = [ x[analyzer_name] for x in run['vpp_data'] if x[analyzer_name] != None ]
-	x_values_analyzer = [ x["time"] for x in run['vpp_data'] if x[analyzer_name] != None ]
-	rejected_x_values = [ x["time"] for x in run['vpp_data'] if x[analyzer_name] == None ]
+	x_values_analyzer, y_values_analyzer = run.samples(analyzer_name)
+	rejected_x_values = run.rejected_times(analyzer_name)
 
 	return (x_values_analyzer, y_values_analyzer, rejected_x_values)
 
-def make_plots(run):
-	return_dir = os.getcwd()
-	os.chdir(run['base_path'])
-
-	if os.path.exists(PLOTS_DONE_STRING):
-		print("Post analysys already done. Goodbye.")
-		return None
-
-	## clean up data from previous runs
-	PLOT_DIR = "plots/"
-	if os.path.exists(PLOT_DIR):
-		shutil.rmtree(PLOT_DIR)
-	os.mkdir(PLOT_DIR)
+###
+### Plotting
+###
+### Every figure of make_plots is drawn by its own function, so figures can
+### be rendered in parallel worker processes. A figure function gets the run
+### and the output path (without extension) and returns the figure.
+###
 
+def plot_all_analyzers(run, filename):
 	###
 	### Make plot of all analyzers together
 	###
 	to_plot = run['plotable_analyzers']
 	f, axarr = plt.subplots(len(to_plot))
 	f.set_size_inches(20, 13)
+	# dense series are reduced to what the figure can show, see decimate.py
+	columns = decimate.columns_for(f)
+	marker_columns = decimate.columns_for(f, decimate.MARKER_OVERSAMPLE)
 
 	axarr[0].set_title("Comparison of spin analyzers [{dir_name}]".format(**run))
 
@@ -425,19 +337,19 @@ def make_plots(run):
 		analyzer_name = run['analyzer_names'][i]
 		axes = axarr[i]
 
-		y_values_analyzer = [ x[analyzer_name] for x in run['vpp_data'] ]
-		x_values_analyzer = [ x["time"] for x in run['vpp_data'] ]
-		rejected_x_values = [ x["time"] for x in run['vpp_data'] if x[analyzer_name] == None ]
-		rejected_y_values = [ 35 for x in range(len(rejected_x_values)) ]
+		x_values_analyzer, y_values_analyzer = decimate.minmax(run.time,
+				run.analyzers[analyzer_name], columns)
+		rejected_x_values = decimate.markers(run.rejected_times(analyzer_name), marker_columns)
+		rejected_y_values = np.full(len(rejected_x_values), 35)
 
-		min_x_val = min(min_x_val, min(x_values_analyzer))
-		max_x_val = max(max_x_val, max(x_values_analyzer))
+		min_x_val = min(min_x_val, run.time.min())
+		max_x_val = max(max_x_val, run.time.max())
 
-		client_line = axes.plot(run['client_times'], run['client_rtts'],
+		client_line = axes.plot(*decimate.minmax(run['client_times'], run['client_rtts'], columns),
 				label="client_estimate", linewidth = .5)
-		server_line = axes.plot(run['server_times'], run['server_rtts'],
+		server_line = axes.plot(*decimate.minmax(run['server_times'], run['server_rtts'], columns),
 				label="server_estimate", linewidth = .5)
-		ping_line = axes.plot(run['ping_times'], run['ping_rtts'],
+		ping_line = axes.plot(*decimate.minmax(run['ping_times'], run['ping_rtts'], columns),
 				label="ping", linewidth = .5)
 
 		analyzer_line = axes.plot(x_values_analyzer, y_values_analyzer, label=analyzer_name, linewidth = .5)
@@ -453,62 +365,57 @@ def make_plots(run):
 
 	f.text(0.1, 0.9, "Handshake_rtt: {handshake_rtt}".format(**run))
 
-
-
-	save_figure(plt.gcf(), PLOT_DIR + "/all_analyzers")
-
 	print([min_x_val, max_x_val])
+	return f
 
+def plot_analyzer(run, filename, analyzer_name):
 	###
-	### Make plots of all analyzers seperatly
+	### Make plot of a single analyzer
 	###
-
-	to_plot = run['plotable_analyzers']
-	for i in range(len(to_plot)):
-		f, axes = plt.subplots(1)
-
-		analyzer_name = run['analyzer_names'][i]
-
-		axes.set_title("{analyzer_name} [{dir_name}]".format(
-					analyzer_name = analyzer_name, **run))
-
-		y_values_analyzer = [ x[analyzer_name] for x in run['vpp_data'] ]
-		x_values_analyzer = [ x["time"] for x in run['vpp_data'] ]
-		rejected_x_values = [ x["time"] for x in run['vpp_data'] if x[analyzer_name] == None ]
-		rejected_y_values = [ -5 for x in range(len(rejected_x_values)) ]
-
-		client_line = axes.plot(run['client_times'], run['client_rtts'],
-				label="client_estimate", linewidth = .5)
-		server_line = axes.plot(run['server_times'], run['server_rtts'],
-				label="server_estimate", linewidth = .5)
-		ping_line = axes.plot(run['ping_times'], run['ping_rtts'],
-				label="ping", linewidth = .5)
-
-		analyzer_line = axes.plot(x_values_analyzer, y_values_analyzer, label=analyzer_name, linewidth = .5)
-		rejected_marks = axes.plot(rejected_x_values, rejected_y_values, 'rx')
-
-		axes.set_ylim([-10, 120])
-		axes.grid()
-		axes.legend(loc = 2)
-		save_figure(plt.gcf(), PLOT_DIR + "/analyzer-" + analyzer_name)
-
+	f, axes = plt.subplots(1)
+	columns = decimate.columns_for(f)
+	marker_columns = decimate.columns_for(f, decimate.MARKER_OVERSAMPLE)
+
+	axes.set_title("{analyzer_name} [{dir_name}]".format(
+				analyzer_name = analyzer_name, **run))
+
+	x_values_analyzer, y_values_analyzer = decimate.minmax(run.time,
+			run.analyzers[analyzer_name], columns)
+	rejected_x_values = decimate.markers(run.rejected_times(analyzer_name), marker_columns)
+	rejected_y_values = np.full(len(rejected_x_values), -5)
+
+	client_line = axes.plot(*decimate.minmax(run['client_times'], run['client_rtts'], columns),
+			label="client_estimate", linewidth = .5)
+	server_line = axes.plot(*decimate.minmax(run['server_times'], run['server_rtts'], columns),
+			label="server_estimate", linewidth = .5)
+	ping_line = axes.plot(*decimate.minmax(run['ping_times'], run['ping_rtts'], columns),
+			label="ping", linewidth = .5)
+
+	analyzer_line = axes.plot(x_values_analyzer, y_values_analyzer, label=analyzer_name, linewidth = .5)
+	rejected_marks = axes.plot(rejected_x_values, rejected_y_values, 'rx')
+
+	axes.set_ylim([-10, 120])
+	axes.grid()
+	axes.legend(loc = 2)
+	return f
+
+def plot_correlation(run, filename):
 	###
 	### plot correlation
 	###
-
-	plt.figure()
-	plt.plot([ x["client"] for x in run['vpp_data'] ], [ x["pn_valid"] for x in run['vpp_data'] ],
+	f = plt.figure()
+	plt.plot(run.client, run.analyzers["pn_valid"],
 				'.', markersize=1)
 	plt.xlabel("client RTT estimates [ms]")
 	plt.ylabel("pn_valid RTT estimates [ms]")
 	plt.title(run['dir_name'])
 	plt.grid()
-	save_figure(plt.gcf(), PLOT_DIR + "/correlation_scatter")
+	return f
 
+def plot_ecdf(run, filename, time_window = None):
 	###
-	### Plot ECDFs
+	### Plot ECDFs, optionally for a specific time interval
 	###
-
 	f = plt.figure()
 	f.set_size_inches(10, 7)
 	x_limits = (-40, 40)
@@ -525,7 +432,7 @@ def make_plots(run):
 		for i in range(len(to_plot)):
 
 			analyzer_name = to_plot[i]
-			error_data , frequency = make_ecdf_data(run, analyzer_name)
+			error_data , frequency = make_ecdf_data(run, analyzer_name, time_window)
 			if markersonly:
 				linestyle = ' '
 				label = None
@@ -550,64 +457,213 @@ def make_plots(run):
 	plt.legend()
 	plt.title(run['dir_name'])
 	plt.grid()
-	save_figure(plt.gcf(), PLOT_DIR + "/ECDF")
-
-	open(PLOTS_DONE_STRING, 'w').close()
-
-	###
-	### Plot ECDFs for specific time interval
-	###
-
-	f = plt.figure()
-	f.set_size_inches(10, 7)
-	x_limits = (-40, 40)
-	marker_distance = 1
+	return f
 
+def figure_jobs(run):
+	# (file name, figure function, extra arguments) of every figure of a run
+	jobs = [("all_analyzers", plot_all_analyzers, ())]
 	to_plot = run['plotable_analyzers']
-	markers = ("o", "v", 's', 'p', 'h', '8', "x", "*", "D", "1")
-	#colors = ('xkcd:blue', 'xkcd:green', 'xkcd:red', 'xkcd:cyan', 'xkcd:magenta', 'xkcd:yellow', 'xkcd:light brown', 'xkcd:charcoal', 'xkcd:yellow orange')
-	colors = ('tab:blue', 'tab:orange', 'tab:red', 'tab:green', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan')
-
-	# first plot the lines
-
-	for markersonly in range(1): #2):
-		for i in range(len(to_plot)):
-
-			analyzer_name = to_plot[i]
-			error_data , frequency = make_ecdf_data(run, analyzer_name, (90, 150))
-			if markersonly:
-				linestyle = ' '
-				label = None
-			else:
-				linestyle = '-'
-				label = analyzer_name
+	for i in range(len(to_plot)):
+		analyzer_name = run['analyzer_names'][i]
+		jobs.append(("analyzer-" + analyzer_name, plot_analyzer, (analyzer_name,)))
+	jobs.append(("correlation_scatter", plot_correlation, ()))
+	jobs.append(("ECDF", plot_ecdf, ()))
+	jobs.append(("ECDF_cutout", plot_ecdf, (CUTOUT_INTERVAL,)))
+	return jobs
+
+# the run, set once per worker process by _init_render_worker
+_worker_run = None
+
+def _init_render_worker(run):
+	global _worker_run
+	_worker_run = run
+	plt.switch_backend("Agg")
+
+def render_figure(run, filename, function, args, formats = FIGURE_FORMATS, fig_pickle = True):
+	start = time.time()
+	figure = function(run, filename, *args)
+	save_figure(figure, filename, formats, fig_pickle)
+	plt.close(figure)
+	return time.time() - start
+
+def _render_in_worker(filename, function, args, formats, fig_pickle):
+	return render_figure(_worker_run, filename, function, args, formats, fig_pickle)
 
-			plt.plot(error_data, frequency,
-					color = colors[i],
-					linestyle = linestyle,
-					linewidth = 1,
-					marker = markers[i],
-					#markevery = (float(i), float(marker_distance * len(to_plot))),
-					markevery = (0.01*i, 0.1),
-					markeredgewidth = 1,
-					markersize = 5,
-					markeredgecolor = colors[i],
-					markerfacecolor = (0,0,0,0),
-					label = label)
+###
+### Incremental plotting
+###
+### The plot directory holds a manifest with a key for every figure. The key
+### covers the input data of the run, the analyzers, the source of the figure
+### function and of the code it draws with (PLOT_HELPERS, PLOT_VERSION), its
+### arguments and the output formats. Only figures whose key changed are drawn
+### again. The new plot directory is assembled next to the old one (up to
+### date files are hard linked) and then swapped in, readers never see a half
+### written plot directory. The swap itself is two renames, see
+### _swap_directory.
+###
 
-	plt.xlim(x_limits)
-	plt.legend()
-	plt.title(run['dir_name'])
-	plt.grid()
-	save_figure(plt.gcf(), PLOT_DIR + "/ECDF_cutout")
+# Bump PLOT_VERSION when figures change through code that is not hashed
+PLOT_VERSION = 1
+
+# the functions and modules the figure functions draw with
+PLOT_HELPERS = (save_figure, make_ecdf_data, find_ecdf_y_value, make_analyzer_data,
+		decimate, ecdf_index, run_data)
+
+@functools.lru_cache(maxsize=None)
+def plot_helpers_source():
+	return "".join(inspect.getsource(helper) for helper in PLOT_HELPERS)
+
+def figure_key(run, function, args, formats, fig_pickle):
+	description = {
+		'data': run['data_fingerprint'],
+		'analyzers': run['plotable_analyzers'],
+		'version': PLOT_VERSION,
+		'code': inspect.getsource(function) + plot_helpers_source(),
+		'args': repr(args),
+		'formats': list(formats),
+		'fig_pickle': fig_pickle,
+	}
+	encoded = json.dumps(description, sort_keys=True).encode()
+	return hashlib.sha1(encoded).hexdigest()
+
+def figure_files(name, formats, fig_pickle):
+	files = ["{}.{}".format(name, figure_format) for figure_format in formats]
+	if fig_pickle:
+		files.append("{}.fig.pickle".format(name))
+	return files
+
+def read_plot_manifest(plot_dir):
+	try:
+		with open(os.path.join(plot_dir, PLOT_MANIFEST)) as manifest_file:
+			return json.load(manifest_file)
+	except (FileNotFoundError, ValueError):
+		return dict()
 
-	open(PLOTS_DONE_STRING, 'w').close()
+def _link_or_copy(source, destination):
+	try:
+		os.link(source, destination)
+	except OSError:
+		shutil.copy2(source, destination)
+
+def _old_directory(target_dir):
+	# where _swap_directory keeps the replaced directory until it is removed
+	target_dir = os.path.abspath(target_dir)
+	return os.path.join(os.path.dirname(target_dir), ".old-" + os.path.basename(target_dir))
+
+def _recover_directory(target_dir):
+	# an interrupted swap leaves the old directory behind, with or without
+	# the new target_dir
+	old_dir = _old_directory(target_dir)
+	if not os.path.exists(old_dir):
+		return
+	if os.path.exists(target_dir):
+		shutil.rmtree(old_dir)
+	else:
+		os.rename(old_dir, target_dir)
+
+def _swap_directory(new_dir, target_dir):
+	# Not atomic: target_dir is renamed away before new_dir takes its place.
+	# If this is interrupted in between, there is no target_dir until
+	# _recover_directory puts the old one back on the next run.
+	_recover_directory(target_dir)
+	if not os.path.exists(target_dir):
+		os.rename(new_dir, target_dir)
+		return
+	old_dir = _old_directory(target_dir)
+	os.rename(target_dir, old_dir)
+	os.rename(new_dir, target_dir)
+	shutil.rmtree(old_dir)
+
+def make_plots(run, plot_dir = None, force = False, formats = FIGURE_FORMATS,
+		fig_pickle = True, jobs = 1):
+	# plots go to <run directory>/plots/ unless plot_dir is given.
+	# Only out of date figures are drawn, force draws all of them.
+	# jobs > 1 (or None: one per CPU) renders the figures in worker processes.
+	PLOT_DIR = plot_dir
+	if PLOT_DIR == None:
+		PLOT_DIR = os.path.join(run['base_path'], "plots")
+	PLOT_DIR = os.path.normpath(PLOT_DIR)
+	_recover_directory(PLOT_DIR)
+
+	old_manifest = read_plot_manifest(PLOT_DIR)
+	manifest = dict()
+	jobs_to_render = list()
+	up_to_date = list()
+	for name, function, args in figure_jobs(run):
+		key = figure_key(run, function, args, formats, fig_pickle)
+		files = figure_files(name, formats, fig_pickle)
+		manifest[name] = {'key': key, 'files': files}
+
+		old_entry = old_manifest.get(name)
+		if not force and old_entry != None and old_entry['key'] == key and \
+				all(os.path.exists(os.path.join(PLOT_DIR, x)) for x in files):
+			up_to_date.append(name)
+		else:
+			jobs_to_render.append((name, function, args))
+
+	if not jobs_to_render and set(manifest) == set(old_manifest):
+		print("\tAll plots are up to date.")
+		return None
 
+	## assemble the new plot directory next to the old one
+	parent_dir = os.path.dirname(os.path.abspath(PLOT_DIR))
+	os.makedirs(parent_dir, exist_ok=True)
+	stage_dir = tempfile.mkdtemp(prefix=".new-", dir=parent_dir)
+	try:
+		for name in up_to_date:
+			for x in manifest[name]['files']:
+				_link_or_copy(os.path.join(PLOT_DIR, x), os.path.join(stage_dir, x))
+		timings = _render_figures(run, stage_dir, jobs_to_render, formats, fig_pickle, jobs)
+		with open(os.path.join(stage_dir, PLOT_MANIFEST), 'w') as manifest_file:
+			json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+	except:
+		shutil.rmtree(stage_dir)
+		raise
+	_swap_directory(stage_dir, PLOT_DIR)
+
+	print("\tFigure timings ({} up to date):".format(len(up_to_date)))
+	for name, seconds in timings:
+		print("\t\t{:6.2f} s  {}".format(seconds, name))
+
+	# free the figures, make_plots is called for many runs in one process
+	plt.close('all')
+
+def _render_figures(run, plot_dir, jobs_to_render, formats, fig_pickle, jobs):
+	start = time.time()
+	timings = list()
+	jobs_to_render = [(os.path.join(plot_dir, name), function, args)
+			for name, function, args in jobs_to_render]
+	if jobs == 1:
+		for filename, function, args in jobs_to_render:
+			seconds = render_figure(run, filename, function, args, formats, fig_pickle)
+			timings.append((filename, seconds))
+	else:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+				initializer=_init_render_worker, initargs=(run,)) as executor:
+			futures = [executor.submit(_render_in_worker, filename, function, args,
+					formats, fig_pickle) for filename, function, args in jobs_to_render]
+			for (filename, _, _), future in zip(jobs_to_render, futures):
+				timings.append((filename, future.result()))
 
-	os.chdir(return_dir)
+	timings = [(os.path.basename(filename), seconds) for filename, seconds in timings]
+	timings.append(("total", time.time() - start))
+	return timings
 
 if __name__ == '__main__':
-	run = analyze_run(sys.argv[1], True)
+	parser = argparse.ArgumentParser(description="Draw plots for a single measurement run.")
+	parser.add_argument("path", help="path/to/run/directory/")
+	parser.add_argument("--formats", default=",".join(FIGURE_FORMATS),
+			help="comma separated figure formats (default: %(default)s)")
+	parser.add_argument("--no-fig-pickle", action='store_true',
+			help="do not write .fig.pickle files")
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+			help="number of figures rendered in parallel (default: number of CPUs)")
+	parser.add_argument("--force", action='store_true',
+			help="redraw all figures, also the ones that are up to date")
+	args = parser.parse_args()
+
+	run = analyze_run(args.path, True)
 	if not run:
 		sys.exit(1)
-	make_plots(run)
+	make_plots(run, force = args.force, formats = args.formats.split(","),
+			fig_pickle = not args.no_fig_pickle, jobs = args.jobs)
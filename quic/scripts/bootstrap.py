@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import math
+import os.path
+import warnings
+import numpy as np
+
+import analyze_dataset
+import analyze_vpp
+import metrics
+
+## Bootstrap confidence intervals for the accuracy metrics of metrics.py.
+## Call as: bootstrap.py [path/to/data/] [--metric within] [--thresholds 10]
+##          [--window 90 150] [--resamples 1000] [-j JOBS]
+##
+## Errors of consecutive samples are correlated, so samples are not drawn
+## one by one: the time window is cut into blocks of block_length seconds
+## and each resample draws as many blocks as the window has, with
+## replacement (non-overlapping block bootstrap). The errors of a block are
+## counted once per threshold; a resample is then a row of block counts
+## and all resamples of a run follow from one matrix product. Only the
+## quantile metric needs the errors, as a cumulative sum of sample weights.
+##
+## All analyzers of a run use the same resampled blocks, so differences
+## between analyzers can be compared resample by resample.
+##
+## The resampled fractions count errors (no interpolation between
+## neighbouring errors as in ecdf_index.py), quantiles are the smallest
+## error whose cumulative weight reaches the fraction. The point estimate
+## is the metric of metrics.run_metrics(). Intervals are percentile
+## intervals over the resamples.
+
+RESAMPLES = 1000
+BLOCK_LENGTH = 1.0
+CONFIDENCE = 0.95
+
+# upper limit of resamples x samples in memory for the quantile metric
+CHUNK_ELEMENTS = 4 * 1024 * 1024
+
+IntervalTable = collections.namedtuple("IntervalTable",
+		("values", "lower", "upper", "metric", "runs", "analyzers", "thresholds",
+		"windows", "confidence"))
+
+###
+### Resampling
+###
+
+def _window_blocks(run, time_window, block_length):
+	# start time and number of blocks of a time window
+	if time_window == None:
+		if len(run.time) == 0:
+			return 0.0, 1
+		start, end = float(run.time[0]), float(run.time[-1])
+	else:
+		start, end = time_window
+	return start, max(1, int(math.ceil((end - start) / block_length)))
+
+def draw_blocks(rng, num_blocks, resamples):
+	# (resamples, blocks): how often each block is drawn
+	return rng.multinomial(num_blocks, np.full(num_blocks, 1 / num_blocks), size=resamples)
+
+def _block_sums(blocks, num_blocks, values):
+	# sums of values (samples x columns) per block, blocks ascending
+	bounds = np.searchsorted(blocks, np.arange(num_blocks + 1), side='left')
+	sums = np.concatenate((np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)))
+	return sums[bounds[1:]] - sums[bounds[:-1]]
+
+def _resampled_quantiles(errors, blocks, draws, p):
+	order = np.argsort(errors, kind='stable')
+	sorted_errors = errors[order]
+	sorted_blocks = blocks[order]
+	n = len(errors)
+
+	values = np.full((len(p), len(draws)), np.nan)
+	if n == 0:
+		return values
+	chunk = max(1, CHUNK_ELEMENTS // n)
+	for first in range(0, len(draws), chunk):
+		cumulative = np.cumsum(draws[first:first + chunk][:, sorted_blocks], axis=1)
+		total = cumulative[:, -1]
+		for i, fraction in enumerate(p):
+			position = np.count_nonzero(cumulative < fraction * total[:, None], axis=1)
+			values[i, first:first + chunk] = np.where(total > 0,
+					sorted_errors[np.minimum(position, n - 1)], np.nan)
+	return values
+
+def resample_metric(times, errors, thresholds, metric, draws, start, block_length):
+	# the metric of every resample, shape (thresholds, resamples). times in
+	# ascending order, draws from draw_blocks()
+	num_blocks = draws.shape[1]
+	blocks = np.clip(((times - start) // block_length).astype(np.int64), 0, num_blocks - 1)
+	sizes = draws @ np.bincount(blocks, minlength=num_blocks)
+	if metric == "count":
+		return np.tile(sizes.astype(np.float64), (len(thresholds), 1))
+	if metric == "quantile":
+		return _resampled_quantiles(errors, blocks, draws, thresholds)
+
+	if metric == "within":
+		hits = np.abs(errors)[:, None] <= np.abs(thresholds)[None, :]
+	else:
+		hits = errors[:, None] <= thresholds[None, :]
+	counts = _block_sums(blocks, num_blocks, hits)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return (draws @ counts / sizes[:, None]).T
+
+def run_resamples(run, analyzers, thresholds, windows = (None,), metric = "within",
+		resamples = RESAMPLES, block_length = BLOCK_LENGTH, seed = 0):
+	# array of shape (analyzers, thresholds, windows, resamples)
+	if metric not in metrics.METRICS:
+		raise ValueError("Unknown metric: {}".format(metric))
+
+	thresholds = np.asarray(thresholds, dtype=np.float64).reshape(-1)
+	rng = np.random.default_rng(seed)
+	values = np.full((len(analyzers), len(thresholds), len(windows), resamples), np.nan)
+	for w, window in enumerate(windows):
+		start, num_blocks = _window_blocks(run, window, block_length)
+		draws = draw_blocks(rng, num_blocks, resamples)
+		for a, analyzer in enumerate(analyzers):
+			if analyzer not in run.analyzers:
+				continue
+			index = run.ecdf_index(analyzer)
+			times, errors = index.times, index.errors
+			if window != None:
+				first, last = np.searchsorted(times, window, side='left')
+				times, errors = times[first:last], errors[first:last]
+			values[a, :, w] = resample_metric(times, errors, thresholds, metric,
+					draws, start, block_length)
+	return values
+
+def percentile_interval(resampled, confidence = CONFIDENCE):
+	# (lower, upper) over the last axis, NaN where no resample has a value
+	tail = (1 - confidence) / 2 * 100
+	with warnings.catch_warnings():
+		warnings.simplefilter("ignore", RuntimeWarning)
+		lower, upper = np.nanpercentile(resampled, (tail, 100 - tail), axis=-1)
+	return lower, upper
+
+###
+### Many runs at once
+###
+
+def run_intervals(run, analyzers, thresholds, windows = (None,), metric = "within",
+		resamples = RESAMPLES, block_length = BLOCK_LENGTH, confidence = CONFIDENCE, seed = 0):
+	# (values, lower, upper), each of shape (analyzers, thresholds, windows)
+	values = metrics.run_metrics(run, analyzers, thresholds, windows, metric)
+	resampled = run_resamples(run, analyzers, thresholds, windows, metric,
+			resamples, block_length, seed)
+	lower, upper = percentile_interval(resampled, confidence)
+	return values, lower, upper
+
+def _load_run_intervals(path, analyzers, thresholds, windows, metric, resamples,
+		block_length, confidence, seed):
+	# runs in a worker process, only the small result arrays are sent back
+	run = analyze_vpp.analyze_run(path, use_cache=True, analyzers=analyzers)
+	if not run:
+		empty = np.full((len(analyzers), len(thresholds), len(windows)), np.nan)
+		return empty, empty, empty
+	return run_intervals(run, analyzers, thresholds, windows, metric, resamples,
+			block_length, confidence, seed)
+
+def interval_table(runs, analyzers, thresholds, windows = (None,), metric = "within",
+		resamples = RESAMPLES, block_length = BLOCK_LENGTH, confidence = CONFIDENCE,
+		seed = 0, jobs = 1):
+	# runs: Run objects, or run directories which are then loaded (through
+	# the run cache) in jobs worker processes. The r-th run is resampled
+	# with seed (seed, r), results do not depend on jobs.
+	analyzers = list(analyzers)
+	thresholds = np.asarray(thresholds, dtype=np.float64).reshape(-1)
+	windows = list(windows)
+	shape = (len(runs), len(analyzers), len(thresholds), len(windows))
+	values, lower, upper = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+
+	arguments = (analyzers, thresholds, windows, metric, resamples, block_length, confidence)
+	paths = [(r, run) for r, run in enumerate(runs) if isinstance(run, str)]
+	for r, run in enumerate(runs):
+		if not isinstance(run, str) and run:
+			values[r], lower[r], upper[r] = run_intervals(run, *arguments, seed=(seed, r))
+
+	if paths and jobs == 1:
+		for r, path in paths:
+			values[r], lower[r], upper[r] = _load_run_intervals(path, *arguments, (seed, r))
+	elif paths:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+			futures = {executor.submit(_load_run_intervals, path, *arguments, (seed, r)): r
+					for r, path in paths}
+			for future in concurrent.futures.as_completed(futures):
+				r = futures[future]
+				values[r], lower[r], upper[r] = future.result()
+
+	return IntervalTable(values, lower, upper, metric, list(runs), analyzers,
+			thresholds, windows, confidence)
+
+def main():
+	parser = argparse.ArgumentParser(description="Bootstrap confidence intervals of the accuracy metrics.")
+	parser.add_argument("data_dir", nargs='?', default=analyze_dataset.DEFAULT_DATA_DIR,
+			help="directory containing one directory per run (default: quic/data)")
+	parser.add_argument("--analyzers", nargs='+', default=analyze_vpp.PLOTABLE_ANALYZERS,
+			choices=analyze_vpp.ANALYZER_NAMES, metavar="ANALYZER")
+	parser.add_argument("--metric", default="within", choices=metrics.METRICS)
+	parser.add_argument("--thresholds", nargs='+', type=float, default=[10],
+			help="thresholds in ms, or fractions for the quantile metric (default: 10)")
+	parser.add_argument("--window", nargs=2, type=float, default=None, metavar=("START", "END"),
+			help="time window in seconds (default: the whole run)")
+	parser.add_argument("--resamples", type=int, default=RESAMPLES)
+	parser.add_argument("--block-length", type=float, default=BLOCK_LENGTH,
+			help="seconds per block (default: {})".format(BLOCK_LENGTH))
+	parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+			help="number of worker processes (default: number of CPUs)")
+	args = parser.parse_args()
+
+	window = tuple(args.window) if args.window else None
+	run_paths = analyze_dataset.find_runs(args.data_dir)
+	table = interval_table(run_paths, args.analyzers, args.thresholds, (window,),
+			args.metric, args.resamples, args.block_length, args.confidence, args.seed, args.jobs)
+
+	print("{} {:.0f}% intervals, {} resamples, {} s blocks".format(args.metric,
+			args.confidence * 100, args.resamples, args.block_length))
+	for r, path in enumerate(run_paths):
+		for a, analyzer in enumerate(table.analyzers):
+			for t, threshold in enumerate(table.thresholds):
+				print("{}\t{}\t{:g}\t{:.4f}\t[{:.4f}, {:.4f}]".format(os.path.basename(os.path.normpath(path)),
+						analyzer, threshold, table.values[r, a, t, 0],
+						table.lower[r, a, t, 0], table.upper[r, a, t, 0]))
+
+if __name__ == '__main__':
+	main()
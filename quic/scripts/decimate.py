@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import math
+import numpy as np
+
+## Reduce dense time series to what a plot can actually show.
+##
+## minmax() splits the x range into a number of columns (a few per pixel
+## column of the figure) and keeps, per column, the first, last, smallest and
+## largest point. Spikes survive, as does the connection to the neighbouring
+## columns. NaN values break a line in matplotlib: a column is split into
+## buckets at every break, the points are kept per bucket and a NaN is put
+## between two buckets with a break between them. The decimated line thus
+## has the same breaks and never connects points across one.
+##
+## markers() keeps one marker per column, for series drawn as markers only.
+## A marker is several pixels wide, so MARKER_OVERSAMPLE gives columns two
+## pixels wide.
+
+# columns per pixel column of the figure
+OVERSAMPLE = 1
+MARKER_OVERSAMPLE = 0.5
+
+def columns_for(figure, oversample = OVERSAMPLE):
+	return int(math.ceil(figure.get_figwidth() * figure.dpi * oversample))
+
+def _column_ids(x, columns):
+	low = x[0]
+	width = x[-1] - low
+	if width <= 0:
+		return np.zeros(len(x), dtype=np.int64)
+	ids = ((x - low) * (columns / width)).astype(np.int64)
+	return np.minimum(ids, columns - 1)
+
+def _sorted(x, y):
+	if len(x) > 1 and np.any(x[1:] < x[:-1]):
+		order = np.argsort(x, kind='stable')
+		return x[order], y[order]
+	return x, y
+
+def minmax(x, y, columns):
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	x, y = _sorted(x, y)
+
+	valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+	if len(valid) <= 4 * columns:
+		return x, y
+
+	x_valid = x[valid]
+	y_valid = y[valid]
+	gap_before = np.zeros(len(valid), dtype=bool)
+	gap_before[1:] = np.diff(valid) > 1
+
+	# a bucket is a column, or the part of one between two breaks
+	ids = _column_ids(x_valid, columns)
+	is_start = np.ones(len(ids), dtype=bool)
+	is_start[1:] = (ids[1:] != ids[:-1]) | gap_before[1:]
+	starts = np.flatnonzero(is_start)
+	ends = np.append(starts[1:], len(ids)) - 1
+	buckets = np.cumsum(is_start)
+
+	# sorted by bucket, and by value within a bucket
+	order = np.lexsort((y_valid, buckets))
+	picks = np.unique(np.concatenate((starts, ends, order[starts], order[ends])))
+
+	x_out = x_valid[picks]
+	y_out = y_valid[picks]
+	breaks = np.flatnonzero(is_start[picks] & gap_before[picks])
+	if len(breaks):
+		x_out = np.insert(x_out, breaks, x_out[breaks])
+		y_out = np.insert(y_out, breaks, np.nan)
+	return x_out, y_out
+
+def markers(x, columns):
+	# x positions of markers drawn at a fixed height
+	x = np.asarray(x, dtype=np.float64)
+	x = np.sort(x[~np.isnan(x)])
+	if len(x) <= columns:
+		return x
+	ids = _column_ids(x, columns)
+	keep = np.ones(len(ids), dtype=bool)
+	keep[1:] = ids[1:] != ids[:-1]
+	return x[keep]
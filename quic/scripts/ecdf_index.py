@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import numpy as np
+
+## ECDF queries on the error samples of one analyzer of one run.
+##
+## The samples are kept in time order. The sorted errors of a time window
+## (start <= time < end, as in Run.window_mask) are computed once and
+## memoized, after that every query is a binary search. Memoized windows
+## are stored in the run cache together with the run, see Run.to_arrays.
+##
+## The curve is the one drawn by analyze_vpp.make_ecdf_data: the i-th
+## smallest error (counting from 0) is at frequency i/n, with linear
+## interpolation in between. cdf() returns exactly what the original
+## analyze_vpp.find_ecdf_y_value returned.
+
+def window_key(time_window):
+	if time_window == None:
+		return None
+	return (float(time_window[0]), float(time_window[1]))
+
+class EcdfIndex:
+
+	def __init__(self, times, errors, sorted_errors = None):
+		# sorted_errors: previously memoized {window_key: sorted errors}
+		times = np.asarray(times, dtype=np.float64)
+		errors = np.asarray(errors, dtype=np.float64)
+
+		valid = ~np.isnan(errors)
+		times = times[valid]
+		errors = errors[valid]
+		if len(times) > 1 and np.any(times[1:] < times[:-1]):
+			order = np.argsort(times, kind='stable')
+			times = times[order]
+			errors = errors[order]
+
+		self.times = times
+		self.errors = errors
+		self.windows = dict(sorted_errors) if sorted_errors else dict()
+
+	def sorted_errors(self, time_window = None):
+		key = window_key(time_window)
+		if key not in self.windows:
+			if key == None:
+				errors = self.errors
+			else:
+				start = np.searchsorted(self.times, key[0], side='left')
+				end = np.searchsorted(self.times, key[1], side='left')
+				errors = self.errors[start:end]
+			self.windows[key] = np.sort(errors)
+		return self.windows[key]
+
+	def count(self, time_window = None):
+		return len(self.sorted_errors(time_window))
+
+	def ecdf(self, time_window = None):
+		error_data = self.sorted_errors(time_window)
+		frequency = np.arange(len(error_data)) / len(error_data)
+		return (error_data, frequency)
+
+	def cdf(self, x, time_window = None):
+		# x can be a scalar or an array. Below the second smallest error the
+		# result is 0, at or above the largest error it is 1.
+		error_data = self.sorted_errors(time_window)
+		n = len(error_data)
+		x = np.asarray(x, dtype=np.float64)
+		if n < 2:
+			return np.where(np.searchsorted(error_data, x) >= n, 1.0, 0.0)
+
+		i = np.searchsorted(error_data, x, side='left')
+		upper = np.clip(i, 1, n - 1)
+		lower = upper - 1
+		with np.errstate(divide='ignore', invalid='ignore'):
+			rel_delta = (x - error_data[lower]) / (error_data[upper] - error_data[lower])
+		frequency_lower = lower / n
+		frequency_upper = upper / n
+		y_val = frequency_lower + rel_delta * (frequency_upper - frequency_lower)
+
+		return np.where(i >= n, 1.0, np.where(i <= 1, 0.0, y_val))
+
+	def quantile(self, p, time_window = None):
+		# inverse of the ECDF curve, NaN for an empty window
+		error_data, frequency = self.ecdf(time_window)
+		if len(error_data) == 0:
+			return np.full(np.shape(p), np.nan)
+		return np.interp(p, frequency, error_data)
+
+	def fraction_within(self, x, time_window = None):
+		# fraction of errors between -|x| and +|x|, as in figure 3b / 4b
+		x = np.abs(np.asarray(x, dtype=np.float64))
+		return self.cdf(x, time_window) - self.cdf(-x, time_window)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import numpy as np
+
+## Rows of a run grouped by flow (connection).
+##
+## The VPP plugin keeps one session per QUIC flow and numbers the flows in
+## the order it creates them (the flow column of switch-2_vpp.csv): at the
+## first packet towards a server port. spin_observers.assign_flows()
+## numbers the flows of a capture the same way. pcap_packets.read_packets()
+## does not: its flow ids count every 5-tuple, in the order of its first
+## packet in either direction, so they cannot be joined to the VPP flow ids
+## by number. Older VPP output has no flow column, all its rows are flow 0.
+##
+## FlowIndex sorts the flow ids once (stable, so the rows of a flow stay in
+## time order) and keeps the boundaries of each flow in the sorted order,
+## CSR style: the rows of the i-th flow are order[offsets[i]:offsets[i + 1]].
+## Selecting the rows of a flow is then a slice, nothing is scanned again
+## per flow, also with hundreds of concurrent connections.
+##
+## The endpoint logs carry no connection id, the client and server RTTs of
+## a run are therefore the truth for all of its flows.
+
+class FlowIndex:
+
+	def __init__(self, flow_ids):
+		flow_ids = np.asarray(flow_ids).reshape(-1)
+		if len(flow_ids) > 1 and np.any(flow_ids[1:] < flow_ids[:-1]):
+			self.order = np.argsort(flow_ids, kind='stable')
+		else:
+			self.order = np.arange(len(flow_ids))
+		sorted_ids = flow_ids[self.order]
+
+		starts = np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1
+		self.ids = sorted_ids[np.concatenate(([0], starts))] if len(sorted_ids) else sorted_ids
+		self.offsets = np.concatenate(([0], starts, [len(sorted_ids)])) if len(sorted_ids) \
+				else np.zeros(1, dtype=np.int64)
+
+	@classmethod
+	def single(cls, num_rows, flow_id = 0):
+		# all rows belong to one flow
+		return cls(np.full(num_rows, flow_id, dtype=np.int64))
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __iter__(self):
+		return iter(self.ids.tolist())
+
+	def __contains__(self, flow_id):
+		return self._find(flow_id) >= 0
+
+	def _find(self, flow_id):
+		position = int(np.searchsorted(self.ids, flow_id))
+		if position < len(self.ids) and self.ids[position] == flow_id:
+			return position
+		return -1
+
+	def position(self, flow_id):
+		# position of a flow in ids, raises KeyError for unknown flows
+		position = self._find(flow_id)
+		if position < 0:
+			raise KeyError(flow_id)
+		return position
+
+	@property
+	def counts(self):
+		return np.diff(self.offsets)
+
+	def rows(self, flow_id):
+		# indices of the rows of a flow, ascending
+		position = self.position(flow_id)
+		return self.order[self.offsets[position]:self.offsets[position + 1]]
+
+	def flow_positions(self):
+		# for every row, the position of its flow in ids
+		positions = np.empty(len(self.order), dtype=np.int64)
+		positions[self.order] = np.repeat(np.arange(len(self.ids)), self.counts)
+		return positions
+
+	def split(self, values):
+		# values (one per row) as a list with one array per flow
+		return np.split(np.asarray(values)[self.order], self.offsets[1:-1])
+
+	def reduce(self, ufunc, values):
+		# e.g. reduce(np.add, is_sample) counts the samples of every flow
+		return ufunc.reduceat(np.asarray(values)[self.order], self.offsets[:-1]) \
+				if len(self.ids) else np.zeros(0, dtype=np.asarray(values).dtype)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import numpy as np
+
+## Align ground truth RTT series (client, server, ping, ...) to the sample
+## times of the observer.
+##
+## linear:   interpolate between the surrounding source samples, holding the
+##           first / last source value outside of the source range.
+## previous: the last source value at or before the target time (as-of),
+##           NaN before the first source sample.
+## nearest:  the source value closest in time, ties go to the earlier sample
+##           (also between source samples with the same time).
+##
+## None of the functions modify their inputs.
+
+METHODS = ("linear", "previous", "nearest")
+
+def _sorted_source(source_times, source_values):
+	source_times = np.asarray(source_times, dtype=np.float64)
+	source_values = np.asarray(source_values, dtype=np.float64)
+
+	if len(source_times) > 1 and np.any(source_times[1:] < source_times[:-1]):
+		order = np.argsort(source_times, kind='stable')
+		source_times = source_times[order]
+		source_values = source_values[order]
+
+	return source_times, source_values
+
+def interpolate(target_times, source_times, source_values, method = "linear"):
+	if method not in METHODS:
+		raise ValueError("Unknown interpolation method: {}".format(method))
+
+	target_times = np.asarray(target_times, dtype=np.float64)
+	source_times, source_values = _sorted_source(source_times, source_values)
+
+	if len(source_times) == 0:
+		return np.full(len(target_times), np.nan)
+
+	if method == "linear":
+		return np.interp(target_times, source_times, source_values)
+
+	if method == "previous":
+		index = np.searchsorted(source_times, target_times, side='right') - 1
+		values = source_values[np.maximum(index, 0)]
+		values[index < 0] = np.nan
+		return values
+
+	# nearest
+	right = np.searchsorted(source_times, target_times, side='left')
+	right = np.minimum(right, len(source_times) - 1)
+	left = np.maximum(right - 1, 0)
+	# the first of the source samples at the time of left
+	left = np.searchsorted(source_times, source_times[left], side='left')
+	take_left = np.abs(target_times - source_times[left]) <= \
+			np.abs(source_times[right] - target_times)
+	return source_values[np.where(take_left, left, right)]
+
+def interpolate_series(target_times, series, method = "linear"):
+	# series maps a name (e.g. "client") to a (times, values) tuple
+	return {name: interpolate(target_times, times, values, method)
+			for name, (times, values) in series.items()}
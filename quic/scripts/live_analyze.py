@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import math
+import os
+import os.path
+import sys
+import time
+import warnings
+import numpy as np
+
+import analyze_vpp
+import interpolate
+import log_parser
+import pcap_reader
+import vpp_columns
+
+## Live view of a measurement that is still running.
+## Call as: live_analyze.py path/to/run/ [--window 10] [--interval 1]
+##
+## Follows switch-2_vpp.csv and the client minq log while they are being
+## written and prints, every interval, rolling statistics per analyzer: the
+## sample rate and the error against the client RTT over the last window
+## seconds. Stops once vpp_done exists and everything has been read, or on
+## Ctrl-C. LiveRun.stats() returns the same numbers for other scripts.
+##
+## By default all analyzers in the CSV header are followed (the plugin in
+## this repository writes basic, pn, status and rel_heur only). Requested
+## analyzers that are not in the header are skipped with a warning.
+##
+## Times are as in analyze_vpp.analyze_run: VPP times relative to the first
+## VPP entry (the first two entries are ignored), endpoint times relative to
+## the first packet in switch-2_tcpdump.pcap. The client RTT is interpolated
+## linearly to the sample times. A sample waits until a client RTT at or
+## after its time has been read, or until it is MAX_DELAY seconds older than
+## the newest sample, then the last client RTT is held (as np.interp does).
+##
+## Memory stays bounded: files are read in chunks, and only the last window
+## seconds of errors, the client RTTs still needed for interpolation and
+## the samples waiting for them are kept.
+
+WINDOW = 10
+INTERVAL = 1
+MAX_DELAY = 2
+CHUNK_SIZE = 4 * 1024 * 1024
+WITHIN_THRESHOLD = 5
+
+class FileFollower:
+
+	def __init__(self, path, chunk_size = CHUNK_SIZE):
+		self.path = path
+		self.chunk_size = chunk_size
+		self.offset = 0
+		self.partial = b''
+
+	def read_lines(self):
+		# complete lines appended since the last call, at most about one chunk
+		if not os.path.exists(self.path):
+			return b''
+		with open(self.path, 'rb') as followed_file:
+			followed_file.seek(self.offset)
+			data = followed_file.read(self.chunk_size)
+		self.offset += len(data)
+
+		data = self.partial + data
+		newline = data.rfind(b'\n')
+		self.partial = data[newline + 1:]
+		return data[:newline + 1]
+
+	def at_end(self):
+		return os.path.exists(self.path) and self.offset >= os.path.getsize(self.path)
+
+class RollingWindow:
+	# (time, value) samples of the last window seconds, in chunks of arrays
+
+	def __init__(self, window):
+		self.window = window
+		self.chunks = collections.deque()
+		self.total = 0
+
+	def add(self, times, values):
+		if len(times):
+			self.chunks.append((times, values))
+			self.total += len(times)
+
+	def values(self, now):
+		start = now - self.window
+		while self.chunks and self.chunks[0][0][-1] < start:
+			self.chunks.popleft()
+		if not self.chunks:
+			return np.empty(0)
+		times = np.concatenate([x[0] for x in self.chunks])
+		values = np.concatenate([x[1] for x in self.chunks])
+		return values[times >= start]
+
+class LiveRun:
+
+	def __init__(self, path, analyzers = None, window = WINDOW, max_delay = MAX_DELAY):
+		self.path = path
+		self.requested_analyzers = None if analyzers == None else list(analyzers)
+		# known once the header has been read
+		self.analyzers = []
+		self.window = window
+		self.max_delay = max_delay
+
+		self.vpp = FileFollower(os.path.join(path, "switch-2_vpp.csv"))
+		self.client = FileFollower(os.path.join(path, "client-0_minq_stderr.txt"))
+		self.pcap_path = os.path.join(path, "switch-2_tcpdump.pcap")
+
+		self.zero_epoch = None
+		self.header_line = None
+		self.header = None
+		self.columns = None
+		self.vpp_rows = 0
+		self.base_time = None
+		self.now = -math.inf
+
+		# client RTTs still needed to interpolate the waiting samples
+		self.client_times = np.empty(0)
+		self.client_rtts = np.empty(0)
+		# samples waiting for a later client RTT, values is (samples, analyzers)
+		self.pending_times = np.empty(0)
+		self.pending_values = np.empty((0, 0))
+
+		self.client_window = RollingWindow(window)
+		self.sample_windows = dict()
+		self.error_windows = dict()
+
+	def _set_header(self, header_line):
+		self.header_line = header_line
+		self.header = [name.strip() for name in header_line.decode().split(',')]
+		present = [x for x in analyze_vpp.PLOTABLE_ANALYZERS
+				if x + "_data" in self.header and x + "_new" in self.header]
+		if self.requested_analyzers == None:
+			self.analyzers = present
+		else:
+			missing = [x for x in self.requested_analyzers if x not in present]
+			if missing:
+				warnings.warn("Analyzers not in {}, skipped: {}".format(
+						self.vpp.path, ", ".join(missing)))
+			self.analyzers = [x for x in self.requested_analyzers if x in present]
+
+		self.columns = [self.header.index('time')]
+		for analyzer in self.analyzers:
+			self.columns.append(self.header.index(analyzer + "_data"))
+			self.columns.append(self.header.index(analyzer + "_new"))
+		self.pending_values = np.empty((0, len(self.analyzers)))
+		self.sample_windows = {name: RollingWindow(self.window) for name in self.analyzers}
+		self.error_windows = {name: RollingWindow(self.window) for name in self.analyzers}
+
+	def _read_client(self):
+		block = self.client.read_lines()
+		if not block:
+			return False
+		log = log_parser.parse_minq_block(block)
+		times = log['rtt_times'] - self.zero_epoch
+		self.client_times = np.concatenate((self.client_times, times))
+		self.client_rtts = np.concatenate((self.client_rtts, log['rtts']))
+		self.client_window.add(times, log['rtts'])
+		return True
+
+	def _read_vpp(self):
+		block = self.vpp.read_lines()
+		if not block:
+			return False
+		if self.header == None:
+			header_line, _, block = block.partition(b'\n')
+			self._set_header(header_line)
+
+		lines = [line for line in vpp_columns.data_lines(block.split(b'\n'), self.header_line)
+				if line]
+		if not lines:
+			return True
+		table = np.loadtxt(lines, delimiter=',', usecols=self.columns, ndmin=2, comments=None)
+
+		if self.base_time == None:
+			self.base_time = table[0, 0]
+		skip = max(0, 2 - self.vpp_rows)
+		self.vpp_rows += len(table)
+		table = table[skip:]
+
+		times = table[:, 0] - self.base_time
+		values = np.where(table[:, 2::2] == 1, table[:, 1::2] * 1000, math.nan)
+		self.pending_times = np.concatenate((self.pending_times, times))
+		self.pending_values = np.concatenate((self.pending_values, values))
+		if len(times):
+			self.now = max(self.now, times.max())
+		return True
+
+	def _process(self, flush = False):
+		if not len(self.pending_times):
+			return
+		latest_client = self.client_times[-1] if len(self.client_times) else -math.inf
+		ready = (self.pending_times <= latest_client) | \
+				(self.pending_times < self.now - self.max_delay)
+		if flush:
+			ready[:] = True
+		if not np.any(ready):
+			return
+
+		times = self.pending_times[ready]
+		values = self.pending_values[ready]
+		self.pending_times = self.pending_times[~ready]
+		self.pending_values = self.pending_values[~ready]
+
+		client = interpolate.interpolate(times, self.client_times, self.client_rtts, "linear")
+		for a, analyzer in enumerate(self.analyzers):
+			is_sample = ~np.isnan(values[:, a])
+			self.sample_windows[analyzer].add(times[is_sample], values[is_sample, a])
+			errors = values[:, a] - client
+			is_error = ~np.isnan(errors)
+			self.error_windows[analyzer].add(times[is_error], errors[is_error])
+
+		# keep the client RTTs around the oldest sample that is still waiting
+		oldest = self.pending_times.min() if len(self.pending_times) else times.max()
+		first_needed = max(0, np.searchsorted(self.client_times, oldest, side='right') - 1)
+		self.client_times = self.client_times[first_needed:]
+		self.client_rtts = self.client_rtts[first_needed:]
+
+	def poll(self):
+		# read what was written since the last poll, True if there was new data
+		if self.zero_epoch == None:
+			try:
+				self.zero_epoch = pcap_reader.first_timestamp(self.pcap_path)
+			except (OSError, pcap_reader.PcapError):
+				return False
+
+		new_data = self._read_client()
+		new_data = self._read_vpp() or new_data
+		self._process()
+		return new_data
+
+	def at_end(self):
+		return self.zero_epoch != None and self.vpp.at_end() and self.client.at_end()
+
+	def finish(self):
+		self.poll()
+		self._process(flush=True)
+
+	def stats(self):
+		# {analyzer: {...}} over the last window seconds
+		client_rtts = self.client_window.values(self.now)
+		client_rtt = np.median(client_rtts) if len(client_rtts) else math.nan
+		duration = min(self.window, max(self.now, 0))
+
+		stats = collections.OrderedDict()
+		for analyzer in self.analyzers:
+			samples = self.sample_windows[analyzer].values(self.now)
+			errors = self.error_windows[analyzer].values(self.now)
+			rate = len(samples) / duration if duration > 0 else math.nan
+			stats[analyzer] = {
+				'total': self.sample_windows[analyzer].total,
+				'samples': len(samples),
+				'rate': rate,
+				'samples_per_rtt': rate * client_rtt / 1000,
+				'error_median': np.median(errors) if len(errors) else math.nan,
+				'error_p95': np.percentile(np.abs(errors), 95) if len(errors) else math.nan,
+				'within': np.mean(np.abs(errors) <= WITHIN_THRESHOLD) if len(errors) else math.nan,
+			}
+		return client_rtt, stats
+
+def print_stats(live):
+	client_rtt, stats = live.stats()
+	print("t = {:.1f} s, client RTT {:.1f} ms, last {} s, {} samples waiting".format(
+			max(live.now, 0), client_rtt, live.window, len(live.pending_times)))
+	print("\t{:<15}{:>8}{:>9}{:>9}{:>12}{:>12}{:>10}".format("analyzer", "total",
+			"rate/s", "per RTT", "err median", "|err| p95", "<= {} ms".format(WITHIN_THRESHOLD)))
+	for analyzer, values in stats.items():
+		print("\t{:<15}{total:>8}{rate:>9.1f}{samples_per_rtt:>9.2f}{error_median:>12.2f}"
+				"{error_p95:>12.2f}{within:>10.2f}".format(analyzer, **values))
+	sys.stdout.flush()
+
+def main():
+	parser = argparse.ArgumentParser(description="Follow the VPP output of a running measurement.")
+	parser.add_argument("path", help="run directory")
+	parser.add_argument("--window", type=float, default=WINDOW,
+			help="seconds of samples the statistics cover (default: {})".format(WINDOW))
+	parser.add_argument("--interval", type=float, default=INTERVAL,
+			help="seconds between two reports (default: {})".format(INTERVAL))
+	parser.add_argument("--analyzers", nargs='+', choices=analyze_vpp.PLOTABLE_ANALYZERS,
+			metavar="ANALYZER", help="default: all analyzers in the VPP CSV header")
+	args = parser.parse_args()
+
+	live = LiveRun(args.path, args.analyzers, args.window)
+	last_report = time.monotonic()
+	try:
+		while True:
+			# vpp_done is checked first, data written before it is still read
+			done = os.path.exists(os.path.join(args.path, "vpp_done"))
+			new_data = live.poll()
+			if done and live.at_end():
+				live.finish()
+				print_stats(live)
+				break
+			if time.monotonic() - last_report >= args.interval:
+				print_stats(live)
+				last_report = time.monotonic()
+			if not new_data:
+				time.sleep(min(args.interval, 0.2))
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
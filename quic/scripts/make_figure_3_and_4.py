@@ -1,12 +1,19 @@
 #! /usr/bin/env python3
 import analyze_vpp
+import mbyte_counters
+import metrics
 
 import os
 import math
 import matplotlib.pyplot as plt
 from matplotlib.markers import *
+from matplotlib import rcParams
+import argparse
+import concurrent.futures
 import pickle
 import collections
+import numpy as np
+import sys
 
 script_location = dirname = os.path.dirname(__file__)
 
@@ -91,7 +98,6 @@ params = {
    }
 rcParams.update(params)
 
-
 INTERVAL_OF_INTEREST = (90,150)
 
 analyzer_names = ["basic", "pn", "pn_valid", "valid", "pn_valid_edge",
@@ -106,6 +112,9 @@ analyzers_to_plot = (("basic", "Spin bit", 0),
 
 analyzer_to_plot_half_rtt = analyzers_to_plot + (("status_half", "VEC half-RTT", 4), )
 
+# "analyzers" that are not a column of the VPP output
+PSEUDO_ANALYZERS = ("status_half", )
+
 def save_figure(figure, filename):
 	print("\tGenerating figure: {} ...".format(filename), end="")
 	figure.savefig(PLOT_DIR + "{}.pdf".format(filename))
@@ -115,447 +124,272 @@ def save_figure(figure, filename):
 	plt.close(figure)
 	print("Done")
 
-def count_valid_edges_endpoint(mbytes, mtimes, interval = None):
-	counter = 0
-	for i in range(len(mbytes)):
-		time = mtimes[i]
-		byte = mbytes[i]
-		if interval and not (time > interval[0] and time < interval[1]):
-			continue
-		if byte & 0x01:
-			counter += 1
+# The counters are vectorized, see mbyte_counters.py. As before, only
+# samples strictly inside the interval are counted.
 
-	return counter
+def count_valid_edges_endpoint(mbytes, mtimes, interval = None):
+	return mbyte_counters.MbyteCounter(mtimes, mbytes).valid_edges(interval)
 
 def count_double_valid_edges_observer(run, interval = None):
-	counter = 0
-	mbytes = run['observer_mbytes']
-	for i in range(1, len(mbytes)):
-		time = mbytes[i]['time']
-		byte = mbytes[i]['measurement']
-		last_byte = mbytes[i-1]['measurement']
-		if interval and not (time > interval[0] and time < interval[1]):
-			continue
-		if (byte & 0x01) and (last_byte & 0x01):
-			counter += 1
-
-	return counter
+	return run.mbyte_counter('observer').double_valid_edges(interval)
 
 def count_vec_edges_observer(run, vec, interval = None):
-	counter = 0
-	mbytes = run['observer_mbytes']
-	for i in range(len(mbytes)):
-		time = mbytes[i]['time']
-		byte = mbytes[i]['measurement']
-		if interval and not (time > interval[0] and time < interval[1]):
-			continue
-		if ((byte & 0x0C) >> 2) in vec:
-			counter += 1
-
-	return counter
+	return run.mbyte_counter('observer').vec_edges(vec, interval)
 
 
 def count_samples_observer(run, analyzer, interval = None):
-	counter = 0
 	times, rtts, times_rej = analyze_vpp.make_analyzer_data(run, analyzer)
-	for time in times:
-		if time > interval[0] and time < interval[1]:
-			counter += 1
-	return counter
+	return int(np.count_nonzero((times > interval[0]) & (times < interval[1])))
 
 ##########################################
-#### Reordering
+#### Run selection
 ##########################################
 
-r_w60_delay_1     = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522827221-bHosL_w60_delay-1ms")
-r_w60_reorder_1   = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522826145-R1EMm_w60_delay-1ms-reorder-1")
-r_w60_reorder_5   = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522826321-AUuPr_w60_delay-1ms-reorder-5")
-r_w60_reorder_10  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522826501-QkHFG_w60_delay-1ms-reorder-10")
-r_w60_reorder_20  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522826681-LJBr8_w60_delay-1ms-reorder-20")
-r_w60_reorder_30  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522826861-wXE4m_w60_delay-1ms-reorder-30")
-r_w60_reorder_40  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/1522827043-BdV25_w60_delay-1ms-reorder-40")
-
-runs_to_plot = ((r_w60_delay_1, 0),
-				(r_w60_reorder_1, 1),
-				(r_w60_reorder_5, 5),
-				(r_w60_reorder_10, 10),
-				(r_w60_reorder_20, 20),
-				(r_w60_reorder_30, 30),
-				(r_w60_reorder_40, 40),
-			   )
-
-##
-## ECDF for a single loss reordering rate
-##
-
-run_for_ecdf = r_w60_reorder_10
-
-f, ax = plt.subplots(1)
-#ax.axhline(0.5, **GRIDLINEPROPS)
-ax.axvline(0, **GRIDLINEPROPS)
-
-for analyzer, label, i in analyzers_to_plot:
-	x_values, y_values = analyze_vpp.make_ecdf_data(run_for_ecdf, analyzer, INTERVAL_OF_INTEREST)
-	ax.plot(x_values, y_values,
-			label=label,
-			#linestyle = LINESTYLES[i],
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0),
-			markevery = (0.0*i, 0.2))
-
-ax.legend()
-ax.set_xlim((-55, 15))
-ax.set_xlabel("Observer estimate – client estimate [ms]")
-ax.set_ylabel("ECDF")
-ax.set_yticks((0, 0.25, 0.5, 0.75, 1))
-#ax.grid(True)
-save_figure(f, "figure_3a")
-
-##
-## Analyzer error over various reordering rates
-##
+# (run directory, x value in the figures)
+REORDERING_RUNS = (
+	("1522827221-bHosL_w60_delay-1ms", 0),
+	("1522826145-R1EMm_w60_delay-1ms-reorder-1", 1),
+	("1522826321-AUuPr_w60_delay-1ms-reorder-5", 5),
+	("1522826501-QkHFG_w60_delay-1ms-reorder-10", 10),
+	("1522826681-LJBr8_w60_delay-1ms-reorder-20", 20),
+	("1522826861-wXE4m_w60_delay-1ms-reorder-30", 30),
+	("1522827043-BdV25_w60_delay-1ms-reorder-40", 40),
+)
+
+def burst_length(burst_parameter):
+	return 1 / (burst_parameter / 100)
+
+BURST_LOSS_RUNS = (
+	("1522831927-4bloa_w20_delay-0", burst_length(math.inf)),
+	("1522830498-wiUkE_w20_loss-gemodel-1-30", burst_length(30)),
+	("1522830318-1z2kQ_w20_loss-gemodel-1-25", burst_length(25)),
+	("1522830140-EE0id_w20_loss-gemodel-1-20", burst_length(20)),
+	("1522829960-KHXoA_w20_loss-gemodel-1-15", burst_length(15)),
+	("1522829781-mZovb_w20_loss-gemodel-1-10", burst_length(10)),
+	("1522829602-CqHLQ_w20_loss-gemodel-1-8", burst_length(8)),
+	("1522829423-fElX0_w20_loss-gemodel-1-7", burst_length(7)),
+	("1522829244-6MCCk_w20_loss-gemodel-1-5", burst_length(5)),
+)
+
+##########################################
+#### Figure specifications
+##########################################
+
+## A figure is drawn from a metric, evaluated for every selected run and
+## analyzer over a time window:
+##   ecdf:            the ECDF of the error (x values, y values), single run
+##   within:          fraction of samples with |error| < options['threshold']
+##   samples_per_rtt: samples in the window / (window length / options['rtt'])
+## Runs are only loaded when a selected figure needs them, with only the
+## analyzer columns the selected figures need.
+
+FigureSpec = collections.namedtuple("FigureSpec",
+		("name", "runs", "analyzers", "metric", "window", "options"))
 
 X_VALUE_TO_CMP = 10
+X_TICKS = (0, 5, 10, 15, 20)
 
-f, ax = plt.subplots(1)
-ax.axhline(1, **GRIDLINEPROPS)
-
-for analyzer, label, i in analyzers_to_plot:
-	## First build the data series
-	y_values = list()
-	x_values = list()
-	for run, reorder_grade in runs_to_plot:
-		y_val = analyze_vpp.find_ecdf_y_value(run, analyzer, abs(X_VALUE_TO_CMP), INTERVAL_OF_INTEREST) - \
-				analyze_vpp.find_ecdf_y_value(run, analyzer, -abs(X_VALUE_TO_CMP), INTERVAL_OF_INTEREST)
-		y_values.append(y_val)
-		x_values.append(reorder_grade)
-
-	ax.plot(x_values, y_values,
-			label=label,
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0))
-
-#ax.legend()
-#ax.set_xticks(x_values)
-ax.set_xlabel("Packet reordering rate [%]")
-ax.set_ylabel("Fraction of samples\nwith |error| < 10 ms")
-#ax.grid(True)
-save_figure(f, "figure_3b")
-
-##
-## Analyzer sample rate over various reordering rates
-##
-# f, ax = plt.subplots(1)
-# ax.axhline(1, **GRIDLINEPROPS)
-
-# for analyzer, label, i in analyzer_to_plot_half_rtt:
-# 	#analyzer, label = analyzers_to_plot_hack[i]
-# 	## First build the data series
-# 	y_values = list()
-# 	x_values = list()
-# 	for run, reorder_grade in runs_to_plot:
-# 		valid_edges = 0
-# 		valid_edges += count_valid_edges_endpoint(run['server_mbytes'],
-# 												  run['server_mtimes'],
-# 												  INTERVAL_OF_INTEREST)
-# 		valid_edges += count_valid_edges_endpoint(run['client_mbytes'],
-# 												  run['client_mtimes'],
-# 												  INTERVAL_OF_INTEREST)
-
-# 		if analyzer == "status_half":
-# 			sampled_edges =  count_vec_edges_observer(run, (2, 3), INTERVAL_OF_INTEREST)
-
-# 		else:
-# 			sampled_edges = count_samples_observer(run, analyzer, INTERVAL_OF_INTEREST)
-
-# 		y_values.append(sampled_edges/valid_edges)
-# 		x_values.append(reorder_grade)
-# 		#print(reorder_grade, valid_edges)
-
-# 	#print()
-# 	linestyle = None
-# 	if analyzer == "status_half":
-# 		linestyle = ':'
-# 	else:
-# 		label = None
-# 	ax.plot(x_values, y_values,
-# 			label = label,
-# 			color = COLORS[i],
-# 			marker = MARKERS[i][0],
-# 			markersize = MARKERS[i][1],
-# 			markeredgecolor = COLORS[i],
-# 			markerfacecolor = (0,0,0,0),
-# 			linestyle = linestyle)
-
-
-# #ax.set_ylim((None, 2))
-# ax.legend(loc='upper left')
-# #ax.set_xticks(x_values)
-# ax.set_xlabel("Packet reordering rate [%]")
-# ax.set_ylabel("Edges sampled /\nvalid edges transmitted")
-# #ax.grid(True)
-# save_figure(f, "reordering_w60_effect_samples")
-
-
-##
-## Analyzer sample rate over various reordering rates
-##
-
-RTT = 44e-3
-
-f, ax = plt.subplots(1)
-#ax.axhline(2, **GRIDLINEPROPS)
-
-for analyzer, label, i in analyzer_to_plot_half_rtt:
-	#analyzer, label = analyzers_to_plot_hack[i]
-	## First build the data series
-	y_values = list()
-	x_values = list()
-	for run, reorder_grade in runs_to_plot:
-		if analyzer == "status_half":
-			sampled_edges =  count_vec_edges_observer(run, (2, 3), INTERVAL_OF_INTEREST)
+ECDF_OPTIONS = {
+	'x_label': "Observer estimate – client estimate [ms]",
+	'y_label': "ECDF",
+	'y_ticks': (0, 0.25, 0.5, 0.75, 1),
+	'legend': 'best',
+}
+WITHIN_OPTIONS = {
+	'threshold': X_VALUE_TO_CMP,
+	'y_label': "Fraction of samples\nwith |error| < 10 ms",
+}
+SAMPLES_OPTIONS = {
+	'y_label': "Samples per RTT",
+}
+
+FIGURES = (
+	## ECDF for a single loss reordering rate
+	FigureSpec("figure_3a", (REORDERING_RUNS[3],), analyzers_to_plot, "ecdf",
+			INTERVAL_OF_INTEREST, dict(ECDF_OPTIONS, x_lim=(-55, 15), markevery_step=0.0)),
+	## Analyzer error over various reordering rates
+	FigureSpec("figure_3b", REORDERING_RUNS, analyzers_to_plot, "within",
+			INTERVAL_OF_INTEREST, dict(WITHIN_OPTIONS,
+				x_label="Packet reordering rate [%]")),
+	## Analyzer sample rate over various reordering rates
+	FigureSpec("figure_3c", REORDERING_RUNS, analyzer_to_plot_half_rtt, "samples_per_rtt",
+			INTERVAL_OF_INTEREST, dict(SAMPLES_OPTIONS, rtt=44e-3, legend='upper left',
+				x_label="Packet reordering rate [%]")),
+	## ECDF for a single burst loss rate
+	FigureSpec("figure_4a", (BURST_LOSS_RUNS[5],), analyzers_to_plot, "ecdf",
+			INTERVAL_OF_INTEREST, dict(ECDF_OPTIONS, x_lim=(-10, 32), markevery_step=0.1)),
+	## Analyzer error over various burst rates
+	FigureSpec("figure_4b", BURST_LOSS_RUNS, analyzers_to_plot, "within",
+			INTERVAL_OF_INTEREST, dict(WITHIN_OPTIONS, x_ticks=X_TICKS, y_ticks=(0.8, 0.9, 1),
+				x_label="Average burst length [packets]")),
+	## Analyzer sample rate over various burst rates
+	FigureSpec("figure_4c", BURST_LOSS_RUNS, analyzer_to_plot_half_rtt, "samples_per_rtt",
+			INTERVAL_OF_INTEREST, dict(SAMPLES_OPTIONS, rtt=40e-3, legend='lower left',
+				y_lim=(None, 2.1), x_label="Average burst length [packets]")),
+)
+
+##########################################
+#### Evaluating metrics
+##########################################
+
+def evaluate(run, spec):
+	# {analyzer: value} for a single run
+	values = dict()
+	if spec.metric == "within":
+		# all analyzers of the spec in one run_metrics call
+		analyzers = [analyzer for analyzer, label, i in spec.analyzers]
+		within = metrics.run_metrics(run, analyzers, (spec.options['threshold'],),
+				(spec.window,), "within")[:, 0, 0]
+	for a, (analyzer, label, i) in enumerate(spec.analyzers):
+		if spec.metric == "ecdf":
+			values[analyzer] = analyze_vpp.make_ecdf_data(run, analyzer, spec.window)
+		elif spec.metric == "within":
+			values[analyzer] = within[a]
+		elif spec.metric == "samples_per_rtt":
+			if analyzer == "status_half":
+				sampled_edges = count_vec_edges_observer(run, (2, 3), spec.window)
+			else:
+				sampled_edges = count_samples_observer(run, analyzer, spec.window)
+			duration_s = spec.window[1] - spec.window[0]
+			duration_rtt = duration_s / spec.options['rtt']
+			values[analyzer] = sampled_edges / duration_rtt
 		else:
-			sampled_edges = count_samples_observer(run, analyzer, INTERVAL_OF_INTEREST)
-
-		duration_s = INTERVAL_OF_INTEREST[1] - INTERVAL_OF_INTEREST[0]
-		duration_rtt = duration_s / RTT
-
-		y_values.append(sampled_edges/duration_rtt)
-		x_values.append(reorder_grade)
-		#print(reorder_grade, valid_edges)
-
-	#print()
-	linestyle = None
-	if analyzer == "status_half":
-		linestyle = ':'
-	else:
-		label = None
-	ax.plot(x_values, y_values,
-			label = label,
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0),
-			linestyle = linestyle)
-
-
-#ax.set_ylim((None, 2))
-ax.legend(loc='upper left')
-#ax.set_xticks(x_values)
-ax.set_xlabel("Packet reordering rate [%]")
-ax.set_ylabel("Samples per RTT")
-#ax.grid(True)
-save_figure(f, "figure_3c")
-
-##############################################################################
-#### EFFECT OF BURST LOSS, WINDOW
-##############################################################################
-
-r_w20_delay_0        = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522831927-4bloa_w20_delay-0")
-r_w20_loss_burst_5   = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522829244-6MCCk_w20_loss-gemodel-1-5")
-r_w20_loss_burst_7   = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522829423-fElX0_w20_loss-gemodel-1-7")
-r_w20_loss_burst_8   = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522829602-CqHLQ_w20_loss-gemodel-1-8")
-r_w20_loss_burst_10  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522829781-mZovb_w20_loss-gemodel-1-10")
-r_w20_loss_burst_15  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522829960-KHXoA_w20_loss-gemodel-1-15")
-r_w20_loss_burst_20  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522830140-EE0id_w20_loss-gemodel-1-20")
-r_w20_loss_burst_25  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522830318-1z2kQ_w20_loss-gemodel-1-25")
-r_w20_loss_burst_30  = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + "1522830498-wiUkE_w20_loss-gemodel-1-30")
-
-runs_to_plot = (
-				(r_w20_delay_0, math.inf),
-				(r_w20_loss_burst_30, 30),
-				(r_w20_loss_burst_25, 25),
-				(r_w20_loss_burst_20, 20),
-				(r_w20_loss_burst_15, 15),
-				(r_w20_loss_burst_10, 10),
-				(r_w20_loss_burst_8, 8),
-				(r_w20_loss_burst_7, 7),
-				(r_w20_loss_burst_5, 5),
-			   )
-
-##
-## ECDF for a single burst loss rate
-##
-
-run_for_ecdf = r_w20_loss_burst_10
-
-f, ax = plt.subplots(1)
-#ax.axhline(0.5, **GRIDLINEPROPS)
-ax.axvline(0, **GRIDLINEPROPS)
-
-
-for analyzer, label, i in analyzers_to_plot:
-	x_values, y_values = analyze_vpp.make_ecdf_data(run_for_ecdf, analyzer, INTERVAL_OF_INTEREST)
-	ax.plot(x_values, y_values,
-			label=label,
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0),
-			markevery = (0.1*i, 0.2))
-
-ax.legend()
-ax.set_xlim((-10, 32))
-ax.set_xlabel("Observer estimate – client estimate [ms]")
-ax.set_ylabel("ECDF")
-ax.set_yticks((0, 0.25, 0.5, 0.75, 1))
-#ax.set_ylim((-0.01,1.01))
-#ax.grid(True)
-save_figure(f, "figure_4a")
-
-##
-## Analyzer error over various burst rates
-##
+			raise ValueError("Unknown metric: {}".format(spec.metric))
+	return values
+
+def evaluate_run(run_dir, specs):
+	# Runs in a worker process: load one run with the columns the specs
+	# need, and return {spec name: {analyzer: value}}.
+	analyzers = set()
+	for spec in specs:
+		analyzers.update(x[0] for x in spec.analyzers if x[0] not in PSEUDO_ANALYZERS)
+	run = analyze_vpp.analyze_run(BASE_DATA_DIR + "/" + run_dir, use_cache=True,
+			analyzers=sorted(analyzers))
+	if not run:
+		raise RuntimeError("Run {} is not analyzed by VPP".format(run_dir))
+	return {spec.name: evaluate(run, spec) for spec in specs}
+
+def evaluate_figures(specs, jobs = None):
+	# {spec name: [{analyzer: value} for every run of the spec]}
+	specs_per_run = collections.OrderedDict()
+	for spec in specs:
+		for run_dir, x_value in spec.runs:
+			specs_per_run.setdefault(run_dir, list()).append(spec)
+
+	values_per_run = dict()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = {run_dir: executor.submit(evaluate_run, run_dir, run_specs)
+				for run_dir, run_specs in specs_per_run.items()}
+		for run_dir, future in futures.items():
+			values_per_run[run_dir] = future.result()
+
+	return {spec.name: [values_per_run[run_dir][spec.name] for run_dir, x_value in spec.runs]
+			for spec in specs}
 
-X_TICKS = (0, 5, 10, 15, 20)
+##########################################
+#### Drawing
+##########################################
 
-f, ax = plt.subplots(1)
-ax.axhline(1, **GRIDLINEPROPS)
-
-for analyzer, label, i in analyzers_to_plot:
-	## First build the data series
-	y_values = list()
-	x_values = list()
-	for run, burst_parameter in runs_to_plot:
-		y_val = analyze_vpp.find_ecdf_y_value(run, analyzer, abs(X_VALUE_TO_CMP), INTERVAL_OF_INTEREST) - \
-				analyze_vpp.find_ecdf_y_value(run, analyzer, -abs(X_VALUE_TO_CMP), INTERVAL_OF_INTEREST)
-		y_values.append(y_val)
-		burst_length = 1 / (burst_parameter / 100)
-		x_values.append(burst_length)
-
-	ax.plot(x_values, y_values,
-			label=label,
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0))
-
-#ax.legend()
-ax.set_xticks(X_TICKS)
-ax.set_yticks((0.8, 0.9, 1))
-ax.set_xlabel("Average burst length [packets]")
-ax.set_ylabel("Fraction of samples\nwith |error| < 10 ms")
-#ax.grid(True)
-save_figure(f, "figure_4b")
-
-
-##
-## Analyzer sample rate over various burst rates
-##
-# f, ax = plt.subplots(1)
-# ax.axhline(1, **GRIDLINEPROPS)
-
-# for analyzer, label, i in analyzer_to_plot_half_rtt:
-# 	#analyzer, label = analyzers_to_plot_hack[i]
-# 	## First build the data series
-# 	y_values = list()
-# 	x_values = list()
-# 	for run, burst_parameter in runs_to_plot:
-# 		valid_edges = 0
-# 		valid_edges += count_valid_edges_endpoint(run['server_mbytes'],
-# 												  run['server_mtimes'],
-# 												  INTERVAL_OF_INTEREST)
-# 		valid_edges += count_valid_edges_endpoint(run['client_mbytes'],
-# 												  run['client_mtimes'],
-# 												  INTERVAL_OF_INTEREST)
-
-# 		if analyzer == "status_half":
-# 			sampled_edges =  count_vec_edges_observer(run, (2, 3), INTERVAL_OF_INTEREST)
-
-# 		else:
-# 			sampled_edges = count_samples_observer(run, analyzer, INTERVAL_OF_INTEREST)
-
-
-# 		burst_length = 1 / (burst_parameter / 100)
-# 		#loss_rate = burst_length / (burst_length + GOOD_LENGTH)
-
-# 		y_values.append(sampled_edges/valid_edges)
-# 		x_values.append(burst_length)
-# 		#print(burst_parameter, valid_edges)
-
-# 	#print()
-# 	linestyle = None
-# 	if analyzer == "status_half":
-# 		linestyle = ':'
-# 	ax.plot(x_values, y_values,
-# 			label=label,
-# 			color = COLORS[i],
-# 			marker = MARKERS[i][0],
-# 			markersize = MARKERS[i][1],
-# 			markeredgecolor = COLORS[i],
-# 			markerfacecolor = (0,0,0,0),
-# 			linestyle = linestyle)
-
-# #ax.legend()
-# ax.set_xticks(X_TICKS)
-# ax.set_xlabel("Average burst length [packets]")
-# ax.set_ylabel("Edges sampled /\nvalid edges transmitted")
-# #ax.grid(True)
-# save_figure(f, "loss_burst_w20_effect_samples")
-
-##
-## Analyzer sample rate over various burst rates
-##
-
-RTT = 40e-3
-
-f, ax = plt.subplots(1)
-#ax.axhline(2, **GRIDLINEPROPS)
-
-for analyzer, label, i in analyzer_to_plot_half_rtt:
-	#analyzer, label = analyzers_to_plot_hack[i]
-	## First build the data series
-	y_values = list()
-	x_values = list()
-	for run, burst_parameter in runs_to_plot:
+def draw_ecdf(ax, spec, values):
+	#ax.axhline(0.5, **GRIDLINEPROPS)
+	ax.axvline(0, **GRIDLINEPROPS)
+
+	run_values, = values
+	for analyzer, label, i in spec.analyzers:
+		x_values, y_values = run_values[analyzer]
+		ax.plot(x_values, y_values,
+				label=label,
+				#linestyle = LINESTYLES[i],
+				color = COLORS[i],
+				marker = MARKERS[i][0],
+				markersize = MARKERS[i][1],
+				markeredgecolor = COLORS[i],
+				markerfacecolor = (0,0,0,0),
+				markevery = (spec.options['markevery_step']*i, 0.2))
+
+def draw_within(ax, spec, values):
+	ax.axhline(1, **GRIDLINEPROPS)
+
+	x_values = [x_value for run_dir, x_value in spec.runs]
+	for analyzer, label, i in spec.analyzers:
+		y_values = [run_values[analyzer] for run_values in values]
+		ax.plot(x_values, y_values,
+				label=label,
+				color = COLORS[i],
+				marker = MARKERS[i][0],
+				markersize = MARKERS[i][1],
+				markeredgecolor = COLORS[i],
+				markerfacecolor = (0,0,0,0))
+
+def draw_samples_per_rtt(ax, spec, values):
+	#ax.axhline(2, **GRIDLINEPROPS)
+
+	x_values = [x_value for run_dir, x_value in spec.runs]
+	for analyzer, label, i in spec.analyzers:
+		y_values = [run_values[analyzer] for run_values in values]
+
+		# only the half-RTT line is labeled, the others are in the ECDF legend
+		linestyle = None
 		if analyzer == "status_half":
-			sampled_edges =  count_vec_edges_observer(run, (2, 3), INTERVAL_OF_INTEREST)
+			linestyle = ':'
 		else:
-			sampled_edges = count_samples_observer(run, analyzer, INTERVAL_OF_INTEREST)
-
-		duration_s = INTERVAL_OF_INTEREST[1] - INTERVAL_OF_INTEREST[0]
-		duration_rtt = duration_s / RTT
-
-		burst_length = 1 / (burst_parameter / 100)
-
-		y_values.append(sampled_edges/duration_rtt)
-		x_values.append(burst_length)
-		#print(reorder_grade, valid_edges)
-
-	#print()
-	linestyle = None
-	if analyzer == "status_half":
-		linestyle = ':'
-	else:
-		label = None
-	ax.plot(x_values, y_values,
-			label = label,
-			color = COLORS[i],
-			marker = MARKERS[i][0],
-			markersize = MARKERS[i][1],
-			markeredgecolor = COLORS[i],
-			markerfacecolor = (0,0,0,0),
-			linestyle = linestyle)
-
-#y_ticks  = (0.3, 0.4, 0.5, 0.6, 0.7 , 0.8, 0.9, 2
-#y_labels = (0.3, 0.5,
-
-#ax.set_ytick(y_labels)
-#ax.set_yticklabels(y_labels)
-#ax.set_yscale('log')
-ax.set_ylim((None, 2.1))
-ax.legend(loc='lower left')
-#ax.set_xticks(x_values)
-ax.set_xlabel("Average burst length [packets]")
-ax.set_ylabel("Samples per RTT")
-#ax.grid(True)
-save_figure(f, "figure_4c")
\ No newline at end of file
+			label = None
+		ax.plot(x_values, y_values,
+				label = label,
+				color = COLORS[i],
+				marker = MARKERS[i][0],
+				markersize = MARKERS[i][1],
+				markeredgecolor = COLORS[i],
+				markerfacecolor = (0,0,0,0),
+				linestyle = linestyle)
+
+DRAW_FUNCTIONS = {
+	"ecdf": draw_ecdf,
+	"within": draw_within,
+	"samples_per_rtt": draw_samples_per_rtt,
+}
+
+def draw_figure(spec, values):
+	f, ax = plt.subplots(1)
+	DRAW_FUNCTIONS[spec.metric](ax, spec, values)
+
+	options = spec.options
+	if 'legend' in options:
+		ax.legend(loc=options['legend'])
+	if 'x_lim' in options:
+		ax.set_xlim(options['x_lim'])
+	if 'y_lim' in options:
+		ax.set_ylim(options['y_lim'])
+	if 'x_ticks' in options:
+		ax.set_xticks(options['x_ticks'])
+	if 'y_ticks' in options:
+		ax.set_yticks(options['y_ticks'])
+	ax.set_xlabel(options['x_label'])
+	ax.set_ylabel(options['y_label'])
+	#ax.grid(True)
+	save_figure(f, spec.name)
+
+def make_figures(names = None, jobs = None):
+	specs = [spec for spec in FIGURES if names == None or spec.name in names]
+	values = evaluate_figures(specs, jobs)
+	for spec in specs:
+		draw_figure(spec, values[spec.name])
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Generate figures 3 and 4 of the paper.")
+	parser.add_argument("figures", nargs='*', metavar="figure",
+			help="figures to generate, e.g. figure_4c (default: all)")
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+			help="number of runs loaded in parallel (default: number of CPUs)")
+	parser.add_argument("--list", action='store_true', help="list the figures and exit")
+	args = parser.parse_args()
+
+	figure_names = [spec.name for spec in FIGURES]
+	if args.list:
+		print("\n".join(figure_names))
+		sys.exit(0)
+	unknown = [x for x in args.figures if x not in figure_names]
+	if unknown:
+		parser.error("unknown figures: {}".format(", ".join(unknown)))
+
+	make_figures(args.figures or None, args.jobs)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import numpy as np
+
+## Counting measurement bytes (the spin/VEC byte of each packet).
+##
+## A MbyteCounter is built once from the time and measurement byte arrays
+## of an endpoint or of the observer. It keeps cumulative counts of valid
+## edges, double valid edges (this and the previous byte have the valid
+## edge bit set) and of every VEC value, so each query is two binary
+## searches on the times.
+##
+## As in the original loops, an interval (start, end) selects the bytes with
+## start < time < end, and no interval selects all bytes.
+
+VALID_EDGE_BIT = 0x01
+STATUS_MASK = 0x0c
+STATUS_SHIFT = 2
+NUM_VEC_VALUES = 4
+
+def _cumulative(flags):
+	counts = np.zeros(len(flags) + 1, dtype=np.int64)
+	np.cumsum(flags, out=counts[1:])
+	return counts
+
+class MbyteCounter:
+
+	def __init__(self, times, mbytes):
+		times = np.asarray(times, dtype=np.float64)
+		mbytes = np.asarray(mbytes).astype(np.uint8)
+
+		valid = (mbytes & VALID_EDGE_BIT) != 0
+		# "previous" is the previous byte in the order of the input
+		double_valid = np.zeros(len(mbytes), dtype=bool)
+		double_valid[1:] = valid[1:] & valid[:-1]
+		vec = (mbytes & STATUS_MASK) >> STATUS_SHIFT
+
+		if len(times) > 1 and np.any(times[1:] < times[:-1]):
+			order = np.argsort(times, kind='stable')
+			times = times[order]
+			valid = valid[order]
+			double_valid = double_valid[order]
+			vec = vec[order]
+
+		self.times = times
+		self.valid = _cumulative(valid)
+		self.double_valid = _cumulative(double_valid)
+		self.vec = [_cumulative(vec == value) for value in range(NUM_VEC_VALUES)]
+
+	def __len__(self):
+		return len(self.times)
+
+	def _bounds(self, interval):
+		if not interval:
+			return 0, len(self.times)
+		start = np.searchsorted(self.times, interval[0], side='right')
+		end = np.searchsorted(self.times, interval[1], side='left')
+		return start, max(start, end)
+
+	def count(self, interval = None):
+		start, end = self._bounds(interval)
+		return int(end - start)
+
+	def valid_edges(self, interval = None):
+		start, end = self._bounds(interval)
+		return int(self.valid[end] - self.valid[start])
+
+	def double_valid_edges(self, interval = None):
+		start, end = self._bounds(interval)
+		return int(self.double_valid[end] - self.double_valid[start])
+
+	def vec_edges(self, vec_values, interval = None):
+		# bytes with a VEC value in vec_values, e.g. (2, 3)
+		start, end = self._bounds(interval)
+		return sum(int(self.vec[value][end] - self.vec[value][start])
+				for value in set(vec_values) if 0 <= value < NUM_VEC_VALUES)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import collections
+import concurrent.futures
+import numpy as np
+
+import analyze_vpp
+
+## Accuracy metrics for many runs at once.
+##
+## accuracy_table() evaluates a metric for every combination of run,
+## analyzer, threshold and time window and returns the result as one dense
+## array of shape (runs, analyzers, thresholds, windows). The values come
+## from the ECDF indices of the runs (see ecdf_index.py), so each time
+## window of a run is sorted only once, however many thresholds are asked.
+##
+## Metrics:
+##   within:   fraction of errors with -|threshold| <= error <= |threshold|,
+##             as find_ecdf_y_value(+x) - find_ecdf_y_value(-x)
+##   cdf:      find_ecdf_y_value(threshold)
+##   quantile: the error at ECDF value threshold (0..1)
+##   count:    number of error samples, independent of the threshold
+##
+## Analyzers a run does not have give NaN.
+##
+## flow_metrics() evaluates the same metrics per flow of a run with several
+## connections (see flow_index.py), run_metrics() of the run is the
+## aggregate over all of its flows.
+
+METRICS = ("within", "cdf", "quantile", "count")
+
+MetricTable = collections.namedtuple("MetricTable",
+		("values", "metric", "runs", "analyzers", "thresholds", "windows"))
+
+def run_metrics(run, analyzers, thresholds, windows = (None,), metric = "within"):
+	# the (analyzers, thresholds, windows) slab of a single run
+	if metric not in METRICS:
+		raise ValueError("Unknown metric: {}".format(metric))
+
+	thresholds = np.asarray(thresholds, dtype=np.float64)
+	values = np.full((len(analyzers), len(thresholds), len(windows)), np.nan)
+	for a, analyzer in enumerate(analyzers):
+		if analyzer not in run.analyzers:
+			continue
+		index = run.ecdf_index(analyzer)
+		for w, window in enumerate(windows):
+			if metric == "within":
+				values[a, :, w] = index.fraction_within(thresholds, window)
+			elif metric == "cdf":
+				values[a, :, w] = index.cdf(thresholds, window)
+			elif metric == "quantile":
+				values[a, :, w] = index.quantile(thresholds, window)
+			else:
+				values[a, :, w] = index.count(window)
+	return values
+
+def flow_metrics(run, analyzers, thresholds, windows = (None,), metric = "within"):
+	# (flow ids, array of shape (flows, analyzers, thresholds, windows))
+	flow_ids = run.flow_ids()
+	values = np.full((len(flow_ids), len(analyzers), np.size(thresholds), len(windows)), np.nan)
+	for f, flow_id in enumerate(flow_ids):
+		values[f] = run_metrics(run.flow_run(flow_id), analyzers, thresholds, windows, metric)
+	return flow_ids, values
+
+def _load_run_metrics(path, analyzers, thresholds, windows, metric):
+	# runs in a worker process, only the small result array is sent back
+	run = analyze_vpp.analyze_run(path, use_cache=True, analyzers=analyzers)
+	if not run:
+		return np.full((len(analyzers), len(thresholds), len(windows)), np.nan)
+	return run_metrics(run, analyzers, thresholds, windows, metric)
+
+def accuracy_table(runs, analyzers, thresholds, windows = (None,), metric = "within",
+		jobs = 1):
+	# runs: Run objects, or run directories which are then loaded (through
+	# the run cache) in jobs worker processes
+	analyzers = list(analyzers)
+	thresholds = np.asarray(thresholds, dtype=np.float64).reshape(-1)
+	windows = list(windows)
+	values = np.full((len(runs), len(analyzers), len(thresholds), len(windows)), np.nan)
+
+	paths = [(r, run) for r, run in enumerate(runs) if isinstance(run, str)]
+	for r, run in enumerate(runs):
+		if not isinstance(run, str) and run:
+			values[r] = run_metrics(run, analyzers, thresholds, windows, metric)
+
+	if paths and jobs == 1:
+		for r, path in paths:
+			values[r] = _load_run_metrics(path, analyzers, thresholds, windows, metric)
+	elif paths:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+			futures = {executor.submit(_load_run_metrics, path, analyzers,
+					thresholds, windows, metric): r for r, path in paths}
+			for future in concurrent.futures.as_completed(futures):
+				values[futures[future]] = future.result()
+
+	return MetricTable(values, metric, list(runs), analyzers, thresholds, windows)
+
+def table_records(table):
+	# flatten a MetricTable into one dict per cell
+	for index, value in np.ndenumerate(table.values):
+		r, a, t, w = index
+		run = table.runs[r]
+		if run and not isinstance(run, str):
+			run = run['dir_name']
+		yield {
+			'run': run,
+			'analyzer': table.analyzers[a],
+			'threshold': float(table.thresholds[t]),
+			'window': table.windows[w],
+			table.metric: float(value),
+		}
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import collections
+import struct
+
+## Minimal pcap / pcapng reader, standard library only.
+##
+## Only the record framing and timestamps are decoded, the packet bytes are
+## handed out as is. Importing this module is instantaneous, unlike scapy,
+## so scripts that only need the capture start time do not pay for scapy.
+
+PcapRecord = collections.namedtuple("PcapRecord", ("time", "caplen", "wirelen", "linktype", "data"))
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_EPB = 0x00000006
+
+IF_TSRESOL = 9
+IF_TSOFFSET = 14
+
+class PcapError(Exception):
+	pass
+
+def _read_exact(pcap_file, size):
+	data = pcap_file.read(size)
+	if len(data) != size:
+		return None
+	return data
+
+def _pcap_records(pcap_file, header):
+	for endian in ('<', '>'):
+		magic, = struct.unpack(endian + 'I', header[:4])
+		if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+			break
+	else:
+		raise PcapError("Not a pcap file")
+
+	resolution = 1e6 if magic == PCAP_MAGIC_US else 1e9
+	linktype, = struct.unpack(endian + 'I', header[20:24])
+	record_header = struct.Struct(endian + 'IIII')
+
+	while True:
+		raw = _read_exact(pcap_file, record_header.size)
+		if raw == None:
+			return
+		ts_sec, ts_frac, caplen, wirelen = record_header.unpack(raw)
+		data = _read_exact(pcap_file, caplen)
+		if data == None:
+			# truncated capture, e.g. tcpdump still running
+			return
+		yield PcapRecord(ts_sec + ts_frac / resolution, caplen, wirelen, linktype, data)
+
+def _pcapng_options(body, endian):
+	options = dict()
+	offset = 0
+	while offset + 4 <= len(body):
+		code, length = struct.unpack_from(endian + 'HH', body, offset)
+		offset += 4
+		if code == 0:
+			break
+		options[code] = body[offset:offset + length]
+		offset += (length + 3) & ~3
+	return options
+
+def _pcapng_records(pcap_file, header):
+	endian = '<'
+	interfaces = list()
+
+	block = header
+	while True:
+		if block == None or len(block) < 8:
+			return
+
+		# the section header block type reads the same in both byte orders
+		block_type, = struct.unpack(endian + 'I', block[:4])
+		if block_type == PCAPNG_SHB:
+			raw = _read_exact(pcap_file, 4)
+			if raw == None:
+				return
+			block = block + raw
+			magic, = struct.unpack('<I', raw)
+			endian = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+			# interface ids are per section
+			interfaces = list()
+
+		block_length, = struct.unpack(endian + 'I', block[4:8])
+		if block_length < 12:
+			raise PcapError("Corrupt pcapng block")
+		rest = _read_exact(pcap_file, block_length - len(block))
+		if rest == None:
+			return
+		body = (block + rest)[8:-4]
+
+		if block_type == PCAPNG_IDB:
+			linktype, = struct.unpack_from(endian + 'H', body, 0)
+			options = _pcapng_options(body[8:], endian)
+			resolution = 10 ** 6
+			if IF_TSRESOL in options:
+				tsresol = options[IF_TSRESOL][0]
+				if tsresol & 0x80:
+					resolution = 2 ** (tsresol & 0x7f)
+				else:
+					resolution = 10 ** tsresol
+			offset = 0
+			if IF_TSOFFSET in options:
+				offset, = struct.unpack(endian + 'q', options[IF_TSOFFSET][:8])
+			interfaces.append((linktype, resolution, offset))
+
+		elif block_type in (PCAPNG_EPB, PCAPNG_OPB):
+			if block_type == PCAPNG_EPB:
+				interface, ts_high, ts_low, caplen, wirelen = \
+						struct.unpack_from(endian + 'IIIII', body, 0)
+			else:
+				interface, _, ts_high, ts_low, caplen, wirelen = \
+						struct.unpack_from(endian + 'HHIIII', body, 0)
+			linktype, resolution, offset = interfaces[interface]
+			seconds, fraction = divmod((ts_high << 32) | ts_low, resolution)
+			time = offset + seconds + fraction / resolution
+			yield PcapRecord(time, caplen, wirelen, linktype, body[20:20 + caplen])
+
+		block = _read_exact(pcap_file, 8)
+
+def read_records(path, count = None):
+	with open(path, 'rb') as pcap_file:
+		header = _read_exact(pcap_file, 24)
+		if header == None:
+			return
+
+		magic, = struct.unpack('<I', header[:4])
+		if magic == PCAPNG_SHB:
+			records = _pcapng_records(pcap_file, header[:8])
+			# the rest of the header belongs to the first block
+			pcap_file.seek(8)
+		else:
+			records = _pcap_records(pcap_file, header)
+
+		for i, record in enumerate(records):
+			if count != None and i >= count:
+				return
+			yield record
+
+def first_timestamp(path):
+	for record in read_records(path, count=1):
+		return record.time
+	raise PcapError("No packets in {}".format(path))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import numpy as np
+
+import run_data
+
+## On disk cache of analyzed runs.
+##
+## A cached run is stored as an uncompressed npz file (one .npy member per
+## column) in <run directory>/analysis_cache/<key>.npz. The key is a hash of
+## SCHEMA_VERSION, the analysis parameters and a fingerprint of every input
+## file: its name, size, modification time and a hash of its first and last
+## FINGERPRINT_BYTES bytes. Touching or rewriting an input file, or bumping
+## SCHEMA_VERSION, gives a new key, so stale entries are never loaded.
+##
+## Bump SCHEMA_VERSION whenever analyze_run changes what ends up in a Run.
+
+SCHEMA_VERSION = 3
+CACHE_DIR = "analysis_cache"
+FINGERPRINT_BYTES = 1024 * 1024
+
+# Everything analyze_run reads, files that do not exist are fingerprinted as missing
+INPUT_FILES = (
+	"randID",
+	"switch-2_vpp_resync.csv",
+	"switch-2_vpp.csv",
+	"switch-2_tcpdump.pcap",
+	"switch-2_mbytes.csv",
+	"client-0_minq_stderr.txt",
+	"server-0_minq_stderr.txt",
+	"client-0_ping_stdout.txt",
+)
+
+def file_fingerprint(path):
+	try:
+		stat = os.stat(path)
+	except FileNotFoundError:
+		return None
+
+	digest = hashlib.sha1()
+	with open(path, 'rb') as input_file:
+		digest.update(input_file.read(FINGERPRINT_BYTES))
+		if stat.st_size > FINGERPRINT_BYTES:
+			input_file.seek(max(FINGERPRINT_BYTES, stat.st_size - FINGERPRINT_BYTES))
+			digest.update(input_file.read(FINGERPRINT_BYTES))
+
+	return [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+
+def cache_key(base_path, parameters = None, input_files = INPUT_FILES):
+	description = {
+		'schema': SCHEMA_VERSION,
+		'parameters': parameters,
+		'inputs': {name: file_fingerprint(os.path.join(base_path, name))
+				for name in input_files},
+	}
+	encoded = json.dumps(description, sort_keys=True).encode()
+	return hashlib.sha1(encoded).hexdigest()
+
+def cache_path(base_path, key):
+	return os.path.join(base_path, CACHE_DIR, key + ".npz")
+
+def load(base_path, key, analyzer_names = None):
+	# only the analyzer columns in analyzer_names (default: all) are read
+	path = cache_path(base_path, key)
+	try:
+		with np.load(path, allow_pickle=False) as arrays:
+			run = run_data.Run.from_arrays(arrays, analyzer_names)
+	except FileNotFoundError:
+		return None
+	except (OSError, ValueError, KeyError) as error:
+		print("\tIgnoring unreadable cache file {}: {}".format(path, error))
+		return None
+
+	# the directory might have moved since the run was cached
+	run['base_path'] = base_path
+	return run
+
+def store(base_path, key, run):
+	cache_dir = os.path.join(base_path, CACHE_DIR)
+	os.makedirs(cache_dir, exist_ok=True)
+
+	# write to a temporary file first, readers never see a partial file
+	fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+	try:
+		with os.fdopen(fd, 'wb') as tmp_file:
+			np.savez(tmp_file, **run.to_arrays())
+		os.replace(tmp_path, cache_path(base_path, key))
+	except:
+		os.unlink(tmp_path)
+		raise
+
+	# entries for other keys are stale
+	for name in os.listdir(cache_dir):
+		if name.endswith(".npz") and name != key + ".npz":
+			os.unlink(os.path.join(cache_dir, name))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+import collections.abc
+import json
+import numpy as np
+
+import ecdf_index
+import flow_index
+import mbyte_counters
+
+## Columnar in-memory representation of an analyzed measurement run.
+##
+## Every VPP sample is a row, every field is a numpy column. Analyzer
+## columns hold the RTT estimate in ms for rows where the analyzer reported
+## a new sample and NaN everywhere else. Truth columns hold the endpoint and
+## ping RTTs interpolated to the sample times, errors are relative to the
+## client truth column.
+##
+## The optional flow column holds the VPP flow number of each row (see
+## flow_index.py), runs without it have a single flow 0. flow_run() gives
+## the rows of one flow as a Run of its own, so every per run metric can be
+## computed per flow as well; the run itself is the aggregate of its flows.
+##
+## Run behaves like the dict analyze_run used to return, so run['dir_name'],
+## "{dir_name}".format(**run) and run['vpp_data'][i]['basic'] keep working.
+##
+## to_arrays() / Run.from_arrays() convert a run to and from a flat dict of
+## numpy arrays, which is what run_cache.py stores on disk. The memoized
+## windows of the ECDF indices (see ecdf_index.py) are stored as well.
+
+HOST_NAMES = ("client", "server")
+
+def host_code(host_name):
+	return HOST_NAMES.index(host_name.strip())
+
+class Run(collections.abc.Mapping):
+
+	def __init__(self, time, packet_number, host, analyzers, truth, flow = None, **info):
+		self.time = np.asarray(time, dtype=np.float64)
+		self.packet_number = np.asarray(packet_number, dtype=np.int64)
+		self.host = np.asarray(host, dtype=np.uint8)
+		self.flow = None if flow is None else np.asarray(flow, dtype=np.int64)
+		self.analyzers = {name: np.asarray(values, dtype=np.float64)
+				for name, values in analyzers.items()}
+		self.truth = {name: np.asarray(values, dtype=np.float64)
+				for name, values in truth.items()}
+		self.client = self.truth['client']
+		self.errors = {name: values - self.client
+				for name, values in self.analyzers.items()}
+		self.info = info
+		self.ecdf_indices = dict()
+		self.mbyte_counters = dict()
+		self._flow_index = None
+
+	def __len__(self):
+		return len(self.info) + 1
+
+	def __iter__(self):
+		yield 'vpp_data'
+		yield from self.info
+
+	def __getitem__(self, key):
+		if key == 'vpp_data':
+			return VppDataView(self)
+		return self.info[key]
+
+	def __setitem__(self, key, value):
+		self.info[key] = value
+
+	@property
+	def num_samples(self):
+		return len(self.time)
+
+	def window_mask(self, time_window = None):
+		if time_window == None:
+			return np.ones(len(self.time), dtype=bool)
+		return (self.time >= time_window[0]) & (self.time < time_window[1])
+
+	def samples(self, analyzer_name, time_window = None):
+		values = self.analyzers[analyzer_name]
+		mask = ~np.isnan(values) & self.window_mask(time_window)
+		return self.time[mask], values[mask]
+
+	def rejected_times(self, analyzer_name):
+		return self.time[np.isnan(self.analyzers[analyzer_name])]
+
+	def error_samples(self, analyzer_name, time_window = None):
+		errors = self.errors[analyzer_name]
+		mask = ~np.isnan(errors) & self.window_mask(time_window)
+		return errors[mask]
+
+	def ecdf_index(self, analyzer_name):
+		if analyzer_name not in self.ecdf_indices:
+			self.ecdf_indices[analyzer_name] = ecdf_index.EcdfIndex(
+					self.time, self.errors[analyzer_name])
+		return self.ecdf_indices[analyzer_name]
+
+	def flow_index(self):
+		if self._flow_index == None:
+			if self.flow is None:
+				self._flow_index = flow_index.FlowIndex.single(len(self.time))
+			else:
+				self._flow_index = flow_index.FlowIndex(self.flow)
+		return self._flow_index
+
+	def flow_ids(self):
+		return list(self.flow_index())
+
+	def flow_run(self, flow_id):
+		# the rows of one flow, sharing the endpoint data (info) of the run
+		rows = self.flow_index().rows(flow_id)
+		flow = None if self.flow is None else self.flow[rows]
+		run = Run(self.time[rows], self.packet_number[rows], self.host[rows],
+				{name: values[rows] for name, values in self.analyzers.items()},
+				{name: values[rows] for name, values in self.truth.items()},
+				flow, **self.info)
+		run.mbyte_counters = self.mbyte_counters
+		return run
+
+	def mbyte_counter(self, source):
+		# source: "client", "server" or "observer", see mbyte_counters.py
+		if source not in self.mbyte_counters:
+			self.mbyte_counters[source] = mbyte_counters.MbyteCounter(
+					self.info[source + '_mtimes'], self.info[source + '_mbytes'])
+		return self.mbyte_counters[source]
+
+	def select(self, analyzer_names):
+		# drop the columns of all other analyzers
+		for name in list(self.analyzers):
+			if name not in analyzer_names:
+				del self.analyzers[name]
+				del self.errors[name]
+				self.ecdf_indices.pop(name, None)
+
+	def nbytes(self):
+		total = self.time.nbytes + self.packet_number.nbytes + self.host.nbytes
+		if self.flow is not None:
+			total += self.flow.nbytes
+		total += sum(x.nbytes for x in self.truth.values())
+		total += sum(x.nbytes for x in self.analyzers.values())
+		total += sum(x.nbytes for x in self.errors.values())
+		return total
+
+	def to_arrays(self):
+		arrays = {
+			'time': self.time,
+			'packet_number': self.packet_number,
+			'host': self.host,
+		}
+		if self.flow is not None:
+			arrays['flow'] = self.flow
+		for name, values in self.analyzers.items():
+			arrays['analyzers/' + name] = values
+		for name, values in self.truth.items():
+			arrays['truth/' + name] = values
+		for name, index in self.ecdf_indices.items():
+			for key, values in index.windows.items():
+				window = 'all' if key == None else '{!r}/{!r}'.format(*key)
+				arrays['ecdf/{}/{}'.format(name, window)] = values
+
+		# numpy arrays are stored as arrays, everything else (names, paths,
+		# scalars) goes into a json document
+		meta = dict()
+		for key, value in self.info.items():
+			if isinstance(value, np.ndarray):
+				arrays['info/' + key] = value
+			else:
+				meta[key] = value
+		# keep the column order, dicts in npz files are unordered
+		meta['__order__'] = {
+			'analyzers': list(self.analyzers),
+			'truth': list(self.truth),
+			'info': list(self.info),
+		}
+		arrays['meta'] = np.array(json.dumps(meta))
+		return arrays
+
+	@classmethod
+	def from_arrays(cls, arrays, analyzer_names = None):
+		# arrays can be a lazy mapping (e.g. an npz file), only the columns of
+		# the analyzers in analyzer_names (default: all) are accessed
+		meta = json.loads(str(arrays['meta']))
+		order = meta.pop('__order__')
+
+		if analyzer_names == None:
+			analyzer_names = order['analyzers']
+		analyzers = {name: arrays['analyzers/' + name] for name in order['analyzers']
+				if name in analyzer_names}
+		truth = {name: arrays['truth/' + name] for name in order['truth']}
+
+		ecdf_windows = collections.defaultdict(dict)
+		for name in arrays:
+			if name.startswith('ecdf/'):
+				_, analyzer_name, window = name.split('/', 2)
+				if analyzer_name in analyzers:
+					key = None if window == 'all' else tuple(float(x) for x in window.split('/'))
+					ecdf_windows[analyzer_name][key] = arrays[name]
+
+		info = dict()
+		for key in order['info']:
+			if key in meta:
+				info[key] = meta[key]
+			else:
+				info[key] = arrays['info/' + key]
+
+		flow = arrays['flow'] if 'flow' in arrays else None
+		run = cls(arrays['time'], arrays['packet_number'], arrays['host'],
+				analyzers, truth, flow, **info)
+		for name, windows in ecdf_windows.items():
+			run.ecdf_indices[name] = ecdf_index.EcdfIndex(run.time, run.errors[name], windows)
+		return run
+
+###
+### Compatibility views, emulating the old list of defaultdicts
+###
+
+def _none_if_nan(value):
+	value = float(value)
+	if value != value:
+		return None
+	return value
+
+class VppDataView(collections.abc.Sequence):
+
+	def __init__(self, run):
+		self.run = run
+
+	def __len__(self):
+		return len(self.run.time)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [VppRow(self.run, i) for i in range(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError(index)
+		return VppRow(self.run, index)
+
+class VppRow(collections.abc.Mapping):
+
+	def __init__(self, run, index):
+		self.run = run
+		self.index = index
+
+	def keys(self):
+		keys = ['time', 'packet_number', 'host']
+		keys.extend(self.run.truth)
+		for name in self.run.analyzers:
+			if not np.isnan(self.run.analyzers[name][self.index]):
+				keys.append(name)
+				keys.append(name + '_error')
+		return keys
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __contains__(self, key):
+		return key in self.keys()
+
+	# Like the defaultdict it replaces, unknown keys map to None.
+	def __getitem__(self, key):
+		run = self.run
+		i = self.index
+		if key == 'time':
+			return float(run.time[i])
+		if key == 'packet_number':
+			return int(run.packet_number[i])
+		if key == 'host':
+			return HOST_NAMES[run.host[i]]
+		if key in run.truth:
+			return _none_if_nan(run.truth[key][i])
+		if key in run.analyzers:
+			return _none_if_nan(run.analyzers[key][i])
+		if key.endswith('_error') and key[:-len('_error')] in run.errors:
+			return _none_if_nan(run.errors[key[:-len('_error')]][i])
+		return None
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import os.path
+import sys
+import numpy as np
+
+import flow_index
+import pcap_packets
+import vpp_columns
+
+## Python reference of the QUIC spin bit observers of the VPP plugin.
+## Call as: spin_observers.py path/to/run/ [-o observers.csv] [--validate]
+##
+## Replays switch-2_tcpdump.pcap through the observers of
+## vpp/spinbit-plugin/spinbit/spinbit.c and writes the CSV VPP would write
+## (/tmp/spinbit_quic_printf.out, the switch-2_vpp.csv of a run). New
+## observer variants can then be tried offline, without a VPP deployment.
+##
+## The plugin has the basic, pn, status (VEC) and dynamic heuristic
+## (rel_heur) observers; the other columns of the VPP CSVs in the dataset
+## (valid, two_bit, stat_heur, ...) come from plugin versions that are not
+## in this repository and are not reproduced.
+##
+## Instead of running the observers packet by packet, each direction of
+## each flow is handled as a whole: spin edges are where the spin bit
+## differs from the previous packet, RTTs are differences of edge times.
+## Only the pn observer with reordered packet numbers and the acceptance
+## test of the heuristic, which depends on earlier decisions, are loops
+## (over the packets of a direction resp. its spin edges only).
+##
+## As in the plugin, a row is printed for a packet if it updated at least
+## one observer. The row then holds the estimates and new flags of the
+## *other* direction of the flow, labelled with the other host, and the new
+## flags of that direction are cleared. Times are the capture timestamps,
+## the flow column numbers the flows in the order they were created.
+
+QUIC_PORT = 4433
+# the plugin only creates a flow for a packet towards a configured server port
+SERVER_PORTS = (QUIC_PORT,)
+
+ANALYZERS = ("basic", "pn", "status", "rel_heur")
+CSV_HEADER = ["time", "pn", "host"] + ["{}_{}".format(analyzer, column)
+		for analyzer in ANALYZERS for column in ("data", "new")] + ["flow"]
+
+TIME_PRECISION = 8
+RTT_PRECISION = 4
+
+# measurement byte
+ONE_BIT_SPIN = 0x40
+STATUS_MASK = 0x0c
+STATUS_SHIFT = 2
+STATUS_INVALID = 0
+STATUS_VALID = 3
+
+DYNA_HEUR_THRESHOLD = 0.1
+DYNA_HEUR_HISTORY_SIZE = 10
+DYNA_HEUR_MAX_REJECT = 5
+
+###
+### Reading the QUIC packets
+###
+
+def read_quic_packets(pcap_path, quic_ports = (QUIC_PORT,)):
+	# the QUIC packets in capture order, as dict of arrays, see pcap_packets.py
+	packets = pcap_packets.read_packets(pcap_path, quic_ports)
+	is_quic = packets['is_quic']
+	return {key: packets[key][is_quic] for key in ("time", "src_ip", "dst_ip",
+			"src_port", "dst_port", "pn", "measurement")}
+
+###
+### The observers, for the packets of one direction of one flow
+###
+### Each returns (updated, rtts): per packet, whether the observer reported
+### a new RTT, and that RTT in seconds (NaN where not updated).
+###
+
+def spin_edges(spins):
+	# the spin of the first packet differs from SPIN_NOT_KNOWN
+	edges = np.ones(len(spins), dtype=bool)
+	edges[1:] = spins[1:] != spins[:-1]
+	return edges
+
+def _edge_rtts(times, edges):
+	# time since the previous edge, the first edge is measured from time 0
+	rtts = np.full(len(times), np.nan)
+	edge_times = times[edges]
+	rtts[edges] = edge_times - np.concatenate(([0.0], edge_times[:-1]))
+	return rtts
+
+def basic_observer(times, spins):
+	edges = spin_edges(spins)
+	return edges, _edge_rtts(times, edges)
+
+def pn_observer(times, spins, packet_numbers):
+	# An edge is only accepted with a packet number above the one of the
+	# last accepted edge. Packets with packet number 0 are not looked at.
+	updated = np.zeros(len(times), dtype=bool)
+	rtts = np.full(len(times), np.nan)
+	candidates = np.flatnonzero(packet_numbers != 0)
+	candidate_pns = packet_numbers[candidates]
+
+	if np.all(candidate_pns[1:] > candidate_pns[:-1]):
+		# in order, every spin change is above the last accepted edge
+		edges = spin_edges(spins[candidates])
+		updated[candidates[edges]] = True
+		rtts[candidates] = _edge_rtts(times[candidates], edges)
+		return updated, rtts
+
+	spin_state = None
+	pn_state = 0
+	last_time = 0.0
+	for i, spin, packet_number in zip(candidates.tolist(),
+			spins[candidates].tolist(), candidate_pns.tolist()):
+		if packet_number > pn_state and spin != spin_state:
+			spin_state = spin
+			pn_state = packet_number
+			rtts[i] = times[i] - last_time
+			updated[i] = True
+			last_time = times[i]
+	return updated, rtts
+
+def status_observer(times, spins, status):
+	# A spin edge is reported if its VEC is VALID, measured from the last
+	# packet with a VEC other than INVALID (normally the previous edge).
+	edges = spin_edges(spins)
+	updated = edges & (status == STATUS_VALID)
+
+	marked = np.where(status != STATUS_INVALID, np.arange(len(times)), -1)
+	last_marked = np.maximum.accumulate(marked) if len(marked) else marked
+	previous = np.concatenate(([-1], last_marked[:-1]))
+	previous_times = np.where(previous >= 0, times[np.maximum(previous, 0)], 0.0)
+
+	rtts = np.full(len(times), np.nan)
+	rtts[updated] = times[updated] - previous_times[updated]
+	return updated, rtts
+
+def heuristic_observer(times, spins):
+	# An edge is accepted if it is more than DYNA_HEUR_THRESHOLD times the
+	# smallest of the last DYNA_HEUR_HISTORY_SIZE RTTs after the last
+	# accepted edge, or after DYNA_HEUR_MAX_REJECT rejections in a row.
+	updated = np.zeros(len(times), dtype=bool)
+	rtts = np.full(len(times), np.nan)
+
+	history = [0.0] * DYNA_HEUR_HISTORY_SIZE
+	index = 0
+	rejected = 0
+	last_time = 0.0
+	edges = np.flatnonzero(spin_edges(spins))
+	for i, now in zip(edges.tolist(), times[edges].tolist()):
+		candidate = now - last_time
+		if candidate > min(history) * DYNA_HEUR_THRESHOLD or rejected >= DYNA_HEUR_MAX_REJECT:
+			rejected = 0
+			index = (index + 1) % DYNA_HEUR_HISTORY_SIZE
+			history[index] = candidate
+			updated[i] = True
+			rtts[i] = candidate
+			last_time = now
+		else:
+			rejected += 1
+	return updated, rtts
+
+def observe_direction(times, measurements, packet_numbers):
+	# (updated, rtts) of shape (packets, ANALYZERS)
+	spins = (measurements & ONE_BIT_SPIN) != 0
+	status = (measurements & STATUS_MASK) >> STATUS_SHIFT
+	results = (
+		basic_observer(times, spins),
+		pn_observer(times, spins, packet_numbers),
+		status_observer(times, spins, status),
+		heuristic_observer(times, spins),
+	)
+	updated = np.stack([x[0] for x in results], axis=1)
+	rtts = np.stack([x[1] for x in results], axis=1)
+	return updated, rtts
+
+###
+### Flows and CSV rows
+###
+
+def assign_flows(packets, server_ports = SERVER_PORTS):
+	# Flow number per packet (-1: not observed) and whether it was sent by the
+	# flow initiator. As in the plugin, both directions share a key (XOR of
+	# the addresses and of the ports) and a flow starts with the first
+	# packet towards a server port.
+	keys = (packets['src_ip'].astype(np.uint64) ^ packets['dst_ip']) << np.uint64(16) | \
+			(packets['src_port'] ^ packets['dst_port']).astype(np.uint64)
+	_, flow_ids = np.unique(keys, return_inverse=True)
+	flow_ids = flow_ids.reshape(-1)
+
+	opens = np.isin(packets['dst_port'], server_ports)
+	num_flows = flow_ids.max() + 1 if len(flow_ids) else 0
+	first_open = np.full(num_flows, len(flow_ids))
+	np.minimum.at(first_open, flow_ids[opens], np.flatnonzero(opens))
+
+	flows = np.where(np.arange(len(flow_ids)) >= first_open[flow_ids], flow_ids, -1)
+	initiator_ports = np.zeros(num_flows, dtype=packets['src_port'].dtype)
+	started = first_open < len(flow_ids)
+	initiator_ports[started] = packets['src_port'][first_open[started]]
+	from_initiator = packets['src_port'] == initiator_ports[np.maximum(flows, 0)]
+
+	# numbered in the order the plugin creates the flows
+	number = np.full(num_flows, -1)
+	started_flows = np.flatnonzero(started)
+	number[started_flows[np.argsort(first_open[started_flows])]] = np.arange(len(started_flows))
+	flows = np.where(flows >= 0, number[np.maximum(flows, 0)], -1)
+	return flows, from_initiator
+
+def observe(packets, server_ports = SERVER_PORTS):
+	# The CSV rows of all flows, as dict of columns in CSV_HEADER order.
+	# host is the host name string.
+	flows, from_initiator = assign_flows(packets, server_ports)
+	num_packets = len(flows)
+	updated = np.zeros((num_packets, len(ANALYZERS)), dtype=bool)
+	rtts = np.full((num_packets, len(ANALYZERS)), np.nan)
+
+	groups = flow_index.FlowIndex(np.where(flows >= 0, flows * 2 + from_initiator, -1))
+	for group in groups:
+		if group < 0:
+			continue
+		members = groups.rows(group)
+		updated[members], rtts[members] = observe_direction(packets['time'][members],
+				packets['measurement'][members], packets['pn'][members])
+
+	rows = np.flatnonzero(updated.any(axis=1))
+	data = np.zeros((len(rows), len(ANALYZERS)))
+	new = np.zeros((len(rows), len(ANALYZERS)), dtype=np.uint8)
+
+	# a row shows the other direction: its last RTT and whether it updated
+	# since the previous row printed for a packet of this direction
+	packet_flows = flow_index.FlowIndex(flows)
+	row_flows = flow_index.FlowIndex(flows[rows])
+	for flow in row_flows:
+		in_flow = packet_flows.rows(flow)
+		flow_rows = row_flows.rows(flow)
+		row_positions = np.searchsorted(in_flow, rows[flow_rows])
+		for direction in (False, True):
+			own = from_initiator[rows[flow_rows]] == direction
+			other = from_initiator[in_flow] != direction
+			other_updated = updated[in_flow] & other[:, None]
+			counts = np.cumsum(other_updated, axis=0)[row_positions[own]]
+			previous_counts = np.concatenate((np.zeros((1, len(ANALYZERS)), dtype=np.int64), counts[:-1]))
+			new[flow_rows[own]] = counts > previous_counts
+
+			last_update = np.where(other_updated, np.arange(len(in_flow))[:, None], -1)
+			last_update = np.maximum.accumulate(last_update, axis=0)[row_positions[own]]
+			values = rtts[in_flow][np.maximum(last_update, 0), np.arange(len(ANALYZERS))]
+			data[flow_rows[own]] = np.where(last_update >= 0, values, 0.0)
+
+	columns = collections.OrderedDict()
+	columns['time'] = packets['time'][rows]
+	columns['pn'] = packets['pn'][rows]
+	columns['host'] = np.where(from_initiator[rows], "server", "client")
+	for a, analyzer in enumerate(ANALYZERS):
+		columns[analyzer + "_data"] = data[:, a]
+		columns[analyzer + "_new"] = new[:, a]
+	columns['flow'] = flows[rows]
+	return columns
+
+def write_csv(columns, path):
+	formats = ["{:.%df}" % TIME_PRECISION, "{}", "{}"] + \
+			["{:.%df}" % RTT_PRECISION, "{}"] * len(ANALYZERS) + ["{}"]
+	line = ",".join(formats) + "\n"
+	with open(path, 'w') as csv_file:
+		csv_file.write(",".join(CSV_HEADER) + "\n")
+		for row in zip(*(columns[name].tolist() for name in CSV_HEADER)):
+			csv_file.write(line.format(*row))
+
+###
+### Validation against the output of VPP
+###
+
+def validate(columns, csv_path, tolerance = 1e-3):
+	# Compare with a VPP CSV: the rows are matched in order, the RTTs may
+	# differ by tolerance seconds since VPP uses its own clock. Returns
+	# {analyzer: (rows compared, new flags differing, RTTs differing)}.
+	reference = vpp_columns.read_csv(csv_path)
+	rows = min(len(reference['time']), len(columns['time']))
+	if len(reference['time']) != len(columns['time']):
+		print("\tRow count differs: {} in {}, {} replayed".format(
+				len(reference['time']), csv_path, len(columns['time'])))
+
+	mismatched_pns = np.count_nonzero(reference['pn'][:rows] != columns['pn'][:rows])
+	if mismatched_pns:
+		print("\t{} rows with a different packet number".format(mismatched_pns))
+
+	result = collections.OrderedDict()
+	for analyzer in ANALYZERS:
+		if analyzer + "_data" not in reference:
+			continue
+		reference_new = reference[analyzer + "_new"][:rows] == 1
+		new = columns[analyzer + "_new"][:rows] == 1
+		both = reference_new & new
+		rtt_differs = np.abs(reference[analyzer + "_data"][:rows][both] -
+				columns[analyzer + "_data"][:rows][both]) > tolerance
+		result[analyzer] = (rows, int(np.count_nonzero(reference_new != new)),
+				int(np.count_nonzero(rtt_differs)))
+	return result
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay a capture through the spin bit observers.")
+	parser.add_argument("path", help="run directory")
+	parser.add_argument("-o", "--output", default=None,
+			help="CSV file to write (default: RUN/switch-2_observers.csv)")
+	parser.add_argument("--validate", action="store_true",
+			help="compare with the switch-2_vpp.csv of the run")
+	args = parser.parse_args()
+
+	packets = read_quic_packets(os.path.join(args.path, "switch-2_tcpdump.pcap"))
+	columns = observe(packets)
+	output = args.output or os.path.join(args.path, "switch-2_observers.csv")
+	write_csv(columns, output)
+	print("{} packets, {} rows written to {}".format(len(packets['time']), len(columns['time']), output))
+
+	if args.validate:
+		for analyzer, (rows, new_differs, rtt_differs) in validate(columns,
+				os.path.join(args.path, "switch-2_vpp.csv")).items():
+			print("\t{:<10} {} rows, {} new flags differ, {} RTTs differ".format(
+					analyzer, rows, new_differs, rtt_differs))
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import inspect
+import io
+import json
+import os
+import os.path
+import sys
+import tempfile
+import numpy as np
+
+import analyze_dataset
+import analyze_vpp
+import ecdf_index
+import run_cache
+
+## Summary table of the whole QUIC dataset.
+## Call as: summarize_dataset.py [path/to/data/] [-j JOBS] [--csv summary.csv]
+##
+## One row per run x analyzer x phase, with sample counts, samples per RTT,
+## error quantiles and the fraction of errors within a few thresholds. The
+## table is stored as columns in an npz file in the data directory. Runs
+## whose data fingerprint did not change since the last build are not
+## analyzed again, as long as the summary version did not change either:
+## SUMMARY_VERSION, the run cache schema and the source of the code that
+## computes the rows (see summary_version()).
+##
+## Phases: each measurement has 80 s without impairments followed by 80 s
+## with the impairments under test; "cutout" is the interval used for
+## figures 3 and 4.
+
+SUMMARY_FILE = "dataset_summary.npz"
+
+# Bump SUMMARY_VERSION when the rows change through code that is not hashed
+SUMMARY_VERSION = 1
+
+PHASES = (
+	("all", None),
+	("clean", (0, 80)),
+	("impaired", (80, 160)),
+	("cutout", analyze_vpp.CUTOUT_INTERVAL),
+)
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+THRESHOLDS = (1, 5, 10)
+
+STRING_COLUMNS = ("run", "fingerprint", "analyzer", "phase")
+NUMBER_COLUMNS = ("samples", "error_samples", "client_rtt", "samples_per_rtt") + \
+		tuple("error_q{:02d}".format(int(q * 100)) for q in QUANTILES) + \
+		tuple("within_{}ms".format(x) for x in THRESHOLDS)
+COLUMNS = STRING_COLUMNS + NUMBER_COLUMNS
+
+def summarize_run(run):
+	# {column: list of values} for the rows of one run
+	rows = collections.OrderedDict((name, list()) for name in COLUMNS)
+	for analyzer in run['plotable_analyzers']:
+		index = run.ecdf_index(analyzer)
+		for phase, window in PHASES:
+			if window == None:
+				duration = run.time[-1] - run.time[0] if len(run.time) else 0
+				client_rtts = run['client_rtts']
+			else:
+				duration = window[1] - window[0]
+				client_times = run['client_times']
+				client_rtts = run['client_rtts'][(client_times >= window[0]) & (client_times < window[1])]
+			samples = len(run.samples(analyzer, window)[0])
+			client_rtt = np.median(client_rtts) if len(client_rtts) else np.nan
+			samples_per_rtt = samples / (duration / (client_rtt / 1000)) if duration > 0 else np.nan
+
+			rows['run'].append(run['dir_name'])
+			rows['fingerprint'].append(run['data_fingerprint'])
+			rows['analyzer'].append(analyzer)
+			rows['phase'].append(phase)
+			rows['samples'].append(samples)
+			rows['error_samples'].append(index.count(window))
+			rows['client_rtt'].append(client_rtt)
+			rows['samples_per_rtt'].append(samples_per_rtt)
+			for q, value in zip(QUANTILES, index.quantile(QUANTILES, window)):
+				rows["error_q{:02d}".format(int(q * 100))].append(value)
+			for x, value in zip(THRESHOLDS, index.fraction_within(THRESHOLDS, window)):
+				rows["within_{}ms".format(x)].append(value)
+	return rows
+
+def summary_version():
+	description = {
+		'summary': SUMMARY_VERSION,
+		'analysis': run_cache.SCHEMA_VERSION,
+		'code': inspect.getsource(summarize_run) + inspect.getsource(ecdf_index),
+		'columns': COLUMNS,
+	}
+	encoded = json.dumps(description, sort_keys=True).encode()
+	return hashlib.sha1(encoded).hexdigest()
+
+def _summarize_path(path):
+	# runs in a worker process
+	output = io.StringIO()
+	with contextlib.redirect_stdout(output):
+		run = analyze_vpp.analyze_run(path, use_cache=True, analyzers=analyze_vpp.PLOTABLE_ANALYZERS)
+	if not run:
+		return None
+	return summarize_run(run)
+
+class Summary:
+
+	def __init__(self, columns, version = None):
+		self.columns = collections.OrderedDict((name, np.asarray(columns[name])) for name in COLUMNS)
+		# summary_version() of the code that built the rows
+		self.version = version
+
+	def __len__(self):
+		return len(self.columns['run'])
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	def where(self, **criteria):
+		# e.g. summary.where(analyzer="status", phase="impaired"), a value can
+		# also be a list of accepted values
+		mask = np.ones(len(self), dtype=bool)
+		for name, value in criteria.items():
+			if isinstance(value, (list, tuple, set)):
+				mask &= np.isin(self.columns[name], list(value))
+			else:
+				mask &= self.columns[name] == value
+		return Summary({name: values[mask] for name, values in self.columns.items()}, self.version)
+
+	def runs(self):
+		return sorted(set(self.columns['run']))
+
+	def save(self, path):
+		directory = os.path.dirname(os.path.abspath(path))
+		fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+		try:
+			with os.fdopen(fd, 'wb') as tmp_file:
+				arrays = dict(self.columns)
+				if self.version != None:
+					arrays['version'] = np.array(self.version)
+				np.savez(tmp_file, **arrays)
+			os.replace(tmp_path, path)
+		except:
+			os.unlink(tmp_path)
+			raise
+
+	def write_csv(self, path):
+		with open(path, 'w') as csv_file:
+			csv_file.write(",".join(COLUMNS) + "\n")
+			for i in range(len(self)):
+				csv_file.write(",".join(str(self.columns[name][i]) for name in COLUMNS) + "\n")
+
+def load_summary(path):
+	with np.load(path, allow_pickle=False) as arrays:
+		version = str(arrays['version']) if 'version' in arrays.files else None
+		return Summary({name: arrays[name] for name in COLUMNS}, version)
+
+def _empty_columns():
+	return collections.OrderedDict((name, list()) for name in COLUMNS)
+
+def build_summary(data_dir, summary_path = None, jobs = None, progress = True):
+	if summary_path == None:
+		summary_path = os.path.join(data_dir, SUMMARY_FILE)
+
+	previous = None
+	if os.path.exists(summary_path):
+		try:
+			previous = load_summary(summary_path)
+		except (OSError, ValueError, KeyError):
+			previous = None
+
+	version = summary_version()
+	if previous != None and previous.version != version:
+		# rows of other code or definitions are not reused
+		if progress:
+			print("Summary version changed, summarizing all runs again")
+		previous = None
+
+	run_paths = analyze_dataset.find_runs(data_dir)
+	parts = dict()
+	to_analyze = list()
+	for path in run_paths:
+		fingerprint = analyze_vpp.data_fingerprint(path)
+		if previous != None:
+			rows = previous.where(run=os.path.basename(path), fingerprint=fingerprint)
+			if len(rows):
+				parts[path] = rows.columns
+				continue
+		to_analyze.append(path)
+
+	if progress:
+		print("{} runs, {} up to date".format(len(run_paths), len(run_paths) - len(to_analyze)))
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+		futures = {executor.submit(_summarize_path, path): path for path in to_analyze}
+		for i, future in enumerate(concurrent.futures.as_completed(futures)):
+			path = futures[future]
+			try:
+				rows = future.result()
+			except Exception as error:
+				print("Failed to summarize {}: {!r}".format(path, error))
+				rows = None
+			if rows != None:
+				parts[path] = rows
+			if progress:
+				print("[{}/{}] {}".format(i + 1, len(to_analyze), os.path.basename(path)))
+				sys.stdout.flush()
+
+	columns = _empty_columns()
+	for path in run_paths:
+		if path in parts:
+			for name in COLUMNS:
+				columns[name].extend(parts[path][name])
+	summary = Summary(columns, version)
+	summary.save(summary_path)
+	return summary
+
+def main():
+	parser = argparse.ArgumentParser(description="Build the summary table of the QUIC dataset.")
+	parser.add_argument("data_dir", nargs='?', default=analyze_dataset.DEFAULT_DATA_DIR,
+			help="directory containing one directory per run (default: quic/data)")
+	parser.add_argument("-o", "--output", default=None,
+			help="summary file (default: DATA_DIR/{})".format(SUMMARY_FILE))
+	parser.add_argument("-j", "--jobs", type=int, default=None,
+			help="number of worker processes (default: number of CPUs)")
+	parser.add_argument("--csv", default=None, help="also write the table as CSV")
+	args = parser.parse_args()
+
+	summary = build_summary(args.data_dir, args.output, args.jobs)
+	print("{} rows, {} runs".format(len(summary), len(summary.runs())))
+	if args.csv:
+		summary.write_csv(args.csv)
+
+if __name__ == '__main__':
+	main()
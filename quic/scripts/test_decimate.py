@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import decimate
+
+## Compares the lines drawn by matplotlib before and after decimate.minmax.
+## Run with: python -m pytest quic/scripts
+
+COLUMNS = 50
+
+def _series(seed, points = 20000, gaps = 60):
+	random = np.random.default_rng(seed)
+	x = np.cumsum(random.uniform(0.1, 1, points))
+	y = np.cumsum(random.normal(0, 1, points))
+	# single NaNs and longer breaks, inside columns and at their borders
+	for start in random.integers(0, points, gaps):
+		y[start:start + random.integers(1, 40)] = np.nan
+	return x, y
+
+def _runs(x, y):
+	# (first x, last x) of the parts of the line between two NaNs
+	finite = ~np.isnan(y)
+	edges = np.diff(np.concatenate(([False], finite, [False])).astype(np.int8))
+	starts = np.flatnonzero(edges == 1)
+	ends = np.flatnonzero(edges == -1) - 1
+	return list(zip(x[starts], x[ends]))
+
+def _segments(x, y):
+	# the lines between consecutive points, as pairs of x
+	finite = ~np.isnan(y)
+	drawn = finite[1:] & finite[:-1]
+	return list(zip(x[:-1][drawn], x[1:][drawn]))
+
+def test_breaks_are_kept():
+	for seed in range(5):
+		x, y = _series(seed)
+		x_out, y_out = decimate.minmax(x, y, COLUMNS)
+		assert len(x_out) < len(x) / 10
+
+		# the same parts of the line are drawn
+		assert _runs(x_out, y_out) == _runs(x, y)
+
+		# and every decimated segment replaces segments of the original
+		index = {value: i for i, value in enumerate(x)}
+		for x_start, x_end in _segments(x_out, y_out):
+			start, end = index[x_start], index[x_end]
+			assert start < end and not np.any(np.isnan(y[start:end + 1]))
+
+def test_extremes_are_kept():
+	x, y = _series(7)
+	x_out, y_out = decimate.minmax(x, y, COLUMNS)
+	ids = decimate._column_ids(x, COLUMNS)
+	ids_out = decimate._column_ids(x_out, COLUMNS)
+	for column in range(COLUMNS):
+		values = y[ids == column]
+		values_out = y_out[ids_out == column]
+		assert np.nanmin(values) == np.nanmin(values_out)
+		assert np.nanmax(values) == np.nanmax(values_out)
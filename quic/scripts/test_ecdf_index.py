@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import ecdf_index
+
+## Equivalence tests of ecdf_index.EcdfIndex against the loops of
+## analyze_vpp it replaced. Run with: python -m pytest quic/scripts
+
+def _make_ecdf_data(times, errors, time_window = None):
+	# analyze_vpp.make_ecdf_data on Run.error_samples, before ecdf_index.py
+	errors = np.asarray(errors)
+	keep = ~np.isnan(errors)
+	if time_window != None:
+		keep &= (times >= time_window[0]) & (times < time_window[1])
+	error_data = np.sort(errors[keep])
+	frequency = np.arange(len(error_data)) / len(error_data)
+	return (error_data, frequency)
+
+def _find_ecdf_y_value(times, errors, x_val, time_window = None):
+	# analyze_vpp.find_ecdf_y_value before ecdf_index.py
+	error_data, frequency = _make_ecdf_data(times, errors, time_window)
+	for i in range(len(error_data)):
+		if error_data[i] >= x_val:
+			if i > 1:
+				rel_delta = (x_val - error_data[i-1]) / (error_data[i] - error_data[i-1])
+				return frequency[i-1] + rel_delta * (frequency[i] - frequency[i-1])
+			else:
+				return 0
+	return 1
+
+def _samples(seed, n = 500):
+	random = np.random.default_rng(seed)
+	times = np.sort(random.uniform(0, 20, n))
+	# rounded, so that errors repeat
+	errors = np.round(random.normal(0, 5, n), 1)
+	errors[random.integers(0, n, n // 10)] = np.nan
+	return times, errors
+
+def test_ecdf():
+	times, errors = _samples(1)
+	# the index does not depend on the order of the samples
+	order = np.random.default_rng(2).permutation(len(times))
+	index = ecdf_index.EcdfIndex(times[order], errors[order])
+	for time_window in (None, (5, 15), (0, 0.5), (30, 40), (times[10], times[20])):
+		expected = _make_ecdf_data(times, errors, time_window)
+		result = index.ecdf(time_window)
+		assert np.array_equal(result[0], expected[0])
+		assert np.array_equal(result[1], expected[1])
+		assert index.count(time_window) == len(expected[0])
+
+def test_cdf():
+	for seed in range(3):
+		times, errors = _samples(seed)
+		index = ecdf_index.EcdfIndex(times, errors)
+		valid = errors[~np.isnan(errors)]
+		# below, at, between and above the samples
+		x_values = np.concatenate((np.linspace(-25, 25, 101), valid[:50], [valid.min() - 1,
+				valid.min(), valid.max(), valid.max() + 1]))
+		for time_window in (None, (2, 3), (19.9, 20)):
+			expected = [_find_ecdf_y_value(times, errors, x, time_window) for x in x_values]
+			assert np.array_equal(index.cdf(x_values, time_window), expected)
+			assert [float(index.cdf(x, time_window)) for x in x_values[:20]] == expected[:20]
+
+def test_small_windows():
+	times = np.array([1.0, 2.0, 3.0])
+	errors = np.array([4.0, -1.0, 2.0])
+	index = ecdf_index.EcdfIndex(times, errors)
+	for time_window in ((0, 1), (1, 2), (1, 3), (5, 6)):
+		for x in (-2, -1, 0, 2, 3, 4, 5):
+			assert index.cdf(x, time_window) == _find_ecdf_y_value(times, errors, x, time_window)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import math
+import numpy as np
+import pytest
+
+import interpolate
+
+## Equivalence tests of interpolate.py against naive reference loops, for
+## "linear" the cursor loop of analyze_vpp it replaced.
+## Run with: python -m pytest quic/scripts
+
+def _forward_cursor_to_time(cursor, time, time_series):
+	if time_series[0] >= time:
+		return -1
+	while (cursor < (len(time_series) - 1) and time_series[cursor + 1] < time):
+		cursor = cursor + 1
+	return cursor
+
+def _interpollate_rtts(target_times, source_times, source_rtts):
+	# analyze_vpp.interpollate_rtts before interpolate.py
+	target_rtts = list()
+	source_cursor = 0
+	target_times.sort()
+	for time in target_times:
+		source_cursor = _forward_cursor_to_time(source_cursor, time, source_times)
+		if source_cursor == -1:
+			target_rtts.append(source_rtts[0])
+			continue
+		if source_cursor == len(source_times) - 1:
+			target_rtts.append(source_rtts[-1])
+			continue
+		time_delta = source_times[source_cursor + 1] - source_times[source_cursor]
+		rtt_delta = source_rtts[source_cursor + 1] - source_rtts[source_cursor]
+		slope = rtt_delta / time_delta
+		offset = time - source_times[source_cursor]
+		target_rtts.append(source_rtts[source_cursor] + offset * slope)
+	return target_rtts
+
+def _previous(target_times, source_times, source_values):
+	values = []
+	for time in target_times:
+		before = [value for source_time, value in zip(source_times, source_values)
+				if source_time <= time]
+		values.append(before[-1] if before else math.nan)
+	return values
+
+def _nearest(target_times, source_times, source_values):
+	# min keeps the first of equal distances, the earlier sample
+	return [source_values[min(range(len(source_times)),
+			key=lambda i: abs(source_times[i] - time))] for time in target_times]
+
+def _times(seed, n):
+	random = np.random.default_rng(seed)
+	source_times = np.cumsum(random.uniform(0.01, 0.1, n))
+	source_values = random.uniform(20, 80, n)
+	# before, after, on and between the source samples
+	target_times = np.concatenate((random.uniform(-1, source_times[-1] + 1, 300),
+			source_times[::7], [source_times[0], source_times[-1]]))
+	return np.sort(target_times), source_times, source_values
+
+@pytest.mark.parametrize("n", [1, 2, 3, 200])
+def test_linear(n):
+	target_times, source_times, source_values = _times(n, n)
+	expected = _interpollate_rtts(target_times.tolist(), source_times.tolist(),
+			source_values.tolist())
+	result = interpolate.interpolate(target_times, source_times, source_values, "linear")
+	assert np.allclose(result, expected, rtol=1e-12, atol=0)
+
+@pytest.mark.parametrize("n", [1, 2, 200])
+def test_previous_and_nearest(n):
+	target_times, source_times, source_values = _times(n, n)
+	# repeated source times, and unsorted source samples
+	source_times[1::3] = source_times[::3][:len(source_times[1::3])]
+	order = np.random.default_rng(n).permutation(n)
+	for method, reference in (("previous", _previous), ("nearest", _nearest)):
+		# the stable sort of the source keeps repeated times in input order
+		stable = np.argsort(source_times[order], kind='stable')
+		expected = reference(target_times, source_times[order][stable],
+				source_values[order][stable])
+		result = interpolate.interpolate(target_times, source_times[order],
+				source_values[order], method)
+		assert np.array_equal(result, expected, equal_nan=True)
+
+def test_empty_source():
+	for method in interpolate.METHODS:
+		assert np.isnan(interpolate.interpolate([1.0, 2.0], [], [], method)).all()
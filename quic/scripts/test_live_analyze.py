@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import struct
+import numpy as np
+import pytest
+
+import live_analyze
+import pcap_reader
+import spin_observers
+
+## Tests of live_analyze.LiveRun on a run in the format of the VPP plugin
+## in this repository (spin_observers.CSV_HEADER), written while it is
+## being followed. Run with: python -m pytest quic/scripts
+
+ZERO_EPOCH = 1000
+ROWS = 200
+RTT = 0.040
+
+def _write_pcap(path):
+	header = struct.pack('<IHHiIII', pcap_reader.PCAP_MAGIC_US, 2, 4, 0, 0, 65535, 1)
+	record = struct.pack('<IIII', ZERO_EPOCH, 0, 60, 60) + bytes(60)
+	path.write_bytes(header + record)
+
+def _vpp_lines():
+	# the analyzers take turns in setting their new flag
+	analyzers = spin_observers.ANALYZERS
+	lines = []
+	for i in range(ROWS):
+		row = ["{:.8f}".format(ZERO_EPOCH + i * 0.1), str(i), "client"]
+		for a in range(len(analyzers)):
+			row += ["{:.4f}".format(RTT), "1" if i % len(analyzers) == a else "0"]
+		row.append("0")
+		lines.append(", ".join(row) + "\n")
+	return lines
+
+def _client_lines():
+	return ["2018/04/04 07:42:25.140891 [statistic] RTT: time: {:.6f} variance: 0.5 "
+			"rtt: {:.6f}\n".format(ZERO_EPOCH + i * 0.1, RTT * 1000) for i in range(ROWS)]
+
+def _follow(tmp_path, analyzers = None, parts = 7):
+	_write_pcap(tmp_path / "switch-2_tcpdump.pcap")
+	header = ", ".join(spin_observers.CSV_HEADER) + "\n"
+	vpp_lines = _vpp_lines()
+	# older plugin versions repeat the header for every new flow
+	vpp_lines.insert(ROWS // 2, header)
+	vpp_text = header + "".join(vpp_lines)
+	client_text = "".join(_client_lines())
+
+	live = live_analyze.LiveRun(str(tmp_path), analyzers, window=100)
+	live.vpp.chunk_size = 1000
+	with open(tmp_path / "switch-2_vpp.csv", 'w') as vpp_file, \
+			open(tmp_path / "client-0_minq_stderr.txt", 'w') as client_file:
+		for part in range(parts):
+			vpp_file.write(vpp_text[len(vpp_text) * part // parts:len(vpp_text) * (part + 1) // parts])
+			client_file.write(client_text[len(client_text) * part // parts:
+					len(client_text) * (part + 1) // parts])
+			vpp_file.flush()
+			client_file.flush()
+			live.poll()
+	while not live.at_end():
+		live.poll()
+	live.finish()
+	return live
+
+def test_plugin_csv(tmp_path):
+	live = _follow(tmp_path)
+	assert live.analyzers == list(spin_observers.ANALYZERS)
+
+	client_rtt, stats = live.stats()
+	assert client_rtt == pytest.approx(RTT * 1000)
+	# the first two rows are ignored
+	rows = np.arange(2, ROWS)
+	for a, analyzer in enumerate(spin_observers.ANALYZERS):
+		assert stats[analyzer]['total'] == np.sum(rows % len(spin_observers.ANALYZERS) == a)
+		assert stats[analyzer]['error_median'] == pytest.approx(0, abs=1e-6)
+
+def test_missing_analyzer(tmp_path):
+	with pytest.warns(UserWarning, match="valid_edge"):
+		live = _follow(tmp_path, ["status", "valid_edge", "basic"])
+	assert live.analyzers == ["status", "basic"]
+	assert list(live.stats()[1]) == ["status", "basic"]
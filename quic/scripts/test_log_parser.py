@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import numpy as np
+import pytest
+
+import log_parser
+
+## Equivalence tests of log_parser.py against the line loops of analyze_run
+## it replaced. Run with: python -m pytest quic/scripts
+
+def _read_minq_log(path):
+	# the minq loop of analyze_run before log_parser.py
+	columns = {key: [] for key in log_parser.MINQ_KEYS}
+	for raw_line in open(path):
+		if raw_line.find('RTT:') != -1:
+			line = raw_line.split()
+			columns['rtts'].append(float(line[-1]))
+			columns['rtt_times'].append(float(line[-5]))
+		if raw_line.find('RTT_TCP:') != -1:
+			line = raw_line.split()
+			columns['rtts_tcp'].append(float(line[-1]))
+			columns['rtt_tcp_times'].append(float(line[-5]))
+		if raw_line.find('MEASUREMENT_BYTE_OUT') != -1:
+			line = raw_line.split()
+			columns['mbytes'].append(int(line[-1], 16))
+			columns['mbyte_times'].append(float(line[-3]))
+	return columns
+
+def _read_ping_log(path):
+	# the ping loop of analyze_run before log_parser.py
+	times, rtts = [], []
+	for raw_line in open(path):
+		if raw_line.startswith('['):
+			line = raw_line.split()
+			if line[-1] != 'ms':
+				continue
+			rtts.append(float(line[-2][5:]))
+			times.append(float(line[0][1:-1]))
+	return times, rtts
+
+def _minq_lines(seed, n = 3000):
+	random = np.random.default_rng(seed)
+	lines = []
+	for i in range(n):
+		epoch = repr(float(1.5e9 + random.uniform(0, 1e5)))
+		rtt = '%.3f' % random.uniform(0, 500)
+		kind = random.integers(0, 4)
+		if kind == 0:
+			lines.append('[statistic] RTT: time: %s variance: 1.2 rtt: %s' % (epoch, rtt))
+		elif kind == 1:
+			lines.append('[statistic] RTT_TCP: time: %s variance: 1.2 rtt: %s' % (epoch, rtt))
+		elif kind == 2:
+			lines.append('[statistic] MEASUREMENT_BYTE_OUT spin %s byte %x' % (epoch,
+					random.integers(0, 256)))
+		else:
+			lines.append('Received packet len=%d' % random.integers(0, 1500))
+	# irregular whitespace, integers and long values
+	lines += [
+		'[statistic]  RTT: time:  1500000000.25  variance: 1 rtt:\t40',
+		'[statistic] RTT: time: 1500000000.5 variance: 1 rtt: 41.5\r',
+		'RTT_TCP: 1500000001 a b c 42',
+		'[statistic] RTT: time: 1500000000.123456789012 variance: 1 rtt: 0.000000000000000001',
+		'[statistic] MEASUREMENT_BYTE_OUT x 1500000002.75 byte FF',
+		'',
+		'   ',
+	]
+	random.shuffle(lines)
+	return lines
+
+def _ping_lines(seed, n = 3000):
+	random = np.random.default_rng(seed)
+	lines = ['PING 10.0.0.2 (10.0.0.2) 56(84) bytes of data.']
+	for i in range(n):
+		lines.append('[%.6f] 64 bytes from 10.0.0.2: icmp_seq=%d ttl=64 time=%s ms' %
+				(1.5e9 + i / 100, i, '%.*f' % (int(random.integers(0, 4)), random.uniform(0, 300))))
+	lines += [
+		'[1500000000.5] From 10.0.0.1 icmp_seq=7 Destination Host Unreachable',
+		'[1500000000.75]  64 bytes from 10.0.0.2: icmp_seq=8 ttl=64  time=12.5  ms\r',
+		'[1500000001] 64 bytes from 10.0.0.2: icmp_seq=9 ttl=64 time=7 ms',
+		'--- 10.0.0.2 ping statistics ---',
+	]
+	random.shuffle(lines)
+	return lines
+
+def _write(path, lines, trailing_newline):
+	path.write_text('\n'.join(lines) + ('\n' if trailing_newline else ''))
+	return str(path)
+
+@pytest.mark.parametrize("block_size", [64, 1000, log_parser.BLOCK_SIZE])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_minq(tmp_path, monkeypatch, block_size, trailing_newline):
+	monkeypatch.setattr(log_parser, 'BLOCK_SIZE', block_size)
+	path = _write(tmp_path / 'minq.txt', _minq_lines(block_size), trailing_newline)
+	expected = _read_minq_log(path)
+	result = log_parser.read_minq_log(path)
+	for key in log_parser.MINQ_KEYS:
+		assert np.array_equal(result[key], expected[key]), key
+
+@pytest.mark.parametrize("block_size", [64, 1000, log_parser.BLOCK_SIZE])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_ping(tmp_path, monkeypatch, block_size, trailing_newline):
+	monkeypatch.setattr(log_parser, 'BLOCK_SIZE', block_size)
+	path = _write(tmp_path / 'ping.txt', _ping_lines(block_size), trailing_newline)
+	expected = _read_ping_log(path)
+	result = log_parser.read_ping_log(path)
+	assert np.array_equal(result[0], expected[0])
+	assert np.array_equal(result[1], expected[1])
+
+def test_empty(tmp_path):
+	path = _write(tmp_path / 'empty.txt', [], False)
+	assert all(len(values) == 0 for values in log_parser.read_minq_log(path).values())
+	assert all(len(values) == 0 for values in log_parser.read_ping_log(path))
+
+def test_bad_number(tmp_path):
+	path = _write(tmp_path / 'minq.txt', ['[statistic] RTT: time: 1.2.3 variance: 1 rtt: 4'], True)
+	with pytest.raises(ValueError):
+		log_parser.read_minq_log(path)
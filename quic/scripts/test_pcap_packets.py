@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import struct
+import pytest
+
+import pcap_packets
+import pcap_reader
+
+## Regression tests of pcap_packets.read_packets against the reference
+## reader pcap_reader.read_records. Run with: python -m pytest quic/scripts
+
+def _record(ts_sec, size):
+	return struct.pack('<IIII', ts_sec, 0, size, size) + bytes(size)
+
+def _capture(sizes):
+	header = struct.pack('<IHHiIII', pcap_reader.PCAP_MAGIC_US, 2, 4, 0, 0, 65535,
+			pcap_packets.LINKTYPE_ETHERNET)
+	return header + b''.join(_record(1000 + i, size) for i, size in enumerate(sizes))
+
+def _compare(path):
+	reference = [record.time for record in pcap_reader.read_records(str(path))]
+	packets = pcap_packets.read_packets(str(path))
+	assert packets['time'].tolist() == reference
+	return len(reference)
+
+def test_truncated_run(tmp_path):
+	# the last record of a run of equal sized records is cut off
+	path = tmp_path / "truncated.pcap"
+	path.write_bytes(_capture([40, 70, 50] + [60] * 30)[:-10])
+	assert _compare(path) == 32
+
+def test_every_truncation(tmp_path):
+	data = _capture([40, 70, 50] + [60] * 30 + [30] + [60] * 12)
+	path = tmp_path / "cut.pcap"
+	for end in range(24, len(data) + 1):
+		path.write_bytes(data[:end])
+		_compare(path)
+
+def test_error_is_not_hidden(tmp_path, monkeypatch):
+	# closing the mapping must not fail on views held by the traceback
+	path = tmp_path / "capture.pcap"
+	path.write_bytes(_capture([60] * 20))
+
+	def fail(buffer, records, quic_ports):
+		view = buffer[:16]
+		raise IndexError("failure while views are alive")
+	monkeypatch.setattr(pcap_packets, "_packet_fields", fail)
+	with pytest.raises(IndexError):
+		pcap_packets.read_packets(str(path))
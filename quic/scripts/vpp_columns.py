@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import csv
+import json
+import os
+import os.path
+import tempfile
+import numpy as np
+
+import run_cache
+import run_data
+
+## Column store for the VPP output (switch-2_vpp.csv / switch-2_vpp_resync.csv).
+##
+## The first time a CSV file is loaded it is converted to one .npy file per
+## column in <run directory>/vpp_columns/<csv name>/. Later loads memory map
+## only the requested columns, so reading 4 of the 11 analyzers touches about
+## a third of the data. The conversion is redone when the CSV file changes.
+##
+## Column names are the ones in the CSV header: time, pn, host,
+## <analyzer>_data, <analyzer>_new and, in newer plugin output, flow. host
+## is stored as run_data.host_code().
+
+COLUMN_DIR = "vpp_columns"
+MANIFEST = "source.json"
+
+def _column_type(name):
+	if name in ('pn', 'flow'):
+		return np.int64
+	if name == 'host':
+		return np.uint8
+	if name.endswith('_new'):
+		return np.uint8
+	return np.float64
+
+def column_dir(csv_path):
+	base_path, csv_name = os.path.split(csv_path)
+	return os.path.join(base_path, COLUMN_DIR, os.path.splitext(csv_name)[0])
+
+def _save_atomic(directory, name, writer):
+	fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+	try:
+		with os.fdopen(fd, 'wb') as tmp_file:
+			writer(tmp_file)
+		os.replace(tmp_path, os.path.join(directory, name))
+	except:
+		os.unlink(tmp_path)
+		raise
+
+def data_lines(lines, header_line):
+	# lines without the repeated header lines, older plugin versions repeat
+	# the header for every new flow. Works on str and bytes lines.
+	header_line = header_line.strip()
+	return (line for line in lines if line.strip() != header_line)
+
+def read_csv(csv_path):
+	with open(csv_path, newline='') as csv_file:
+		header_line = csv_file.readline()
+		header = [name.strip() for name in next(csv.reader([header_line]))]
+		dtype = [(name, 'U16' if name == 'host' else
+				('i8' if _column_type(name) != np.float64 else 'f8')) for name in header]
+		table = np.loadtxt(data_lines(csv_file, header_line), delimiter=',', dtype=dtype,
+				ndmin=1, comments=None)
+
+	columns = dict()
+	for name in header:
+		if name == 'host':
+			hosts = np.char.strip(table[name])
+			codes = np.full(len(hosts), 255, dtype=np.uint8)
+			for code, host_name in enumerate(run_data.HOST_NAMES):
+				codes[hosts == host_name] = code
+			if np.any(codes == 255):
+				raise ValueError("Unknown host in {}".format(csv_path))
+			columns[name] = codes
+		else:
+			columns[name] = table[name].astype(_column_type(name))
+	return columns
+
+def convert(csv_path):
+	directory = column_dir(csv_path)
+	os.makedirs(directory, exist_ok=True)
+
+	fingerprint = run_cache.file_fingerprint(csv_path)
+	columns = read_csv(csv_path)
+	for name, values in columns.items():
+		_save_atomic(directory, name + ".npy", lambda out: np.save(out, values))
+
+	# the manifest is written last, an interrupted conversion is redone
+	manifest = {'source': fingerprint, 'columns': list(columns)}
+	_save_atomic(directory, MANIFEST, lambda out: out.write(json.dumps(manifest).encode()))
+	return manifest
+
+def _manifest(csv_path):
+	try:
+		with open(os.path.join(column_dir(csv_path), MANIFEST)) as manifest_file:
+			manifest = json.load(manifest_file)
+	except (FileNotFoundError, ValueError):
+		return None
+	if manifest['source'] != run_cache.file_fingerprint(csv_path):
+		return None
+	return manifest
+
+def load(csv_path, columns = None, optional_columns = ()):
+	# Returns a dict of read-only memory mapped columns, all columns if
+	# columns == None. Converts the CSV file first if needed. Optional
+	# columns are only returned if the file has them.
+	manifest = _manifest(csv_path)
+	if manifest == None:
+		print("\tConverting {} to columns ...".format(os.path.basename(csv_path)), end='')
+		manifest = convert(csv_path)
+		print(" Done")
+
+	if columns == None:
+		columns = manifest['columns']
+	missing = [name for name in columns if name not in manifest['columns']]
+	if missing:
+		raise KeyError("{} has no columns {}".format(csv_path, missing))
+
+	columns = list(columns) + [name for name in optional_columns
+			if name in manifest['columns'] and name not in columns]
+	directory = column_dir(csv_path)
+	return {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode='r')
+			for name in columns}
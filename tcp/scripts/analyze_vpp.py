@@ -7,11 +7,15 @@ import collections
 import pickle
 import copy
 import functools
+import operator
 import os
 import os.path
 import shutil
 
 import matplotlib.pyplot as plt
+import numpy as np
+
+import filters
 
 def save_figure(figure, filename):
     print("\tGenerating figure: {} ...".format(filename), end="")
@@ -32,196 +36,210 @@ magic_translator = { "vec": { "new" : "status_new",
                                   "data" : "all_ts_rtt"}
                      }
 
+ANALYZER_NAMES = ("vec", "single_ts", "all_ts")
+
+# dtypes of the csv columns that are read, the vec_ne_zero columns are not used
+VPP_DTYPE = np.dtype([('time', np.float64), ('host', 'S16'), ('seq_num', np.int64),
+                      ('status_data', np.float64), ('status_new', np.int8),
+                      ('single_ts_rtt', np.float64), ('single_ts_rtt_new', np.int8),
+                      ('all_ts_rtt', np.float64), ('all_ts_rtt_new', np.int8),
+                      ('total_state', np.int64)])
+
+##
+## Columnar vpp data
+##
+## A VppRecord holds one array per field, named like the fields of the rows
+## of read_vpp_file(): time, host, sec_num, total_state, <analyzer> and
+## <analyzer>_new. The host column holds codes into record.hosts.
+##
+
+class VppRecord:
+    def __init__(self, columns, hosts = ()):
+        self.columns = columns
+        self.hosts = tuple(hosts)
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, column):
+        self.columns[name] = column
+
+    def get(self, name):
+        # like a row of read_vpp_file(), missing fields are None (NaN here)
+        if name in self.columns:
+            return self.columns[name]
+        return np.full(len(self), np.nan)
+
+    def rows(self):
+        # the rows of read_vpp_file(), a defaultdict per row
+        names = list(self.columns)
+        columns = [self.columns[name].tolist() for name in names]
+        if 'host' in self.columns:
+            columns[names.index('host')] = [self.hosts[code] for code in self.columns['host'].tolist()]
+        return [collections.defaultdict(return_none, zip(names, values))
+                for values in zip(*columns)]
+
+def load_vpp_file(path):
+    # The vpp csv file as a VppRecord, parsed by numpy with fixed dtypes.
+    with open(path, 'rb') as csvfile:
+        # values may be padded with tabs and spaces
+        data = csvfile.read().translate(None, b' \t\r')
+    header_line, _, body = data.partition(b'\n')
+    fields = header_line.decode().split(',')
+    usecols = [fields.index(name) for name in VPP_DTYPE.names]
+
+    # the first row is the base time, the first two rows are ignored (also
+    # if one of them is a repeated header)
+    lines = body.split(b'\n', 2)
+    if len(lines) < 3 or not lines[2].strip(b'\n'):
+        base_time = 0.0
+        table = np.zeros(0, dtype=VPP_DTYPE)
+    else:
+        base_time = float(lines[0].split(b',', 1)[0])
+        # skip repeated header lines
+        rows = (line for line in lines[2].split(b'\n') if line != header_line)
+        table = np.loadtxt(rows, dtype=VPP_DTYPE, delimiter=',',
+                           usecols=usecols, comments=None, ndmin=1)
+
+    hosts, host_codes = np.unique(table['host'], return_inverse=True)
+    columns = dict()
+    columns['time'] = table['time'] - base_time
+    columns['host'] = host_codes.astype(np.int8).reshape(-1)
+    columns['sec_num'] = table['seq_num']
+    columns['total_state'] = table['total_state']
+    for analyzer in ANALYZER_NAMES:
+        columns[analyzer] = table[magic_translator[analyzer]["data"]] * 1000
+        columns[analyzer + "_new"] = (table[magic_translator[analyzer]["new"]] == 1).astype(np.int8)
+
+    return VppRecord(columns, [host.decode() for host in hosts.tolist()])
+
 def read_vpp_file(path):
-    analyzer_names = ("vec", "single_ts", "all_ts")
-#    os.system("sed -i $'s/\t//g' {}".format(path))
-    csvfile = open(path)
-    reader = csv.DictReader(csvfile, skipinitialspace=True)
-    #print(reader.fieldnames)
-
-    vpp_data = list()
-    ignore_count = 0
-
-    base_time = None
-    for row in reader:
-        if base_time == None:
-            base_time = float(row["time"])
-
-        # ignore the first two entries.
-        if ignore_count < 2:
-            ignore_count += 1
-            continue
-
-        vpp_entry = collections.defaultdict(return_none)
-        vpp_entry['time'] = float(row['time']) - base_time
-        vpp_entry['host'] = row["host"].strip()
-        vpp_entry["sec_num"] = int(row["seq_num"])
-        vpp_entry["total_state"] = int(row["total_state"])
-
-        for analyzer in analyzer_names:
-            #if row[magic_translator[analyzer]["new"]] == '1':
-            vpp_entry[analyzer] = float(row[magic_translator[analyzer]["data"]]) * 1000
-            if row[magic_translator[analyzer]["new"]] == '1':
-                vpp_entry[analyzer + "_new"] = 1
-            else:
-                vpp_entry[analyzer + "_new"] = 0
-
-        vpp_data.append(vpp_entry)
-
-    return vpp_data
+    # one defaultdict per row, see load_vpp_file() for the columnar form
+    return load_vpp_file(path).rows()
 
 def get_time_series(vpp_data, analyzer):
+    if isinstance(vpp_data, VppRecord):
+        new = vpp_data.get(analyzer + "_new") == 1
+        return vpp_data['time'][new].tolist(), vpp_data.get(analyzer)[new].tolist()
+
     time = [x['time'] for x in vpp_data if x[analyzer + "_new"]]
     rtt =  [x[analyzer] for x in vpp_data if x[analyzer + "_new"]]
 
     return time, rtt
 
 def moving_minimum_filter(time_in, rtt_in):
-    rtt_out = list()
-
-    rtt_out.append(rtt_in[0])
-
-    time_buffer = collections.deque()
-    rtt_buffer = collections.deque()
-    rtt_buffer.append(rtt_in[0])
-    time_buffer.append(time_in[0])
-
-    cursor = 1
-    while cursor < len(rtt_in):
-        rtt_buffer.append(rtt_in[cursor])
-        time_buffer.append(time_in[cursor])
-
-        now = time_in[cursor]
-        start_of_window = now - rtt_out[-1]
-
-        # remove values older than one RTT from window
-        while time_buffer[0] < start_of_window:
-            time_buffer.popleft()
-            rtt_buffer.popleft()
-
-        # calculate new RTT estimate
-        rtt_estimate = min(rtt_buffer)
-        rtt_out.append(rtt_estimate)
-
-        cursor += 1
-    return rtt_out
-
-def hack_moving_min_into_vpp_data(vpp_data, analyzer):
-
-    # first generate the smooth RTT data
-    time_raw, rtt_raw = get_time_series(vpp_data, analyzer)
-    rtt_smooth = moving_minimum_filter(time_raw, rtt_raw)
-    time_smooth = time_raw
-
-    # now insert it in to the VPP data structure
-    vpp_data_cursor = 0
-    smooth_data_cursor = 0
-
-    # forward to the point where the analyzer first has data
-    # insert zeros until then
-    while vpp_data[vpp_data_cursor]['time'] < time_smooth[smooth_data_cursor]:
-        vpp_data[vpp_data_cursor][analyzer + '_smooth'] = 0
-        vpp_data[vpp_data_cursor][analyzer + '_smooth_new'] = 0
-
-    # Now, for every measurement, forward
-    while smooth_data_cursor < len(time_smooth):
-
-        # insert the new measurement
-        vpp_data[vpp_data_cursor][analyzer + '_smooth'] = rtt_smooth[smooth_data_cursor]
-        vpp_data[vpp_data_cursor][analyzer + '_smooth_new'] = 1
-        vpp_data_cursor += 1
-
-        # advance vpp_data_cursor, until just before next measurement
-        while (vpp_data_cursor < len(vpp_data)) and \
-        smooth_data_cursor < len(rtt_smooth) - 1 and \
-        (vpp_data[vpp_data_cursor]['time'] < time_smooth[smooth_data_cursor + 1]):
-            vpp_data[vpp_data_cursor][analyzer + '_smooth'] = rtt_smooth[smooth_data_cursor]
-            vpp_data[vpp_data_cursor][analyzer + '_smooth_new'] = 0
-            vpp_data_cursor += 1
-
-        smooth_data_cursor += 1
-
-    # And, for the last measurement, keep placing it in the vpp_data
-    while vpp_data_cursor < len(vpp_data):
-        vpp_data[vpp_data_cursor][analyzer + '_smooth'] = rtt_smooth[-1]
-        vpp_data[vpp_data_cursor][analyzer + '_smooth_new'] = 0
-        vpp_data_cursor += 1
+    # minimum over the last RTT (the previous output), see filters.py
+    return filters.adaptive_moving_minimum(time_in, rtt_in)
+
+##
+## Derived series
+##
+## A derived series (e.g. a smoothed analyzer) is attached to vpp_data like
+## an analyzer: every row gets <name> and <name>_new. A sample goes to the
+## first row at or after its time, which gets <name>_new = 1, the following
+## rows hold its value until the next sample. Rows before the first sample
+## hold 0. If several samples fall on one row, the last one is kept.
+##
+
+def derived_series_columns(row_times, times, values):
+    # (value column, new column) for rows at row_times (ascending)
+    row_times = np.asarray(row_times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    rows = np.searchsorted(row_times, np.asarray(times, dtype=np.float64), side='left')
+    inside = rows < len(row_times)
+    rows = rows[inside]
+    values = values[inside]
+
+    new = np.zeros(len(row_times), dtype=np.int64)
+    new[rows] = 1
+    last_sample = np.full(len(row_times), -1)
+    np.maximum.at(last_sample, rows, np.arange(len(rows)))
+    last_sample = np.maximum.accumulate(last_sample)
+    column = np.zeros(len(row_times))
+    held = last_sample >= 0
+    column[held] = values[last_sample[held]]
+    return column, new
+
+def add_derived_series(vpp_data, name, times, values):
+    if isinstance(vpp_data, VppRecord):
+        vpp_data[name], vpp_data[name + '_new'] = derived_series_columns(vpp_data['time'], times, values)
+        return
+
+    column, new = derived_series_columns([row['time'] for row in vpp_data], times, values)
+    for row, value, is_new in zip(vpp_data, column.tolist(), new.tolist()):
+        row[name] = value
+        row[name + '_new'] = is_new
+
+def add_filtered_series(vpp_data, analyzer, filter_function = moving_minimum_filter, suffix = '_smooth'):
+    # e.g. all_ts_smooth: the moving minimum of the all_ts samples
+    times, rtts = get_time_series(vpp_data, analyzer)
+    filtered = filter_function(times, rtts) if times else list()
+    add_derived_series(vpp_data, analyzer + suffix, times, filtered)
 
 def make_ecdf_data(vpp_data, analyzerA, analyzerB, weighted = False, relative = False):
-
-    errors = list()
-    times = list()
-
-    time_cursor = None
-    current_error = None
-    A_ready = False
-    B_ready = False
-
-    for row in vpp_data:
-        ## skip forward to point where there is
-        ## data for both analyzers
-        if (not A_ready) or (not B_ready):
-            if row[analyzerA + "_new"]:
-                A_ready = True
-
-            if row[analyzerB + "_new"]:
-                B_ready = True
-
-            if A_ready and B_ready:
-                current_error = row[analyzerA] - row[analyzerB]
-                if relative and row[analyzerA] > 0:
-                    current_error = current_error / row[analyzerA] * 100
-                time_cursor = row['time']
-
-            continue
-
-        # From now on there is data for both analyzers.
-        # If either one is updated, calculate error.
-        if row[analyzerA + "_new"] or row[analyzerB + "_new"]:
-
-            # record the info from the period that ended
-            last_time_delta = row['time'] - time_cursor
-            errors.append(current_error)
-            times.append(last_time_delta)
-
-            # start a new error period
-            current_error = row[analyzerA] - row[analyzerB]
-            if relative and row[analyzerA] > 0:
-                current_error = current_error / row[analyzerA] * 100
-            time_cursor = row['time']
-
-    # end the last measurement period
-    if time_cursor == None:
+    if isinstance(vpp_data, VppRecord):
+        return ecdf_from_columns(vpp_data['time'], vpp_data.get(analyzerA),
+                vpp_data.get(analyzerA + "_new") == 1, vpp_data.get(analyzerB),
+                vpp_data.get(analyzerB + "_new") == 1, weighted, relative)
+
+    # one pass over the rows; fields a row does not have are None, which becomes NaN
+    fields = operator.itemgetter('time', analyzerA, analyzerA + "_new", analyzerB, analyzerB + "_new")
+    table = np.array(list(map(fields, vpp_data)), dtype=np.float64).reshape(-1, 5)
+    new_A = np.nan_to_num(table[:, 2]) != 0
+    new_B = np.nan_to_num(table[:, 4]) != 0
+    return ecdf_from_columns(table[:, 0], table[:, 1], new_A, table[:, 3], new_B,
+            weighted, relative)
+
+def ecdf_from_columns(times, values_A, new_A, values_B, new_B, weighted = False, relative = False):
+    # The error A - B (in % of A if relative and A > 0) is constant between
+    # two updates of either analyzer, starting at the first row where both
+    # have had an update and ending at the last row. Returns the errors of
+    # these periods in ascending order and the ECDF: the fraction of
+    # periods, or of time if weighted.
+
+    ## skip forward to point where there is
+    ## data for both analyzers
+    if not new_A.any() or not new_B.any():
         print("One analyzer has not data, not generating ECDF")
         return None, None
+    first = max(np.argmax(new_A), np.argmax(new_B))
 
-    last_time_delta = row['time'] - time_cursor
-    errors.append(current_error)
-    times.append(last_time_delta)
-
-    zipped = list(zip(errors, times))
-    zipped.sort()
-    errors, times = list(zip(*zipped))
+    # periods start at the first row and at every later update
+    updates = np.flatnonzero(new_A[first + 1:] | new_B[first + 1:]) + first + 1
+    starts = np.concatenate(([first], updates))
+    ends = np.concatenate((updates, [len(times) - 1]))
+    durations = times[ends] - times[starts]
 
+    errors = values_A[starts] - values_B[starts]
+    if relative:
+        positive = values_A[starts] > 0
+        errors[positive] = errors[positive] / values_A[starts][positive] * 100
 
     if not weighted:
-        cum_prob = [i/len(errors) for i in range(1, len(errors)+1)]
+        errors = np.sort(errors)
+        cum_prob = np.arange(1, len(errors) + 1) / len(errors)
     else:
-        cum_prob = list()
-        running_total = 0
-        total_time = sum(times)
-
-        for i in range(len(errors)):
-            delta = times[i]/total_time
-            running_total += delta
-            cum_prob.append(running_total)
+        # as sorting (error, duration) tuples: by duration, then stable by error
+        order = np.argsort(durations)
+        order = order[np.argsort(errors[order], kind='stable')]
+        errors = errors[order]
+        durations = durations[order]
+        # cumsum adds in order like the running total, so does the last element
+        total_time = np.cumsum(durations)[-1]
+        cum_prob = np.cumsum(durations / total_time)
 
     return errors, cum_prob
 
 
 
 if __name__ == "__main__":
-    vpp_data = read_vpp_file(sys.argv[1])
+    vpp_data = load_vpp_file(sys.argv[1])
 
     #time = [x['time'] for x in vpp_data]
     vec_rtt = get_time_series(vpp_data, 'vec')
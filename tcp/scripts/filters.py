@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+# Windowed filters and smoothers for RTT time series.
+#
+# Every filter exists twice: as a function over whole arrays (times in
+# seconds, ascending, and values) and as a streaming object that is fed one
+# sample at a time with update(time, value) and returns the current output.
+# Both give the same results.
+#
+#  - moving minimum / maximum over the samples of the last `window` seconds
+#    (time - window <= t <= time), with a monotonic deque: every sample is
+#    pushed and popped at most once. The array versions use a sparse table
+#    of range minima (maxima) instead, so they run without a Python loop.
+#  - adaptive_moving_minimum: the filter of analyze_vpp.moving_minimum_filter,
+#    whose window is the previous output (an RTT in ms) read as seconds.
+#  - moving median over the last `window` seconds, on a sorted buffer.
+#  - EWMA and the RFC 6298 SRTT / RTTVAR estimator.
+
+import bisect
+import collections
+import math
+
+import numpy as np
+
+##
+## Moving minimum / maximum
+##
+
+class MovingExtremum:
+    # keep = min or max
+    def __init__(self, window, keep = min):
+        self.window = window
+        self.keep = keep
+        # (time, value), values monotonic from front (the extremum) to back
+        self.buffer = collections.deque()
+        self.start = -math.inf
+
+    def update(self, time, value, window = None):
+        # window overrides the window for this sample
+        if window == None:
+            window = self.window
+        buffer = self.buffer
+        if self.keep is min:
+            while buffer and buffer[-1][1] > value:
+                buffer.pop()
+        else:
+            while buffer and buffer[-1][1] < value:
+                buffer.pop()
+        buffer.append((time, value))
+
+        # samples leave the window for good, even if a later window is longer
+        self.start = max(self.start, time - window)
+        while buffer[0][0] < self.start:
+            buffer.popleft()
+        return buffer[0][1]
+
+class MovingMinimum(MovingExtremum):
+    def __init__(self, window):
+        super().__init__(window, min)
+
+class MovingMaximum(MovingExtremum):
+    def __init__(self, window):
+        super().__init__(window, max)
+
+def _window_starts(times, window):
+    # index of the first sample of the window of every sample
+    return np.searchsorted(times, times - window, side='left')
+
+def _range_reduce(values, starts, reduce):
+    # reduce(values[starts[i]:i + 1]) for every i, with a sparse table:
+    # level k holds the reduction of the 2**k values starting at each index
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    ends = np.arange(n)
+    lengths = ends - starts + 1
+    if n == 0:
+        return values.copy()
+
+    levels = [values]
+    while 2 ** len(levels) <= lengths.max():
+        previous = levels[-1]
+        step = 2 ** (len(levels) - 1)
+        levels.append(reduce(previous[:-step], previous[step:]))
+
+    level = np.floor(np.log2(lengths)).astype(np.int64)
+    result = np.empty(n)
+    for k in np.unique(level):
+        rows = np.flatnonzero(level == k)
+        table = levels[k]
+        result[rows] = reduce(table[starts[rows]], table[ends[rows] - 2 ** k + 1])
+    return result
+
+def moving_minimum(times, values, window):
+    times = np.asarray(times, dtype=np.float64)
+    return _range_reduce(values, _window_starts(times, window), np.minimum)
+
+def moving_maximum(times, values, window):
+    times = np.asarray(times, dtype=np.float64)
+    return _range_reduce(values, _window_starts(times, window), np.maximum)
+
+def adaptive_moving_minimum(times, values):
+    # Minimum over the samples since time - previous output. As in
+    # analyze_vpp.moving_minimum_filter, samples leave the window in the
+    # order they came and do not come back if the window grows again. The
+    # output is a list.
+    times = list(times)
+    values = list(values)
+    output = [values[0]]
+
+    # indices, values[buffer] increasing; first: the oldest sample in the window
+    buffer = collections.deque([0])
+    first = 0
+    for i in range(1, len(values)):
+        value = values[i]
+        while buffer and values[buffer[-1]] > value:
+            buffer.pop()
+        buffer.append(i)
+
+        start = times[i] - output[-1]
+        while times[first] < start:
+            first += 1
+        while buffer[0] < first:
+            buffer.popleft()
+        output.append(values[buffer[0]])
+    return output
+
+##
+## Moving median
+##
+
+class MovingMedian:
+    def __init__(self, window):
+        self.window = window
+        self.samples = collections.deque()
+        self.sorted_values = list()
+
+    def update(self, time, value):
+        self.samples.append((time, value))
+        bisect.insort(self.sorted_values, value)
+
+        start = time - self.window
+        while self.samples[0][0] < start:
+            _, old_value = self.samples.popleft()
+            del self.sorted_values[bisect.bisect_left(self.sorted_values, old_value)]
+
+        n = len(self.sorted_values)
+        if n % 2:
+            return self.sorted_values[n // 2]
+        return (self.sorted_values[n // 2 - 1] + self.sorted_values[n // 2]) / 2
+
+def moving_median(times, values, window):
+    median = MovingMedian(window)
+    return np.array([median.update(time, value)
+            for time, value in zip(np.asarray(times, dtype=np.float64).tolist(),
+                    np.asarray(values, dtype=np.float64).tolist())])
+
+##
+## Exponential smoothing
+##
+
+# samples per block of the array EWMA, the weights within a block are a
+# BLOCK_SIZE x BLOCK_SIZE matrix
+BLOCK_SIZE = 64
+
+class Ewma:
+    # output = (1 - alpha) * output + alpha * value, starts at the first value
+    def __init__(self, alpha, initial = None):
+        self.alpha = alpha
+        self.value = initial
+
+    def update(self, time, value):
+        if self.value == None:
+            self.value = value
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * value
+        return self.value
+
+def ewma(values, alpha, initial = None):
+    # The recursion is solved per block of BLOCK_SIZE samples with a matrix
+    # of decay weights, only the carry between blocks is a loop.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return values.copy()
+    if initial == None:
+        initial = values[0]
+
+    size = min(BLOCK_SIZE, n)
+    decay = (1 - alpha) ** np.arange(size + 1)
+    lags = np.arange(size)[:, None] - np.arange(size)[None, :]
+    weights = np.where(lags >= 0, alpha * decay[np.maximum(lags, 0)], 0.0)
+
+    blocks = -(-n // size)
+    padded = np.zeros(blocks * size)
+    padded[:n] = values
+    output = padded.reshape(blocks, size) @ weights.T
+
+    carry = initial
+    for block in output:
+        block += decay[1:] * carry
+        carry = block[-1]
+    return output.reshape(-1)[:n]
+
+class Rfc6298Estimator:
+    # SRTT and RTTVAR of RFC 6298, section 2
+    def __init__(self, alpha = 1 / 8, beta = 1 / 4):
+        self.alpha = alpha
+        self.beta = beta
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, time, value):
+        if self.srtt == None:
+            self.srtt = value
+            self.rttvar = value / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - value)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * value
+        return self.srtt
+
+def rfc6298(values, alpha = 1 / 8, beta = 1 / 4):
+    # (srtt, rttvar) after each sample. RTTVAR uses the SRTT before the
+    # update, so both are EWMAs computed one after the other.
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values.copy(), values.copy()
+    srtt = ewma(values, alpha)
+    deviations = np.abs(srtt[:-1] - values[1:])
+    rttvar = np.concatenate(([values[0] / 2],
+            ewma(deviations, beta, values[0] / 2)))
+    return srtt, rttvar
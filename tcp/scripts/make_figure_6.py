@@ -2,18 +2,18 @@
 
 # This script generates Figure 6 from the paper.
 # call as: $ scripts/make_figure_6.py data/ pickle_cache/ plots/
-# The pickle dir is used to store partially processed data structures,
+# The cache dir is used to store partially processed data (see vpp_cache.py),
 # so the data does not have to be read from the csv files every time the script runs.
 
 import os
 import sys
-import pickle
 
 import matplotlib.pyplot as plt
 from matplotlib.markers import *
 
 
 import analyze_vpp
+import vpp_cache
 
 import numpy as np
 
@@ -76,7 +76,7 @@ color_rules = (
                )
 
 base_dir = sys.argv[1]
-pickle_dir = sys.argv[2]
+cache_dir = sys.argv[2]
 out_dir = sys.argv[3]
 plt.figure()
 
@@ -103,31 +103,7 @@ for data_dir in data_dirs:
         #     continue
 
         print(data_file, end='')
-        pickle_file_name = "{}__{}.pickle".format(data_dir, data_file)
-        pickle_file_path = pickle_dir + '/' + pickle_file_name
-
-        from_csv = False
-        try:
-            pickle_file = open(pickle_file_path, 'rb')
-        except FileNotFoundError:
-            from_csv = True
-        else:
-            print(" from pickle.")
-            data_set.append(pickle.load(pickle_file))
-            pickle_file.close()
-
-        if from_csv:
-            print(" from csv")
-            vpp_data = analyze_vpp.read_vpp_file(base_dir + '/' + data_dir + '/' + data_file)
-            #analyze_vpp.hack_moving_min_into_vpp_data(vpp_data, 'all_ts')
-            x, y = analyze_vpp.make_ecdf_data(vpp_data, 'all_ts', 'vec', True, True)
-            #x_smooth, y_smooth = analyze_vpp.make_ecdf_data(vpp_data, 'all_ts_smooth', 'vec', True, True)
-
-            data_entry = (data_dir, data_file, vpp_data, x, y)
-            data_set.append(data_entry)
-            pickle_file = open(pickle_file_path, 'wb')
-            pickle.dump(data_entry, pickle_file)
-            pickle_file.close()
+        data_set.append(vpp_cache.data_entry(base_dir, data_dir, data_file, cache_dir))
 
 print("I have {} data_entires.".format(len(data_set)))
 print("moving on to plotting")
@@ -161,15 +137,20 @@ for data_entry in data_set:
 
     if "vpp_data" in data_entry[1]:
         do_values_vec.append(number_of_estimates_vec / number_of_rtts)
-        errors_do.extend(errors)
+        errors_do.append(errors)
 
     if "wired" in data_entry[1]:
         wired_values_vec.append(number_of_estimates_vec / number_of_rtts)
-        errors_wired.extend(errors)
+        errors_wired.append(errors)
 
     if "wifi" in data_entry[1]:
         wifi_values_vec.append(number_of_estimates_vec / number_of_rtts)
-        errors_wifi.extend(errors)
+        errors_wifi.append(errors)
+
+# the ECDF errors are arrays, concatenated once per group
+errors_do = np.concatenate([np.empty(0)] + errors_do)
+errors_wired = np.concatenate([np.empty(0)] + errors_wired)
+errors_wifi = np.concatenate([np.empty(0)] + errors_wifi)
 
 
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Equivalence tests of filters.py against naive reference loops.
+# Run with: python -m pytest tcp/scripts
+
+import collections
+
+import numpy as np
+import pytest
+
+import filters
+
+def random_series(seed, n = 1000):
+    # times with repeated values, as in the vpp files
+    random = np.random.default_rng(seed)
+    times = np.round(np.cumsum(random.exponential(0.02, n)), 2)
+    values = random.uniform(20, 80, n)
+    return times, values
+
+def naive_moving(times, values, window, reduce):
+    # the samples up to i with time >= times[i] - window
+    return np.array([reduce(values[:i + 1][times[:i + 1] >= times[i] - window])
+                     for i in range(len(times))])
+
+def naive_moving_minimum_filter(time_in, rtt_in):
+    # analyze_vpp.moving_minimum_filter before filters.py
+    rtt_out = list()
+    rtt_out.append(rtt_in[0])
+    time_buffer = collections.deque()
+    rtt_buffer = collections.deque()
+    rtt_buffer.append(rtt_in[0])
+    time_buffer.append(time_in[0])
+    cursor = 1
+    while cursor < len(rtt_in):
+        rtt_buffer.append(rtt_in[cursor])
+        time_buffer.append(time_in[cursor])
+        start_of_window = time_in[cursor] - rtt_out[-1]
+        while time_buffer[0] < start_of_window:
+            time_buffer.popleft()
+            rtt_buffer.popleft()
+        rtt_out.append(min(rtt_buffer))
+        cursor += 1
+    return rtt_out
+
+def naive_ewma(values, alpha, initial):
+    output = list()
+    value = initial
+    for x in values:
+        value = (1 - alpha) * value + alpha * x
+        output.append(value)
+    return np.array(output)
+
+##
+## Moving minimum / maximum
+##
+
+@pytest.mark.parametrize("window", [0, 0.01, 0.1, 1, 100])
+def test_moving_extremum(window):
+    times, values = random_series(1)
+    for keep, reduce, array_filter in ((min, np.min, filters.moving_minimum),
+                                       (max, np.max, filters.moving_maximum)):
+        expected = naive_moving(times, values, window, reduce)
+        extremum = filters.MovingExtremum(window, keep)
+        streamed = [extremum.update(time, value) for time, value in zip(times, values)]
+        assert np.array_equal(streamed, expected)
+        assert np.array_equal(array_filter(times, values, window), expected)
+
+def test_moving_extremum_short():
+    for n in range(1, 20):
+        times, values = random_series(n, n)
+        assert np.array_equal(filters.moving_minimum(times, values, 0.05),
+                              naive_moving(times, values, 0.05, np.min))
+
+def test_adaptive_moving_minimum():
+    for seed in range(3):
+        times, values = random_series(seed, 3000)
+        # RTTs in ms, read as seconds by the filter
+        values = values / 100
+        assert filters.adaptive_moving_minimum(times, values) == \
+            naive_moving_minimum_filter(times.tolist(), values.tolist())
+
+def test_moving_median():
+    times, values = random_series(2)
+    expected = naive_moving(times, values, 0.5, np.median)
+    assert np.allclose(filters.moving_median(times, values, 0.5), expected, rtol=0, atol=1e-12)
+
+##
+## Exponential smoothing
+##
+
+@pytest.mark.parametrize("n", [1, 2, filters.BLOCK_SIZE - 1, filters.BLOCK_SIZE,
+                               filters.BLOCK_SIZE + 1, 1000])
+def test_ewma(n):
+    _, values = random_series(3, n)
+    for alpha, initial in ((1 / 8, None), (0.5, 30.0), (1, None)):
+        start = values[0] if initial == None else initial
+        expected = naive_ewma(values, alpha, start)
+        assert np.allclose(filters.ewma(values, alpha, initial), expected, rtol=1e-12, atol=0)
+
+        smoother = filters.Ewma(alpha, initial)
+        streamed = [smoother.update(None, value) for value in values]
+        assert np.allclose(streamed, expected, rtol=1e-12, atol=0)
+
+def test_rfc6298():
+    _, values = random_series(4)
+    # RFC 6298, section 2.2 and 2.3
+    alpha, beta = 1 / 8, 1 / 4
+    srtt, rttvar = values[0], values[0] / 2
+    expected = [(srtt, rttvar)]
+    for value in values[1:]:
+        rttvar = (1 - beta) * rttvar + beta * abs(srtt - value)
+        srtt = (1 - alpha) * srtt + alpha * value
+        expected.append((srtt, rttvar))
+    expected = np.array(expected)
+
+    srtt, rttvar = filters.rfc6298(values)
+    assert np.allclose(srtt, expected[:, 0], rtol=1e-12, atol=0)
+    assert np.allclose(rttvar, expected[:, 1], rtol=1e-12, atol=0)
+
+    estimator = filters.Rfc6298Estimator()
+    streamed = list()
+    for value in values:
+        estimator.update(None, value)
+        streamed.append((estimator.srtt, estimator.rttvar))
+    assert np.array_equal(streamed, expected)
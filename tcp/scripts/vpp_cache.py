@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# On disk cache of the processed vpp csv files, shared by the figure scripts.
+#
+# An entry holds what the scripts compute for every file: the columns of
+# the VppRecord (with the smoothed series added by add_filtered_series) and
+# the time-weighted ECDF of the error between two analyzers. It is stored as
+# an uncompressed npz file <cache dir>/<data dir>__<data file>.<key>.npz.
+#
+# The key is a hash of SCHEMA_VERSION, the processing parameters, the source
+# code of the functions in PROCESSING_FUNCTIONS and a fingerprint of the csv
+# file: its size, modification time and a hash of its first and last
+# FINGERPRINT_BYTES bytes. Changing any of these gives a new key, the entry
+# is then built again and replaces the stale one.
+#
+# Bump SCHEMA_VERSION whenever the layout of an entry changes.
+
+import hashlib
+import inspect
+import json
+import os
+import os.path
+import tempfile
+
+import numpy as np
+
+import analyze_vpp
+import filters
+
+SCHEMA_VERSION = 1
+FINGERPRINT_BYTES = 1024 * 1024
+
+# Everything an entry is computed with
+PROCESSING_FUNCTIONS = (
+    analyze_vpp.load_vpp_file,
+    analyze_vpp.get_time_series,
+    analyze_vpp.moving_minimum_filter,
+    filters.adaptive_moving_minimum,
+    analyze_vpp.derived_series_columns,
+    analyze_vpp.add_derived_series,
+    analyze_vpp.add_filtered_series,
+    analyze_vpp.make_ecdf_data,
+    analyze_vpp.ecdf_from_columns,
+)
+
+# The processing of the figure scripts
+DEFAULT_PARAMETERS = {
+    'filtered': 'all_ts',
+    'ecdf': ('all_ts', 'vec'),
+    'weighted': True,
+    'relative': True,
+}
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        digest.update(input_file.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            input_file.seek(max(FINGERPRINT_BYTES, stat.st_size - FINGERPRINT_BYTES))
+            digest.update(input_file.read(FINGERPRINT_BYTES))
+    return [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+
+def functions_version(functions = PROCESSING_FUNCTIONS):
+    digest = hashlib.sha1()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+def cache_key(csv_path, parameters = DEFAULT_PARAMETERS):
+    description = {
+        'schema': SCHEMA_VERSION,
+        'functions': functions_version(),
+        'parameters': parameters,
+        'input': file_fingerprint(csv_path),
+    }
+    encoded = json.dumps(description, sort_keys=True).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+def entry_prefix(data_dir, data_file):
+    return "{}__{}.".format(data_dir, data_file)
+
+##
+## Entries
+##
+
+def process_file(csv_path, parameters = DEFAULT_PARAMETERS):
+    # (record, x, y) as computed by the figure scripts
+    record = analyze_vpp.load_vpp_file(csv_path)
+    analyze_vpp.add_filtered_series(record, parameters['filtered'])
+    analyzerA, analyzerB = parameters['ecdf']
+    x, y = analyze_vpp.make_ecdf_data(record, analyzerA, analyzerB,
+                                      parameters['weighted'], parameters['relative'])
+    return record, x, y
+
+def load(path):
+    # (record, x, y) or None if there is no readable entry
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            columns = {name[len('column.'):]: arrays[name]
+                       for name in arrays.files if name.startswith('column.')}
+            record = analyze_vpp.VppRecord(columns, arrays['hosts'].tolist())
+            if 'ecdf_x' in arrays.files:
+                x, y = arrays['ecdf_x'], arrays['ecdf_y']
+            else:
+                x, y = None, None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as error:
+        print("\tIgnoring unreadable cache file {}: {}".format(path, error))
+        return None
+    return record, x, y
+
+def store(path, record, x, y):
+    arrays = {'column.' + name: column for name, column in record.columns.items()}
+    arrays['hosts'] = np.array(record.hosts, dtype=str)
+    if x is not None:
+        arrays['ecdf_x'] = x
+        arrays['ecdf_y'] = y
+
+    # write to a temporary file first, readers never see a partial file
+    cache_dir = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            np.savez(tmp_file, **arrays)
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+def data_entry(base_dir, data_dir, data_file, cache_dir, parameters = DEFAULT_PARAMETERS):
+    # (data_dir, data_file, record, x, y), from the cache if possible
+    csv_path = os.path.join(base_dir, data_dir, data_file)
+    prefix = entry_prefix(data_dir, data_file)
+    path = os.path.join(cache_dir, prefix + cache_key(csv_path, parameters) + ".npz")
+
+    entry = load(path)
+    if entry != None:
+        print(" from cache.")
+        return (data_dir, data_file) + entry
+
+    print(" from csv")
+    entry = process_file(csv_path, parameters)
+    os.makedirs(cache_dir, exist_ok=True)
+    store(path, *entry)
+
+    # entries of this file with other keys are stale
+    for name in os.listdir(cache_dir):
+        if not name.startswith(prefix) or not name.endswith(".npz") or name == os.path.basename(path):
+            continue
+        # only <prefix><key>.npz, not the entries of files named <data file>.*
+        if '.' not in name[len(prefix):-len(".npz")]:
+            os.unlink(os.path.join(cache_dir, name))
+    return (data_dir, data_file) + entry
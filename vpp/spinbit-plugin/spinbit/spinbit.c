@@ -421,14 +421,20 @@ void update_quic_rtt_estimate(vlib_main_t * vm, quic_observer_t * session,
             now, src_port, init_src_port, spin);
   
   /* Now it is time to print the rtt estimates to a file */
-  /* If this is the first time we run, print CSV file header */
-  if (pkt_count == 1){
+  /* If this is the first time we run, print CSV file header.
+   * All flows share the file and rows carry the flow number, so the header
+   * is printed once. Earlier versions had no flow column and printed the
+   * header again for every new flow, the scripts skip such repeats. */
+  static bool header_printed = false;
+  if (!header_printed){
     spinbit_printf(0, "%s,%s,%s", "time", "pn", "host");
     spinbit_printf(0, ",%s,%s", "basic_data", "basic_new");
     spinbit_printf(0, ",%s,%s", "pn_data", "pn_new");
     spinbit_printf(0, ",%s,%s", "status_data", "status_new");
     spinbit_printf(0, ",%s,%s", "rel_heur_data", "rel_heur_new");
+    spinbit_printf(0, ",%s", "flow");
     spinbit_printf(0, "\n");
+    header_printed = true;
   }
 
   /* If at least one update */
@@ -446,6 +452,7 @@ void update_quic_rtt_estimate(vlib_main_t * vm, quic_observer_t * session,
       spinbit_printf(0, ",%.*lf,%d",
             session->dyna_heur_spin_observer.rtt_server[session->dyna_heur_spin_observer.index_server],
             RTT_PRECISION, session->dyna_heur_spin_observer.new_server);
+      spinbit_printf(0, ",%u", session->flow);
       spinbit_printf(1, "\n");
 
       session->basic_spin_observer.new_server = false;
@@ -465,6 +472,7 @@ void update_quic_rtt_estimate(vlib_main_t * vm, quic_observer_t * session,
       spinbit_printf(0, ",%.*lf,%d",
             session->dyna_heur_spin_observer.rtt_client[session->dyna_heur_spin_observer.index_client],
             RTT_PRECISION, session->dyna_heur_spin_observer.new_client);
+      spinbit_printf(0, ",%u", session->flow);
       spinbit_printf(1, "\n");
 
       session->basic_spin_observer.new_client = false;
@@ -917,6 +925,8 @@ u32 create_session(bool is_tcp) {
     session->is_tcp = false;
     vec_alloc(session->quic, 1);
     memset(session->quic, 0, sizeof (quic_observer_t));
+    /* TCP sessions are not counted, QUIC flow numbers have no gaps */
+    session->quic->flow = pm->total_quic_flows ++;
     session->quic->basic_spin_observer.spin_client = SPIN_NOT_KNOWN;
     session->quic->basic_spin_observer.spin_server = SPIN_NOT_KNOWN;
     session->quic->pn_spin_observer.spin_client = SPIN_NOT_KNOWN;
@@ -1140,6 +1150,7 @@ static clib_error_t * spinbit_init (vlib_main_t * vm)
   /* Set counters to zero*/
   pm->total_flows = 0;
   pm->active_flows = 0;
+  pm->total_quic_flows = 0;
 
   vec_free(name);
 
@@ -171,6 +171,9 @@ typedef struct {
 
 typedef struct {
   u64 id;
+
+  /* Flow number, QUIC sessions in the order they were created (CSV flow column) */
+  u32 flow;
   
   // currently no handshake rtt
 
@@ -265,6 +268,8 @@ typedef struct {
   /* Counter values*/
   u32 total_flows;
   u32 active_flows;
+  /* QUIC sessions created so far, numbers the QUIC flows (CSV flow column) */
+  u32 total_quic_flows;
   u32 active_tcp;
   u32 active_quic;
 